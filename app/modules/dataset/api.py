@@ -1,4 +1,7 @@
+from functools import partial
+
 from app.modules.dataset.models import DataSet
+from app.modules.dataset.repositories import dataset_loading_profile
 from core.resources.generic_resource import create_resource
 from core.serialisers.serializer import Serializer
 
@@ -19,7 +22,7 @@ dataset_fields = {
 
 dataset_serializer = Serializer(dataset_fields, related_serializers={'files': file_serializer})
 
-DataSetResource = create_resource(DataSet, dataset_serializer)
+DataSetResource = create_resource(DataSet, dataset_serializer, partial(dataset_loading_profile, 'listing'))
 
 
 def init_blueprint_api(api):
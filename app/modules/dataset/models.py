@@ -1,8 +1,10 @@
+import re
 from datetime import datetime
 from enum import Enum
 
-from flask import request
-from sqlalchemy import Enum as SQLAlchemyEnum
+from sqlalchemy import Enum as SQLAlchemyEnum, event
+from sqlalchemy.orm import Session
+from unidecode import unidecode
 
 from app import db
 
@@ -29,6 +31,74 @@ class PublicationType(Enum):
     OTHER = 'other'
 
 
+def split_tags(tags: str) -> list:
+    """Splits a comma-separated tags string into normalized (stripped, lowercase, unique) tag names."""
+    names = []
+    for tag in (tags or "").split(','):
+        name = tag.strip().lower()[:120]
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+class Tag(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True, index=True)
+
+    def __repr__(self):
+        return f'Tag<{self.name}>'
+
+
+ds_meta_data_tag = db.Table(
+    'ds_meta_data_tag',
+    db.Column('ds_meta_data_id', db.Integer, db.ForeignKey('ds_meta_data.id'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True, index=True),
+)
+
+
+class TaggedMixin:
+    """
+    Metadata with a comma-separated `tags` column mirrored in a `normalized_tags` many-to-many
+    relationship, which is kept in sync on every flush (see sync_normalized_tags).
+    """
+
+    def get_tag_names(self) -> list:
+        return split_tags(self.tags)
+
+
+def name_tokens(name: str) -> list:
+    """Accent- and case-folded tokens of a name: "Muñoz, José" -> ["munoz", "jose"]."""
+    return re.sub(r'[^a-z0-9]+', ' ', unidecode(name or "").lower()).split()
+
+
+def fold_name(name: str) -> str:
+    """Order-independent folded name, so "Muñoz, José" and "Jose Munoz" fold to the same key."""
+    return ' '.join(sorted(name_tokens(name)))[:255]
+
+
+def normalize_orcid(orcid: str) -> str:
+    orcid = re.sub(r'^https?://orcid\.org/', '', (orcid or "").strip(), flags=re.IGNORECASE)
+    return orcid.upper()[:120] or None
+
+
+class AuthorIdentity(db.Model):
+    """A person, linking all the Author rows (one per dataset or feature model) that belong to them."""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False)
+    folded_name = db.Column(db.String(255), nullable=False, index=True)
+    orcid = db.Column(db.String(120), unique=True, index=True)
+    tokens = db.relationship('AuthorToken', backref='identity', lazy=True, cascade="all, delete")
+    authors = db.relationship('Author', backref='identity', lazy='dynamic')
+
+    def __repr__(self):
+        return f'AuthorIdentity<{self.id}, {self.name}, orcid={self.orcid}>'
+
+
+class AuthorToken(db.Model):
+    identity_id = db.Column(db.Integer, db.ForeignKey('author_identity.id'), primary_key=True)
+    token = db.Column(db.String(120), primary_key=True, index=True)
+
+
 class Author(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
@@ -36,6 +106,7 @@ class Author(db.Model):
     orcid = db.Column(db.String(120))
     ds_meta_data_id = db.Column(db.Integer, db.ForeignKey('ds_meta_data.id'))
     fm_meta_data_id = db.Column(db.Integer, db.ForeignKey('fm_meta_data.id'))
+    identity_id = db.Column(db.Integer, db.ForeignKey('author_identity.id'), index=True)
 
     def to_dict(self):
         return {
@@ -46,15 +117,23 @@ class Author(db.Model):
 
 
 class DSMetrics(db.Model):
+    """
+    Roll-up of the metrics of the dataset's feature models. `configurations` is their sum, unknown (None) if
+    any model could not be counted.
+    """
     id = db.Column(db.Integer, primary_key=True)
-    number_of_models = db.Column(db.String(120))
-    number_of_features = db.Column(db.String(120))
+    number_of_models = db.Column(db.Integer, index=True)
+    number_of_features = db.Column(db.Integer, index=True)
+    cross_tree_constraints = db.Column(db.Integer, index=True)
+    max_depth = db.Column(db.Integer, index=True)
+    configurations = db.Column(db.Float, index=True)
+    analysed_at = db.Column(db.DateTime)
 
     def __repr__(self):
         return f'DSMetrics<models={self.number_of_models}, features={self.number_of_features}>'
 
 
-class DSMetaData(db.Model):
+class DSMetaData(db.Model, TaggedMixin):
     id = db.Column(db.Integer, primary_key=True)
     deposition_id = db.Column(db.Integer)
     title = db.Column(db.String(120), nullable=False)
@@ -66,6 +145,8 @@ class DSMetaData(db.Model):
     ds_metrics_id = db.Column(db.Integer, db.ForeignKey('ds_metrics.id'))
     ds_metrics = db.relationship('DSMetrics', uselist=False, backref='ds_meta_data', cascade="all, delete")
     authors = db.relationship('Author', backref='ds_meta_data', lazy=True, cascade="all, delete")
+    normalized_tags = db.relationship('Tag', secondary=ds_meta_data_tag, lazy=True,
+                                      backref=db.backref('ds_meta_data', lazy='dynamic'))
 
 
 class DataSet(db.Model):
@@ -119,29 +200,12 @@ class DataSet(db.Model):
         return SizeService().get_human_readable_size(self.get_file_total_size())
 
     def get_uvlhub_doi(self):
-        from app.modules.dataset.services import DataSetService
-        return DataSetService().get_uvlhub_doi(self)
+        from app.modules.dataset.services import uvlhub_doi_url
+        return uvlhub_doi_url(self.ds_meta_data.dataset_doi)
 
     def to_dict(self):
-        return {
-            'title': self.ds_meta_data.title,
-            'id': self.id,
-            'created_at': self.created_at,
-            'created_at_timestamp': int(self.created_at.timestamp()),
-            'description': self.ds_meta_data.description,
-            'authors': [author.to_dict() for author in self.ds_meta_data.authors],
-            'publication_type': self.get_cleaned_publication_type(),
-            'publication_doi': self.ds_meta_data.publication_doi,
-            'dataset_doi': self.ds_meta_data.dataset_doi,
-            'tags': self.ds_meta_data.tags.split(",") if self.ds_meta_data.tags else [],
-            'url': self.get_uvlhub_doi(),
-            'download': f'{request.host_url.rstrip("/")}/dataset/download/{self.id}',
-            'zenodo': self.get_fakenodo_url(),
-            'files': [file.to_dict() for fm in self.feature_models for file in fm.files],
-            'files_count': self.get_files_count(),
-            'total_size_in_bytes': self.get_file_total_size(),
-            'total_size_in_human_format': self.get_file_total_size_for_human(),
-        }
+        from app.modules.dataset.services import DataSetSerializer
+        return DataSetSerializer().serialize(self)
 
     def __repr__(self):
         return f'DataSet<{self.id}>'
@@ -192,3 +256,109 @@ class Rating(db.Model):
         self.user_id = user_id
         self.dataset_id = dataset_id
         self.rating = rating
+
+
+class DataSetVector(db.Model):
+    """TF-IDF vector of the text of a dataset, msgpack-encoded as {term: weight}."""
+    data_set_id = db.Column(db.Integer, db.ForeignKey('data_set.id'), primary_key=True)
+    vector = db.Column(db.LargeBinary, nullable=False)
+
+
+class DataSetVectorTerm(db.Model):
+    """Terms of a stored vector, keyed by term to find the datasets that share a term with another one."""
+    term = db.Column(db.String(120), primary_key=True)
+    data_set_id = db.Column(db.Integer, db.ForeignKey('data_set.id'), primary_key=True)
+
+
+class TfidfTerm(db.Model):
+    """Number of datasets whose text contains a term, from which the TF-IDF weights are derived."""
+    term = db.Column(db.String(120), primary_key=True)
+    document_frequency = db.Column(db.Integer, nullable=False)
+
+
+class DataSetNeighbour(db.Model):
+    """Precomputed most similar datasets of a dataset, by rank, so the view page needs a single lookup."""
+    data_set_id = db.Column(db.Integer, db.ForeignKey('data_set.id'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    neighbour_id = db.Column(db.Integer, db.ForeignKey('data_set.id'), nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)
+
+
+class CoDownload(db.Model):
+    """
+    Number of downloaders (users, or cookies for anonymous downloads) who downloaded both datasets: the
+    non-zero entries of a sparse co-occurrence matrix, one row per ordered pair.
+    """
+    data_set_id = db.Column(db.Integer, db.ForeignKey('data_set.id'), primary_key=True)
+    other_id = db.Column(db.Integer, db.ForeignKey('data_set.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (db.Index('ix_co_download_data_set_id_count', 'data_set_id', 'count'),)
+
+
+class RecordCursor(db.Model):
+    """Id of the last record processed by an incremental batch job."""
+    name = db.Column(db.String(64), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+
+
+@event.listens_for(Session, 'before_flush')
+def sync_normalized_tags(session, flush_context, instances):
+    """Mirrors the `tags` string of new or modified tagged metadata in its normalized tags."""
+    tags_by_name = {}
+    with session.no_autoflush:
+        for instance in list(session.new) + list(session.dirty):
+            if not isinstance(instance, TaggedMixin):
+                continue
+            if instance not in session.new and not db.inspect(instance).attrs.tags.history.has_changes():
+                continue
+
+            names = instance.get_tag_names()
+            missing = [name for name in names if name not in tags_by_name]
+            if missing:
+                for tag in session.query(Tag).filter(Tag.name.in_(missing)).all():
+                    tags_by_name[tag.name] = tag
+            for name in names:
+                if name not in tags_by_name:
+                    tags_by_name[name] = Tag(name=name)
+                    session.add(tags_by_name[name])
+            instance.normalized_tags = [tags_by_name[name] for name in names]
+
+
+@event.listens_for(Session, 'before_flush')
+def link_author_identities(session, flush_context, instances):
+    """
+    Links new or renamed authors to the identity of the person: the one with the same ORCID if they
+    have one, otherwise the one without ORCID with the same folded name.
+    """
+    identities = {}
+    with session.no_autoflush:
+        for instance in list(session.new) + list(session.dirty):
+            if not isinstance(instance, Author):
+                continue
+            state = db.inspect(instance)
+            if (instance not in session.new and instance.identity_id is not None
+                    and not state.attrs.name.history.has_changes() and not state.attrs.orcid.history.has_changes()):
+                continue
+
+            orcid = normalize_orcid(instance.orcid)
+            folded_name = fold_name(instance.name)
+            key = ('orcid', orcid) if orcid else ('name', folded_name)
+
+            if key not in identities:
+                query = session.query(AuthorIdentity)
+                if orcid:
+                    identity = query.filter_by(orcid=orcid).first()
+                else:
+                    identity = query.filter_by(folded_name=folded_name, orcid=None).order_by(AuthorIdentity.id).first()
+                if identity is None:
+                    identity = AuthorIdentity(name=instance.name[:120], folded_name=folded_name, orcid=orcid)
+                    session.add(identity)
+                identities[key] = identity
+
+            identity = identities[key]
+            # The same person may sign with different spellings: every spelling is searchable
+            known_tokens = {author_token.token for author_token in identity.tokens}
+            for token in sorted({token[:120] for token in name_tokens(instance.name)} - known_tokens):
+                identity.tokens.append(AuthorToken(token=token))
+            instance.identity = identity
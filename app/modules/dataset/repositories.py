@@ -3,26 +3,109 @@ import logging
 from flask_login import current_user
 from typing import Optional
 
-from sqlalchemy import desc, func
+from sqlalchemy import and_, desc, func, or_
+from sqlalchemy.orm import selectinload
 
 from app.modules.dataset.models import (
     Author,
+    AuthorIdentity,
+    AuthorToken,
+    CoDownload,
     DOIMapping,
     DSDownloadRecord,
     DSMetaData,
     DSViewRecord,
-    DataSet
+    DataSet,
+    DataSetNeighbour,
+    DataSetVector,
+    DataSetVectorTerm,
+    RecordCursor,
+    Tag,
+    TfidfTerm,
+    ds_meta_data_tag,
+    name_tokens,
+    normalize_orcid
 )
+from app.modules.featuremodel.models import FMMetaData, FeatureModel
+from app.modules.hubfile.models import Hubfile
 from core.repositories.BaseRepository import BaseRepository
 
 logger = logging.getLogger(__name__)
 
 
+def dataset_loading_profile(profile: str) -> list:
+    """
+    Returns the loader options of a named dataset loading profile.
+
+    - "metadata": the dataset metadata only (titles, DOIs, publication type).
+    - "listing": metadata, authors and files, everything needed by DataSet.to_dict().
+    - "detail": listing plus the metadata and authors of every feature model.
+
+    Every relationship is loaded with a fixed number of SELECT ... IN queries, so the number of
+    statements does not grow with the number of datasets.
+    """
+    metadata = [selectinload(DataSet.ds_meta_data)]
+    listing = metadata + [
+        selectinload(DataSet.ds_meta_data).selectinload(DSMetaData.authors),
+        selectinload(DataSet.feature_models).selectinload(FeatureModel.files),
+    ]
+    detail = listing + [
+        selectinload(DataSet.feature_models).selectinload(FeatureModel.fm_meta_data)
+        .selectinload(FMMetaData.authors),
+    ]
+
+    profiles = {
+        'metadata': metadata,
+        'listing': listing,
+        'detail': detail,
+    }
+    if profile not in profiles:
+        raise ValueError(f"Unknown dataset loading profile: {profile}")
+    return profiles[profile]
+
+
 class AuthorRepository(BaseRepository):
     def __init__(self):
         super().__init__(Author)
 
 
+class AuthorIdentityRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(AuthorIdentity)
+
+    def get_by_orcid(self, orcid: str) -> Optional[AuthorIdentity]:
+        return self.model.query.filter_by(orcid=normalize_orcid(orcid)).first()
+
+    def identity_ids_matching(self, name: str):
+        """
+        Subquery of the ids of the people whose folded name tokens start with every token of `name`,
+        so "munoz" finds "Muñoz, José" and "jo mu" too. Every token is an indexed prefix lookup.
+        """
+        query = self.session.query(AuthorIdentity.id)
+        for token in name_tokens(name):
+            query = query.filter(AuthorIdentity.id.in_(
+                self.session.query(AuthorToken.identity_id).filter(AuthorToken.token.startswith(token, autoescape=True))
+            ))
+        return query
+
+    def ds_meta_data_ids_by_identities(self, identity_ids):
+        return self.session.query(Author.ds_meta_data_id).filter(Author.identity_id.in_(identity_ids))
+
+    def dataset_ids_by_identity(self, identity_id: int):
+        """Datasets authored by the person, either as dataset author or as author of one of its models."""
+        as_dataset_author = (
+            self.session.query(DataSet.id)
+            .join(Author, Author.ds_meta_data_id == DataSet.ds_meta_data_id)
+            .filter(Author.identity_id == identity_id)
+        )
+        as_model_author = (
+            self.session.query(FeatureModel.data_set_id)
+            .join(Author, Author.fm_meta_data_id == FeatureModel.fm_meta_data_id)
+            .filter(Author.identity_id == identity_id)
+        )
+        return as_dataset_author.union(as_model_author)
+
+
 class DSDownloadRecordRepository(BaseRepository):
     def __init__(self):
         super().__init__(DSDownloadRecord)
@@ -31,6 +114,32 @@ class DSDownloadRecordRepository(BaseRepository):
         max_id = self.model.query.with_entities(func.max(self.model.id)).scalar()
         return max_id if max_id is not None else 0
 
+    def get_after(self, last_id: int, limit: int) -> list:
+        """(id, user_id, download_cookie, dataset_id) of the next records after `last_id`."""
+        return (
+            self.session.query(self.model.id, self.model.user_id, self.model.download_cookie, self.model.dataset_id)
+            .filter(self.model.id > last_id, self.model.dataset_id.isnot(None))
+            .order_by(self.model.id)
+            .limit(limit)
+            .all()
+        )
+
+    def get_by_downloaders(self, user_ids, cookies, max_id: int) -> list:
+        """Records up to `max_id` of the given users, or of the given cookies for anonymous downloads."""
+        return (
+            self.session.query(self.model.id, self.model.user_id, self.model.download_cookie, self.model.dataset_id)
+            .filter(
+                self.model.id <= max_id,
+                self.model.dataset_id.isnot(None),
+                or_(
+                    self.model.user_id.in_(list(user_ids)),
+                    and_(self.model.user_id.is_(None), self.model.download_cookie.in_(list(cookies))),
+                ),
+            )
+            .order_by(self.model.id)
+            .all()
+        )
+
 
 class DSMetaDataRepository(BaseRepository):
     def __init__(self):
@@ -68,9 +177,12 @@ class DataSetRepository(BaseRepository):
     def __init__(self):
         super().__init__(DataSet)
 
+    def query_with_profile(self, profile: str):
+        return self.model.query.options(*dataset_loading_profile(profile))
+
     def get_synchronized(self, current_user_id: int) -> DataSet:
         return (
-            self.model.query.join(DSMetaData)
+            self.query_with_profile('metadata').join(DSMetaData)
             .filter(DataSet.user_id == current_user_id, DSMetaData.dataset_doi.isnot(None))
             .order_by(self.model.created_at.desc())
             .all()
@@ -78,7 +190,7 @@ class DataSetRepository(BaseRepository):
 
     def get_unsynchronized(self, current_user_id: int) -> DataSet:
         return (
-            self.model.query.join(DSMetaData)
+            self.query_with_profile('metadata').join(DSMetaData)
             .filter(DataSet.user_id == current_user_id, DSMetaData.dataset_doi.is_(None))
             .order_by(self.model.created_at.desc())
             .all()
@@ -91,6 +203,14 @@ class DataSetRepository(BaseRepository):
             .first()
         )
 
+    def get_by_author_identity(self, identity_id: int) -> list:
+        return (
+            self.query_with_profile('listing')
+            .filter(DataSet.id.in_(AuthorIdentityRepository().dataset_ids_by_identity(identity_id)))
+            .order_by(self.model.created_at.desc())
+            .all()
+        )
+
     def count_synchronized_datasets(self):
         return (
             self.model.query.join(DSMetaData)
@@ -107,13 +227,17 @@ class DataSetRepository(BaseRepository):
 
     def latest_synchronized(self):
         return (
-            self.model.query.join(DSMetaData)
+            self.query_with_profile('listing').join(DSMetaData)
             .filter(DSMetaData.dataset_doi.isnot(None))
             .order_by(desc(self.model.id))
             .limit(5)
             .all()
         )
 
+    def get_catalogue_version(self) -> tuple:
+        """(number of datasets, last dataset id), which changes whenever a dataset is added or deleted."""
+        return self.session.query(func.count(DataSet.id), func.max(DataSet.id)).one()
+
     def download_all_datasets(self):
         try:
 
@@ -125,6 +249,184 @@ class DataSetRepository(BaseRepository):
             return []
 
 
+class DataSetVectorRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(DataSetVector)
+
+    def get_documents(self, dataset_ids=None) -> list:
+        """Datasets with the metadata and the indexed feature names their vectors are computed from."""
+        query = DataSet.query.options(
+            selectinload(DataSet.ds_meta_data),
+            selectinload(DataSet.feature_models).selectinload(FeatureModel.files).selectinload(Hubfile.feature_names),
+        )
+        if dataset_ids is not None:
+            query = query.filter(DataSet.id.in_(dataset_ids))
+        return query.order_by(DataSet.id).all()
+
+    def get_sharing_terms(self, terms, exclude_id: int = None) -> list:
+        """Vectors of the datasets with at least one of `terms`, found through the (term, data_set_id) key."""
+        if not terms:
+            return []
+        dataset_ids = (
+            self.session.query(DataSetVectorTerm.data_set_id)
+            .filter(DataSetVectorTerm.term.in_(list(terms)), DataSetVectorTerm.data_set_id != exclude_id)
+            .distinct()
+        )
+        return (
+            self.model.query.filter(DataSetVector.data_set_id.in_(dataset_ids.scalar_subquery()))
+            .order_by(DataSetVector.data_set_id)
+            .all()
+        )
+
+    def replace_terms(self, dataset_id: int, terms) -> None:
+        """Replaces the terms indexed for the vector of a dataset, without committing."""
+        DataSetVectorTerm.query.filter_by(data_set_id=dataset_id).delete(synchronize_session=False)
+        self.session.add_all(DataSetVectorTerm(term=term, data_set_id=dataset_id) for term in terms)
+
+    def delete_all(self) -> None:
+        DataSetVectorTerm.query.delete()
+        self.model.query.delete()
+
+
+class TfidfTermRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(TfidfTerm)
+
+    def get_by_terms(self, terms) -> dict:
+        if not terms:
+            return {}
+        return {row.term: row for row in self.model.query.filter(TfidfTerm.term.in_(list(terms))).all()}
+
+    def delete_all(self) -> None:
+        self.model.query.delete()
+
+
+class DataSetNeighbourRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(DataSetNeighbour)
+
+    def get_related(self, dataset_id: int, limit: int = 5) -> list:
+        """Published neighbours of a dataset, best first, read through the (data_set_id, rank) primary key."""
+        return (
+            DataSet.query.options(selectinload(DataSet.ds_meta_data))
+            .join(DataSetNeighbour, DataSetNeighbour.neighbour_id == DataSet.id)
+            .join(DSMetaData, DataSet.ds_meta_data)
+            .filter(DataSetNeighbour.data_set_id == dataset_id, DSMetaData.dataset_doi.isnot(None))
+            .order_by(DataSetNeighbour.rank)
+            .limit(limit)
+            .all()
+        )
+
+    def get_lists(self, dataset_ids) -> dict:
+        """Current neighbour lists as {dataset id: [(neighbour id, score), ...]}, best first."""
+        lists = {}
+        # Plain rows, not entities: replace_lists() inserts rows with the same primary keys
+        rows = (
+            self.session.query(DataSetNeighbour.data_set_id, DataSetNeighbour.neighbour_id, DataSetNeighbour.score)
+            .filter(DataSetNeighbour.data_set_id.in_(list(dataset_ids)))
+            .order_by(DataSetNeighbour.data_set_id, DataSetNeighbour.rank)
+        )
+        for data_set_id, neighbour_id, score in rows:
+            lists.setdefault(data_set_id, []).append((neighbour_id, score))
+        return lists
+
+    def get_listing(self, neighbour_id: int) -> set:
+        """Ids of the datasets whose lists contain `neighbour_id`, through the neighbour_id index."""
+        rows = self.session.query(DataSetNeighbour.data_set_id).filter(DataSetNeighbour.neighbour_id == neighbour_id)
+        return {data_set_id for data_set_id, in rows}
+
+    def replace_lists(self, lists: dict) -> None:
+        """Replaces the neighbours of the given datasets, without committing."""
+        if not lists:
+            return
+        self.model.query.filter(DataSetNeighbour.data_set_id.in_(list(lists))).delete(synchronize_session=False)
+        self.session.add_all(
+            DataSetNeighbour(data_set_id=dataset_id, rank=rank, neighbour_id=neighbour_id, score=score)
+            for dataset_id, neighbours in lists.items()
+            for rank, (neighbour_id, score) in enumerate(neighbours)
+        )
+
+    def delete_all(self) -> None:
+        self.model.query.delete()
+
+
+class CoDownloadRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(CoDownload)
+
+    def get_also_downloaded(self, dataset_id: int, limit: int = 5) -> list:
+        """Published datasets most often downloaded together with a dataset, through the (data_set_id, count) index."""
+        return (
+            DataSet.query.options(selectinload(DataSet.ds_meta_data))
+            .join(CoDownload, CoDownload.other_id == DataSet.id)
+            .join(DSMetaData, DataSet.ds_meta_data)
+            .filter(CoDownload.data_set_id == dataset_id, DSMetaData.dataset_doi.isnot(None))
+            .order_by(CoDownload.count.desc(), CoDownload.other_id)
+            .limit(limit)
+            .all()
+        )
+
+    def add_counts(self, lefts, rights, counts) -> None:
+        """Adds to the stored pair counts, without committing."""
+        existing = {
+            (row.data_set_id, row.other_id): row
+            for row in self.model.query.filter(CoDownload.data_set_id.in_({int(left) for left in lefts}))
+        }
+        for left, right, count in zip(lefts, rights, counts):
+            row = existing.get((int(left), int(right)))
+            if row is None:
+                self.session.add(CoDownload(data_set_id=int(left), other_id=int(right), count=int(count)))
+            else:
+                row.count += int(count)
+
+    def delete_all(self) -> None:
+        self.model.query.delete()
+
+
+class RecordCursorRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(RecordCursor)
+
+    def get_or_create(self, name: str) -> RecordCursor:
+        cursor = self.model.query.get(name)
+        if cursor is None:
+            cursor = RecordCursor(name=name, last_id=0)
+            self.session.add(cursor)
+        return cursor
+
+
+class TagRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(Tag)
+
+    def tag_cloud(self, limit: int = 50) -> list:
+        """Returns (tag name, number of datasets) pairs, most used first."""
+        count = func.count(ds_meta_data_tag.c.ds_meta_data_id)
+        return (
+            self.session.query(Tag.name, count)
+            .join(ds_meta_data_tag, ds_meta_data_tag.c.tag_id == Tag.id)
+            .group_by(Tag.id, Tag.name)
+            .order_by(count.desc(), Tag.name)
+            .limit(limit)
+            .all()
+        )
+
+    def ds_meta_data_ids_with_any(self, names: list):
+        """Subquery of the ids of the dataset metadata having at least one of the given tag names."""
+        return (
+            self.session.query(ds_meta_data_tag.c.ds_meta_data_id)
+            .join(Tag, Tag.id == ds_meta_data_tag.c.tag_id)
+            .filter(Tag.name.in_(names))
+        )
+
+    def ds_meta_data_ids_with_prefix(self, prefix: str):
+        return (
+            self.session.query(ds_meta_data_tag.c.ds_meta_data_id)
+            .join(Tag, Tag.id == ds_meta_data_tag.c.tag_id)
+            .filter(Tag.name.startswith(prefix, autoescape=True))
+        )
+
+
 class DOIMappingRepository(BaseRepository):
     def __init__(self):
         super().__init__(DOIMapping)
@@ -26,16 +26,24 @@ from app.modules.dataset.models import (
 from app.modules.dataset import dataset_bp
 from app.modules.dataset.services import (
     AuthorService,
+    CoDownloadService,
     DSDownloadRecordService,
     DSMetaDataService,
     DSViewRecordService,
     DataSetService,
     DOIMappingService,
-    RatingService
+    RatingService,
+    RelatedDataSetService,
+    archives_folder,
+    create_zip_of_datasets
 )
 
+from app.modules.explore.services import SavedSearchService
 from app.modules.fakenodo.services import DepositionService
+from app.modules.flamapy.services import FlamapyService
+from app.modules.jobs.services import JobService
 from core.configuration.configuration import USE_FAKENODO
+from core.workers.process_pool import PoolError, PoolSaturated
 
 logger = logging.getLogger(__name__)
 
@@ -46,6 +54,30 @@ dsmetadata_service = DSMetaDataService()
 fakenodo_service = DepositionService()
 doi_mapping_service = DOIMappingService()
 ds_view_record_service = DSViewRecordService()
+related_dataset_service = RelatedDataSetService()
+co_download_service = CoDownloadService()
+saved_search_service = SavedSearchService()
+flamapy_service = FlamapyService()
+job_service = JobService()
+
+
+def percolate_saved_searches(dataset_id: int) -> None:
+    try:
+        saved_search_service.percolate(dataset_id)
+    except Exception as exc:
+        # Saved searches are a convenience, they must not fail the upload or the synchronization
+        logger.exception(f"Exception while matching the saved searches against dataset {dataset_id}: {exc}")
+        saved_search_service.repository.session.rollback()
+
+
+def enqueue_dataset_job(kind: str, dataset_id: int, **payload) -> None:
+    try:
+        job_service.enqueue(kind, {'dataset_id': dataset_id, **payload}, idempotency_key=f'{kind}:{dataset_id}',
+                            user_id=current_user.id)
+    except Exception as exc:
+        # Metrics, recommendations and depositions are filled by later jobs or rebuilds, they must not fail the upload
+        logger.exception(f"Exception while enqueueing the {kind} job of dataset {dataset_id}: {exc}")
+        job_service.repository.session.rollback()
 
 
 @dataset_bp.route("/dataset/upload", methods=["GET", "POST"])
@@ -68,36 +100,13 @@ def create_dataset():
             logger.exception(f"Exception while create dataset data in local {exc}")
             return jsonify({"Exception while create dataset data in local: ": str(exc)}), 400
 
-        if USE_FAKENODO:
-            try:
-                publication_doi = form.publication_doi.data if form.publication_doi.data else None
+        percolate_saved_searches(dataset.id)
+        enqueue_dataset_job('dataset.update_related', dataset.id)
+        enqueue_dataset_job('featuremodel.analyze_dataset', dataset.id)
 
-                response = fakenodo_service.createDeposition(dataset=dataset, doi=publication_doi)
-
-                if 'deposition_id' in response:
-                    deposition_id = response.get("deposition_id")
-
-                    if "doi" in response:
-                        doi = response.get("doi")
-                        dataset_service.update_dsmetadata(dataset.ds_meta_data,
-                                                          deposition_id=deposition_id, dataset_doi=doi)
-                    else:
-                        dataset_service.update_dsmetadata(dataset.ds_meta_data_id, deposition_id=deposition_id)
-
-                    res = {
-                        "status": "OK",
-                        "message": "Dataset uploaded successfullyand DOI generated",
-                        "doi": doi
-                    }
-                    return jsonify(res), 200
-
-                else:
-                    return jsonify({"status": "error", "message": "Failed to create deposition, not all data was sent"
-                                    }), 500
-
-            except Exception as e:
-                msg = f"it has not been possible upload feature models in Fakenodo and update the DOI: {e}"
-                return jsonify({"message": msg}), 200
+        if USE_FAKENODO:
+            enqueue_dataset_job('fakenodo.create_deposition', dataset.id,
+                                publication_doi=form.publication_doi.data or None)
 
         # Delete temp folder
         file_path = current_user.temp_folder()
@@ -158,6 +167,19 @@ def upload():
     except Exception as e:
         return jsonify({"message": str(e)}), 500
 
+    # Broken models are turned away here rather than stored and failing later
+    try:
+        errors = flamapy_service.validate([file_path])[0]
+    except PoolSaturated:
+        os.remove(file_path)
+        return jsonify({"message": "The validation service is busy, please retry later"}), 503
+    except PoolError as e:
+        os.remove(file_path)
+        return jsonify({"message": f"The UVL exceeds the validation limits: {e}"}), 400
+    if errors:
+        os.remove(file_path)
+        return jsonify({"message": "UVL not valid", "errors": errors}), 400
+
     return (
         jsonify(
             {
@@ -274,13 +296,31 @@ def subdomain_index(doi):
     for model in dataset.feature_models:
         model.average_rating = RatingService.get_average_model_rating(model.id)
     # Renderiza la plantilla pasando los valores calculados
+    related_datasets = related_dataset_service.get_related(dataset.id)
+    also_downloaded = co_download_service.get_also_downloaded(dataset.id)
     user_cookie = ds_view_record_service.create_cookie(dataset=dataset)
-    resp = make_response(render_template("dataset/view_dataset.html", dataset=dataset, average_rating=average_rating))
+    resp = make_response(render_template("dataset/view_dataset.html", dataset=dataset, average_rating=average_rating,
+                                         related_datasets=related_datasets, also_downloaded=also_downloaded))
     resp.set_cookie("view_cookie", user_cookie)
 
     return resp
 
 
+@dataset_bp.route("/authors/<int:identity_id>", methods=["GET"])
+def author_page(identity_id):
+    identity = author_service.get_identity_or_404(identity_id)
+    datasets = dataset_service.get_by_author_identity(identity_id)
+    return render_template("dataset/author.html", identity=identity, datasets=datasets)
+
+
+@dataset_bp.route("/authors/orcid/<path:orcid>", methods=["GET"])
+def author_page_by_orcid(orcid):
+    identity = author_service.get_identity_by_orcid(orcid)
+    if not identity:
+        abort(404)
+    return redirect(url_for('dataset.author_page', identity_id=identity.id))
+
+
 @dataset_bp.route("/dataset/download_all_datasets", methods=["GET"])
 def download_all_datasets():
     try:
@@ -316,21 +356,49 @@ def create_temp_dir():
     return tempfile.mkdtemp()
 
 
-def create_zip_of_datasets(datasets, zip_path):
-    # Creamos el Zip
-    with ZipFile(zip_path, "w") as zipf:
-        for dataset in datasets:
-            file_path = f"uploads/user_{dataset.user_id}/dataset_{dataset.id}/"
-
-            if not os.path.exists(file_path):
-                continue
-
-            for subdir, dirs, files in os.walk(file_path):
-                for file in files:
-                    full_path = os.path.join(subdir, file)
-                    relative_path = os.path.relpath(full_path, file_path)
-                    arcname = os.path.join(f"dataset_{dataset.id}", relative_path)
-                    zipf.write(full_path, arcname=arcname)
+@dataset_bp.route("/dataset/download_all_datasets", methods=["POST"])
+def build_all_datasets_archive():
+    """
+    Builds the archive of every dataset in a job, for clients that poll it instead of waiting for the ZIP:
+    the status is at status_url, and the archive at download_url once the job has succeeded.
+    """
+    count, last_id = dataset_service.get_catalogue_version()
+    if not count:
+        return jsonify({"error": "No datasets found."}), 404
+
+    # One job, and one archive, per version of the catalogue
+    job = job_service.enqueue('dataset.build_archive', {'filename': f'allDatasets-{count}-{last_id}.zip'},
+                              idempotency_key=f'dataset.build_archive:{count}:{last_id}')
+    return jsonify({
+        "job_id": job.id,
+        "status_url": url_for('jobs.get_job', job_id=job.id),
+        "download_url": url_for('dataset.download_all_datasets_archive', job_id=job.id),
+    }), 202
+
+
+@dataset_bp.route("/dataset/download_all_datasets/<int:job_id>", methods=["GET"])
+def download_all_datasets_archive(job_id):
+    job = job_service.repository.get_by_id(job_id)
+    if job is None or job.kind != 'dataset.build_archive':
+        abort(404)
+    if job.status in ('queued', 'running'):
+        response = jsonify(job.to_dict())
+        response.headers['Retry-After'] = '2'
+        return response, 202
+    if job.status == 'failed':
+        return jsonify({"error": job.error}), 500
+
+    # Archives of previous versions of the catalogue are removed by the next build
+    filename = job.to_dict()['result']['filename']
+    if not os.path.exists(os.path.join(archives_folder(), filename)):
+        abort(410)
+    return send_from_directory(
+        os.path.abspath(archives_folder()),
+        filename,
+        as_attachment=True,
+        download_name="allDatasets.zip",
+        mimetype="application/zip"
+    )
 
 
 @dataset_bp.route("/dataset/unsynchronized/<int:dataset_id>/", methods=["GET"])
@@ -365,6 +433,7 @@ def synchronize_datasets():
 
         # Llamar al servicio para sincronizar los datasets con el datasetId
         dataset_service.synchronize_unsynchronized_datasets(current_user.id, dataset_id)
+        percolate_saved_searches(dataset_id)
 
         return jsonify({"success": True, "message": "Datasets sincronizados correctamente."}), 200
     except Exception as e:
@@ -2,6 +2,7 @@ import os
 import shutil
 from app.modules.auth.models import User
 from app.modules.featuremodel.models import FMMetaData, FeatureModel
+from app.modules.featuremodel.services import FeatureModelMetricsService
 from app.modules.hubfile.models import Hubfile
 from core.seeders.BaseSeeder import BaseSeeder
 from app.modules.dataset.models import (
@@ -26,9 +27,8 @@ class DataSetSeeder(BaseSeeder):
         if not user1 or not user2:
             raise Exception("Users not found. Please seed users first.")
 
-        # Create DSMetrics instance
-        ds_metrics = DSMetrics(number_of_models='5', number_of_features='50')
-        seeded_ds_metrics = self.seed([ds_metrics])[0]
+        # Create DSMetrics instances, filled by the analysis of the feature models once they are seeded
+        seeded_ds_metrics = self.seed([DSMetrics() for _ in range(4)])
 
         # Create DSMetaData instances
         ds_meta_data_list = [
@@ -40,7 +40,7 @@ class DataSetSeeder(BaseSeeder):
                 publication_doi=f'10.1234/dataset/{i+1}',
                 dataset_doi=f'10.1234/dataset/{i+1}',
                 tags='tag1, tag2',
-                ds_metrics_id=seeded_ds_metrics.id
+                ds_metrics_id=seeded_ds_metrics[i].id
             ) for i in range(4)
         ]
         seeded_ds_meta_data = self.seed(ds_meta_data_list)
@@ -122,3 +122,7 @@ class DataSetSeeder(BaseSeeder):
                 feature_model_id=feature_model.id
             )
             self.seed([uvl_file])
+
+        metrics_service = FeatureModelMetricsService()
+        for dataset in seeded_datasets:
+            metrics_service.analyze_dataset(dataset.id)
@@ -4,32 +4,60 @@ import hashlib
 import shutil
 from typing import Optional
 import uuid
+from zipfile import ZipFile
+
+import msgpack
+import numpy as np
 
 from app import db
 from flask import request
 
 from app.modules.featuremodel.models import ModelRating
 from app.modules.auth.services import AuthenticationService
-from app.modules.dataset.models import DSViewRecord, DataSet, DSMetaData, Rating
+from app.modules.dataset.models import (
+    DSViewRecord,
+    DataSet,
+    DSMetaData,
+    DataSetVector,
+    DataSetVectorTerm,
+    Rating,
+    TfidfTerm
+)
 from app.modules.dataset.repositories import (
+    AuthorIdentityRepository,
     AuthorRepository,
     DOIMappingRepository,
     DSDownloadRecordRepository,
     DSMetaDataRepository,
     DSViewRecordRepository,
-    DataSetRepository
+    CoDownloadRepository,
+    DataSetNeighbourRepository,
+    DataSetRepository,
+    DataSetVectorRepository,
+    RecordCursorRepository,
+    TfidfTermRepository
 )
 from app.modules.featuremodel.repositories import FMMetaDataRepository, FeatureModelRepository
+from app.modules.featuremodel.services import FeatureIndexService
 from app.modules.hubfile.repositories import (
     HubfileDownloadRecordRepository,
     HubfileRepository,
     HubfileViewRecordRepository
 )
+from app.modules.jobs.services import job_handler
+from core.configuration.configuration import uploads_folder_name
+from core.recommendations.co_occurrence import binary_csr, co_occurrences
+from core.recommendations.tfidf import nearest_neighbours, similarity_matrix, tfidf_vector, tokenize, top_k
 from core.services.BaseService import BaseService
 
 logger = logging.getLogger(__name__)
 
 
+def uvlhub_doi_url(dataset_doi: str, domain: Optional[str] = None) -> str:
+    domain = domain or os.getenv('DOMAIN', 'localhost')
+    return f'http://{domain}/doi/{dataset_doi}'
+
+
 def calculate_checksum_and_size(file_path):
     file_size = os.path.getsize(file_path)
     with open(file_path, "rb") as file:
@@ -50,6 +78,7 @@ class DataSetService(BaseService):
         self.hubfilerepository = HubfileRepository()
         self.dsviewrecord_repostory = DSViewRecordRepository()
         self.hubfileviewrecord_repository = HubfileViewRecordRepository()
+        self.feature_index_service = FeatureIndexService()
 
     def move_feature_models(self, dataset: DataSet):
         current_user = AuthenticationService().get_authenticated_user()
@@ -76,6 +105,9 @@ class DataSetService(BaseService):
     def latest_synchronized(self):
         return self.repository.latest_synchronized()
 
+    def get_by_author_identity(self, identity_id: int):
+        return self.repository.get_by_author_identity(identity_id)
+
     def count_synchronized_datasets(self):
         return self.repository.count_synchronized_datasets()
 
@@ -128,6 +160,7 @@ class DataSetService(BaseService):
                     commit=False, name=uvl_filename, checksum=checksum, size=size, feature_model_id=fm.id
                 )
                 fm.files.append(file)
+                self.feature_index_service.index_hubfile(file, file_path)
             self.repository.session.commit()
         except Exception as exc:
             logger.info(f"Exception creating dataset from form...: {exc}")
@@ -139,12 +172,14 @@ class DataSetService(BaseService):
         return self.dsmetadata_repository.update(id, **kwargs)
 
     def get_uvlhub_doi(self, dataset: DataSet) -> str:
-        domain = os.getenv('DOMAIN', 'localhost')
-        return f'http://{domain}/doi/{dataset.ds_meta_data.dataset_doi}'
+        return uvlhub_doi_url(dataset.ds_meta_data.dataset_doi)
 
     def download_all_datasets(self):
         return self.repository.download_all_datasets()
 
+    def get_catalogue_version(self) -> tuple:
+        return self.repository.get_catalogue_version()
+
     def synchronize_unsynchronized_datasets(self, user_id: int, dataset_id: int) -> None:
         unsynchronized_datasets = self.repository.get_unsynchronized(user_id)
 
@@ -165,6 +200,13 @@ class DataSetService(BaseService):
 class AuthorService(BaseService):
     def __init__(self):
         super().__init__(AuthorRepository())
+        self.author_identity_repository = AuthorIdentityRepository()
+
+    def get_identity_or_404(self, identity_id: int):
+        return self.author_identity_repository.get_or_404(identity_id)
+
+    def get_identity_by_orcid(self, orcid: str):
+        return self.author_identity_repository.get_by_orcid(orcid)
 
 
 class DSDownloadRecordService(BaseService):
@@ -235,6 +277,334 @@ class SizeService():
             return f'{round(size / (1024 ** 3), 2)} GB'
 
 
+class DataSetSerializer:
+    """
+    Builds the JSON representation of datasets.
+
+    Values that depend on the request or the environment (host URL, DOI domain) are resolved once per
+    serializer instead of once per dataset, so serializing a page of results does not construct any
+    service per row. Datasets should be loaded with the "listing" loading profile.
+    """
+
+    def __init__(self):
+        self.domain = os.getenv('DOMAIN', 'localhost')
+        self.host_url = request.host_url.rstrip("/")
+        self.size_service = SizeService()
+
+    def serialize_file(self, file) -> dict:
+        return {
+            'id': file.id,
+            'name': file.name,
+            'checksum': file.checksum,
+            'size_in_bytes': file.size,
+            'size_in_human_format': self.size_service.get_human_readable_size(file.size),
+            'url': f'{self.host_url}/file/download/{file.id}',
+        }
+
+    def serialize(self, dataset: DataSet) -> dict:
+        ds_meta_data = dataset.ds_meta_data
+        files = [file for fm in dataset.feature_models for file in fm.files]
+        total_size = sum(file.size for file in files)
+        return {
+            'title': ds_meta_data.title,
+            'id': dataset.id,
+            'created_at': dataset.created_at,
+            'created_at_timestamp': int(dataset.created_at.timestamp()),
+            'description': ds_meta_data.description,
+            'authors': [author.to_dict() for author in ds_meta_data.authors],
+            'publication_type': dataset.get_cleaned_publication_type(),
+            'publication_doi': ds_meta_data.publication_doi,
+            'dataset_doi': ds_meta_data.dataset_doi,
+            'tags': ds_meta_data.tags.split(",") if ds_meta_data.tags else [],
+            'url': uvlhub_doi_url(ds_meta_data.dataset_doi, self.domain),
+            'download': f'{self.host_url}/dataset/download/{dataset.id}',
+            'zenodo': dataset.get_fakenodo_url(),
+            'files': [self.serialize_file(file) for file in files],
+            'files_count': len(files),
+            'total_size_in_bytes': total_size,
+            'total_size_in_human_format': self.size_service.get_human_readable_size(total_size),
+        }
+
+    def serialize_many(self, datasets) -> list:
+        return [self.serialize(dataset) for dataset in datasets]
+
+    def serialize_card(self, card: dict) -> dict:
+        """
+        Slim representation for list views, built from ExploreRepository.get_dataset_cards(). The
+        description and the files are left to the detail endpoint.
+        """
+        return {
+            'id': card['id'],
+            'title': card['title'],
+            'created_at': card['created_at'],
+            'authors': card['authors'],
+            'publication_type': card['publication_type'].name.replace('_', ' ').title(),
+            'dataset_doi': card['dataset_doi'],
+            'tags': card['tags'].split(",") if card['tags'] else [],
+            'url': uvlhub_doi_url(card['dataset_doi'], self.domain),
+            'download': f"{self.host_url}/dataset/download/{card['id']}",
+            'files_count': card['files_count'],
+            'total_size_in_bytes': card['total_size'],
+            'total_size_in_human_format': self.size_service.get_human_readable_size(card['total_size']),
+        }
+
+
+def archives_folder() -> str:
+    """Archives of every dataset built by the dataset.build_archive jobs, in the uploads shared with the workers."""
+    return os.path.join(uploads_folder_name(), 'archives')
+
+
+def create_zip_of_datasets(datasets, zip_path, on_progress=None):
+    # Creamos el Zip
+    with ZipFile(zip_path, "w") as zipf:
+        for index, dataset in enumerate(datasets):
+            if on_progress is not None:
+                on_progress(index / len(datasets), f"Dataset {index + 1} of {len(datasets)}")
+
+            file_path = f"uploads/user_{dataset.user_id}/dataset_{dataset.id}/"
+
+            if not os.path.exists(file_path):
+                continue
+
+            for subdir, dirs, files in os.walk(file_path):
+                for file in files:
+                    full_path = os.path.join(subdir, file)
+                    relative_path = os.path.relpath(full_path, file_path)
+                    arcname = os.path.join(f"dataset_{dataset.id}", relative_path)
+                    zipf.write(full_path, arcname=arcname)
+
+
+@job_handler('dataset.build_archive')
+def build_archive_job(payload: dict, progress) -> dict:
+    """Job building the archive of every dataset, so the download request does not zip the whole hub."""
+    datasets = DataSetService().download_all_datasets()
+    directory = archives_folder()
+    os.makedirs(directory, exist_ok=True)
+
+    # Written aside and renamed, so a download never reads a partial archive
+    partial_path = os.path.join(directory, payload['filename'] + '.part')
+    create_zip_of_datasets(datasets, partial_path, on_progress=progress)
+    zip_path = os.path.join(directory, payload['filename'])
+    os.replace(partial_path, zip_path)
+
+    # Archives built before this one are of previous versions of the catalogue
+    for filename in os.listdir(directory):
+        path = os.path.join(directory, filename)
+        if not filename.endswith('.part') and os.path.getmtime(path) < os.path.getmtime(zip_path):
+            os.remove(path)
+    return {'filename': payload['filename'], 'number_of_datasets': len(datasets)}
+
+
+# Number of similar datasets stored per dataset
+RELATED_DATASETS_K = int(os.getenv('RELATED_DATASETS_K', '10'))
+
+
+def document_tokens(dataset: DataSet) -> list:
+    """Words of the title, description, tags and indexed feature names of a dataset."""
+    ds_meta_data = dataset.ds_meta_data
+    texts = [ds_meta_data.title, ds_meta_data.description, ' '.join(ds_meta_data.get_tag_names())]
+    texts.extend(
+        feature_name.name
+        for feature_model in dataset.feature_models
+        for hubfile in feature_model.files
+        for feature_name in hubfile.feature_names
+    )
+    return [token for token in tokenize(' '.join(texts)) if len(token) <= 120]
+
+
+def pack_vector(vector: dict) -> bytes:
+    return msgpack.packb(vector, use_single_float=True)
+
+
+def unpack_vector(data: bytes) -> dict:
+    return msgpack.unpackb(data)
+
+
+class RelatedDataSetService(BaseService):
+    """
+    "Similar datasets" from TF-IDF vectors of the dataset texts.
+
+    Vectors and top-k neighbour lists are stored, so the view page reads them with one lookup. A new
+    dataset is vectorized with the current document frequencies and compared against the stored vectors
+    only; `rosemary related:rebuild` recomputes everything with fresh frequencies.
+    """
+
+    def __init__(self, k: int = RELATED_DATASETS_K):
+        super().__init__(DataSetNeighbourRepository())
+        self.k = k
+        self.vector_repository = DataSetVectorRepository()
+        self.term_repository = TfidfTermRepository()
+
+    def get_related(self, dataset_id: int, limit: int = 5) -> list:
+        return self.repository.get_related(dataset_id, limit)
+
+    def rebuild(self) -> int:
+        datasets = self.vector_repository.get_documents()
+        documents = [document_tokens(dataset) for dataset in datasets]
+
+        frequencies = {}
+        for tokens in documents:
+            for term in set(tokens):
+                frequencies[term] = frequencies.get(term, 0) + 1
+        vectors = [tfidf_vector(tokens, frequencies, len(documents)) for tokens in documents]
+        neighbours = nearest_neighbours(vectors, self.k)
+
+        self.repository.delete_all()
+        self.vector_repository.delete_all()
+        self.term_repository.delete_all()
+        self.repository.session.add_all(
+            TfidfTerm(term=term, document_frequency=frequency) for term, frequency in frequencies.items()
+        )
+        self.repository.session.add_all(
+            DataSetVector(data_set_id=dataset.id, vector=pack_vector(vector))
+            for dataset, vector in zip(datasets, vectors)
+        )
+        self.repository.session.add_all(
+            DataSetVectorTerm(term=term, data_set_id=dataset.id)
+            for dataset, vector in zip(datasets, vectors)
+            for term in vector
+        )
+        self.repository.replace_lists({
+            dataset.id: [(datasets[index].id, score) for index, score in dataset_neighbours]
+            for dataset, dataset_neighbours in zip(datasets, neighbours)
+        })
+        self.repository.session.commit()
+        return len(datasets)
+
+    def update(self, dataset_id: int) -> int:
+        """
+        (Re)vectorizes one dataset and stores its neighbours among the datasets that share a term with it.
+        It is inserted in their lists when it is more similar than their current k-th neighbour, and dropped
+        from the lists of the datasets it no longer shares a term with. Returns the number of neighbours.
+        """
+        dataset = self.vector_repository.get_documents([dataset_id])[0]
+        tokens = document_tokens(dataset)
+
+        stored = self.vector_repository.get_by_id(dataset_id)
+        num_documents = self.vector_repository.count() + (stored is None)
+        terms = self.term_repository.get_by_terms(set(tokens))
+        if stored is None:
+            # Frequencies of an updated dataset are not corrected until the next rebuild
+            for term in set(tokens):
+                if term in terms:
+                    terms[term].document_frequency += 1
+                else:
+                    terms[term] = TfidfTerm(term=term, document_frequency=1)
+                    self.repository.session.add(terms[term])
+        vector = tfidf_vector(tokens, {term: row.document_frequency for term, row in terms.items()}, num_documents)
+        others = self.vector_repository.get_sharing_terms(vector, exclude_id=dataset_id)
+
+        if stored is None:
+            stored = DataSetVector(data_set_id=dataset_id)
+            self.repository.session.add(stored)
+        stored.vector = pack_vector(vector)
+        self.vector_repository.replace_terms(dataset_id, vector)
+
+        lists = {dataset_id: []}
+        similar = {}
+        if others and vector:
+            query_terms = sorted(vector)
+            matrix = similarity_matrix([unpack_vector(row.vector) for row in others], query_terms)
+            scores = matrix @ np.array([vector[term] for term in query_terms], dtype=np.float32)
+            lists[dataset_id] = [(others[index].data_set_id, score) for index, score in top_k(scores, self.k)]
+            similar = {others[index].data_set_id: float(scores[index]) for index in np.flatnonzero(scores > 0)}
+
+        # Lists that contain the dataset from a previous version of its text, to update or drop it from
+        affected = set(similar) | self.repository.get_listing(dataset_id)
+        current_lists = self.repository.get_lists(affected)
+        for other_id in affected:
+            previous = current_lists.get(other_id, [])
+            neighbours = [(neighbour_id, score) for neighbour_id, score in previous if neighbour_id != dataset_id]
+            changed = len(neighbours) != len(previous)
+            if other_id in similar and (len(neighbours) < self.k or similar[other_id] > neighbours[-1][1]):
+                neighbours.append((dataset_id, similar[other_id]))
+                changed = True
+            if changed:
+                lists[other_id] = sorted(neighbours, key=lambda item: -item[1])[:self.k]
+        self.repository.replace_lists(lists)
+        self.repository.session.commit()
+        return len(lists[dataset_id])
+
+
+@job_handler('dataset.update_related')
+def update_related_job(payload: dict, progress) -> dict:
+    """Job enqueued after upload, so the upload does not wait for the comparison with the catalogue."""
+    return {'number_of_related': RelatedDataSetService().update(payload['dataset_id'])}
+
+
+# Datasets of a downloader taken into account: crawlers downloading everything would add noise and
+# a number of pairs quadratic in their downloads
+CO_DOWNLOAD_MAX_BASKET = int(os.getenv('CO_DOWNLOAD_MAX_BASKET', '200'))
+
+
+def downloader_key(user_id, download_cookie) -> tuple:
+    return ('user', user_id) if user_id is not None else ('cookie', download_cookie)
+
+
+class CoDownloadService(BaseService):
+    """
+    "People who downloaded this also downloaded" from the download records.
+
+    Each downloader's distinct datasets form a row of a binary CSR matrix X, and the stored pair counts
+    are X^T X. A refresh only reads the records after the last processed one: for the downloaders that
+    appear in them it adds the counts of their grown rows minus the counts of their previous rows.
+    """
+
+    CURSOR = 'co_download'
+
+    def __init__(self, max_basket: int = CO_DOWNLOAD_MAX_BASKET):
+        super().__init__(CoDownloadRepository())
+        self.max_basket = max_basket
+        self.download_record_repository = DSDownloadRecordRepository()
+        self.cursor_repository = RecordCursorRepository()
+
+    def get_also_downloaded(self, dataset_id: int, limit: int = 5) -> list:
+        return self.repository.get_also_downloaded(dataset_id, limit)
+
+    def refresh(self, full: bool = False, batch_size: int = 10000) -> int:
+        """Processes the new download records, or every record with `full`. Returns how many were read."""
+        cursor = self.cursor_repository.get_or_create(self.CURSOR)
+        if full:
+            self.repository.delete_all()
+            cursor.last_id = 0
+
+        processed = 0
+        while True:
+            records = self.download_record_repository.get_after(cursor.last_id, batch_size)
+            if not records:
+                self.repository.session.commit()
+                return processed
+
+            downloaders = {downloader_key(record.user_id, record.download_cookie) for record in records}
+            previous = self.download_record_repository.get_by_downloaders(
+                {value for kind, value in downloaders if kind == 'user'},
+                {value for kind, value in downloaders if kind == 'cookie'},
+                cursor.last_id,
+            )
+
+            old_lefts, old_rights, old_counts = self._counts(previous, downloaders)
+            new_lefts, new_rights, new_counts = self._counts(list(previous) + list(records), downloaders)
+            delta = {(left, right): count for left, right, count in zip(new_lefts, new_rights, new_counts)}
+            for left, right, count in zip(old_lefts, old_rights, old_counts):
+                delta[(left, right)] -= count
+
+            changed = [(left, right, count) for (left, right), count in delta.items() if count]
+            if changed:
+                self.repository.add_counts(*zip(*changed))
+            cursor.last_id = records[-1].id
+            processed += len(records)
+            self.repository.session.commit()
+
+    def _counts(self, records, downloaders) -> tuple:
+        rows = {key: row for row, key in enumerate(sorted(downloaders, key=str))}
+        selected = [record for record in records if downloader_key(record.user_id, record.download_cookie) in rows]
+        indptr, indices = binary_csr(
+            (rows[downloader_key(record.user_id, record.download_cookie)] for record in selected),
+            (record.dataset_id for record in selected),
+        )
+        return co_occurrences(indptr, indices, self.max_basket)
+
+
 class RatingService:
     @staticmethod
     def add_rating(user_id, dataset_id, rating):
@@ -1,18 +1,24 @@
 from io import BytesIO
+import json
 import os
 import pytest
 from unittest.mock import patch
 from app import create_app, db
-from app.modules.dataset.models import DataSet
+from app.modules.dataset.api import DataSetResource
+from app.modules.dataset.models import Author, CoDownload, DSDownloadRecord, DataSet, DataSetNeighbour, fold_name
 from app.modules.dataset.repositories import DataSetRepository
+from app.modules.dataset.services import CoDownloadService, RelatedDataSetService
 import tempfile
+import zipfile
 import shutil
 from app.modules.conftest import login, logout
 
 from app.modules.auth.models import User
 
 from app.modules.dataset.routes import create_zip_of_datasets
+from app.modules.jobs.services import JobService
 from app.modules.profile.models import UserProfile
+from app.modules.utils.utilsdb import create_dataset_db
 
 
 # Fixtures
@@ -207,9 +213,170 @@ def test_send_zip_file_with_login(test_client, mock_datasets):
     logout(test_client)
 
 
+def test_fold_name():
+    assert fold_name("Muñoz, José") == fold_name("Jose MUNOZ")
+    assert fold_name("Muñoz, José") != fold_name("José Muñoz Pérez")
+
+
+def test_author_identity_page(test_client):
+    with test_client.application.app_context():
+        create_dataset_db(101, authors=[{"name": "Muñoz, José", "orcid": "0000-0001-0000-000X"}])
+        create_dataset_db(102, authors=[{"name": "Jose Munoz", "orcid": "https://orcid.org/0000-0001-0000-000x"}])
+        create_dataset_db(103, authors=[{"name": "José Muñoz", "orcid": ""}])
+
+        identities = {author.identity_id for author in Author.query.filter(Author.name.ilike("%mu%oz%")).all()}
+        assert len(identities) == 2, "Authors with the same ORCID were not linked to the same person"
+
+    response = test_client.get("/authors/orcid/0000-0001-0000-000X", follow_redirects=True)
+    assert response.status_code == 200
+    assert b"Sample dataset 101" in response.data
+    assert b"Sample dataset 102" in response.data
+    assert b"Sample dataset 103" not in response.data
+
+    response = test_client.get("/authors/orcid/0000-0000-0000-0000")
+    assert response.status_code == 404
+
+
+def test_related_datasets(test_client):
+    def titles(datasets):
+        return [dataset.ds_meta_data.title for dataset in datasets]
+
+    with test_client.application.app_context():
+        create_dataset_db(201, tags="automotive,cars,engines")
+        create_dataset_db(202, tags="automotive,cars,engines")
+        create_dataset_db(203, tags="medical,devices")
+        dataset_201 = DataSet.query.order_by(DataSet.id.desc()).offset(2).first()
+
+        service = RelatedDataSetService(k=3)
+        assert service.rebuild() == DataSet.query.count()
+        related = titles(service.get_related(dataset_201.id))
+        assert related[0] == "Sample dataset 202", "The dataset with the same tags is not the most similar"
+
+        # A new dataset is inserted in the lists of its neighbours without a rebuild, by a job
+        create_dataset_db(205, tags="automotive,cars,engines")
+        dataset_205 = DataSet.query.order_by(DataSet.id.desc()).first()
+        JobService().enqueue('dataset.update_related', {'dataset_id': dataset_205.id})
+        assert JobService().work(once=True) == 1
+        assert "Sample dataset 205" in titles(service.get_related(dataset_201.id))
+        assert sorted(titles(service.get_related(dataset_205.id))[:2]) == ["Sample dataset 201", "Sample dataset 202"]
+
+        # Once it shares no term with them, it leaves their lists
+        dataset_205.ds_meta_data.title = "Zoology"
+        dataset_205.ds_meta_data.description = "Birds"
+        dataset_205.ds_meta_data.tags = "ornithology"
+        db.session.commit()
+        assert service.update(dataset_205.id) == 0
+        assert "Zoology" not in titles(service.get_related(dataset_201.id))
+        assert DataSetNeighbour.query.filter_by(neighbour_id=dataset_205.id).count() == 0
+
+    response = test_client.get("/doi/10.1234/dataset201")
+    assert response.status_code == 200
+    assert b"Similar datasets" in response.data
+    assert b"Sample dataset 202" in response.data
+
+
+def test_co_download_recommendations(test_client):
+    def titles(datasets):
+        return [dataset.ds_meta_data.title for dataset in datasets]
+
+    def download(dataset, cookie):
+        db.session.add(DSDownloadRecord(dataset_id=dataset.id, download_cookie=cookie))
+
+    with test_client.application.app_context():
+        for dataset_id in (301, 302, 303):
+            create_dataset_db(dataset_id)
+        first, second, third = DataSet.query.order_by(DataSet.id.desc()).limit(3).all()[::-1]
+
+        for dataset in (first, second):
+            download(dataset, "cookie-x")
+        for dataset in (first, second, third, first):
+            download(dataset, "cookie-y")
+        db.session.commit()
+
+        service = CoDownloadService()
+        assert service.refresh() == 6
+        assert titles(service.get_also_downloaded(first.id)) == ["Sample dataset 302", "Sample dataset 303"]
+
+        # Only the new records are read, and they are combined with the previous downloads of the same cookie
+        download(third, "cookie-x")
+        download(first, "cookie-z")
+        download(third, "cookie-z")
+        db.session.commit()
+        assert service.refresh() == 3
+        assert titles(service.get_also_downloaded(first.id)) == ["Sample dataset 303", "Sample dataset 302"]
+
+        incremental = {(row.data_set_id, row.other_id): row.count for row in CoDownload.query.all()}
+        service.refresh(full=True)
+        assert incremental == {(row.data_set_id, row.other_id): row.count for row in CoDownload.query.all()}
+        assert incremental[(first.id, third.id)] == 3
+
+
+def test_download_all_datasets_in_a_job(test_client, tmp_path, monkeypatch):
+    monkeypatch.setenv("UPLOADS_DIR", str(tmp_path))
+    with test_client.application.app_context():
+        create_dataset_db(401)
+
+    response = test_client.post("/dataset/download_all_datasets")
+    assert response.status_code == 202
+    job = response.get_json()
+    assert test_client.get(job["download_url"]).status_code == 202
+
+    with test_client.application.app_context():
+        assert JobService().work(once=True) >= 1
+
+    response = test_client.get(job["download_url"])
+    assert response.status_code == 200
+    assert "allDatasets.zip" in response.headers["Content-Disposition"]
+    assert zipfile.is_zipfile(BytesIO(response.data))
+
+    # The same catalogue is archived once
+    assert test_client.post("/dataset/download_all_datasets").get_json()["job_id"] == job["job_id"]
+
+
 # Limpiar archivos temporales después de los tests
 @pytest.fixture(scope="function", autouse=True)
 def cleanup():
     temp_dir = tempfile.mkdtemp()
     yield
     shutil.rmtree(temp_dir)
+
+
+def test_datasets_api_streams_ndjson(test_client):
+    expected = test_client.get("/api/v1/datasets/").get_json()["items"]
+
+    response = test_client.get("/api/v1/datasets/", headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert [json.loads(line) for line in response.get_data(as_text=True).splitlines()] == expected
+
+    # Batches follow the ids, each one a complete query
+    with test_client.application.app_context():
+        ids = [dataset.id for dataset in DataSetResource().iter_items(batch_size=2)]
+        assert ids == sorted(dataset.id for dataset in DataSet.query.all()) and len(ids) > 2
+
+
+def test_upload_validates_uvl(test_client):
+    login(test_client, "user@example.com", "test1234")
+    with open("app/modules/dataset/uvl_examples/file1.uvl", "rb") as uvl_file:
+        valid = uvl_file.read()
+
+    response = test_client.post("/dataset/file/upload", data={"file": (BytesIO(valid), "valid.uvl")},
+                                content_type="multipart/form-data")
+    assert response.status_code == 200
+    saved = os.path.join(current_temp_folder(test_client), response.get_json()["filename"])
+    assert os.path.exists(saved)
+
+    # The grammar rejects a feature group without children, which the lexer alone accepts
+    invalid = valid.replace(b"optional\n", b"optional\n    =>\n")
+    response = test_client.post("/dataset/file/upload", data={"file": (BytesIO(invalid), "invalid.uvl")},
+                                content_type="multipart/form-data")
+    assert response.status_code == 400
+    assert response.get_json()["errors"]
+    assert not os.path.exists(os.path.join(current_temp_folder(test_client), "invalid.uvl"))
+    os.remove(saved)
+    logout(test_client)
+
+
+def current_temp_folder(test_client) -> str:
+    with test_client.application.app_context():
+        return User.query.filter_by(email="user@example.com").first().temp_folder()
@@ -21,6 +21,7 @@ function send_query() {
                 query: document.querySelector('#query').value,
                 publication_type: document.querySelector('#publication_type').value,
                 sorting: document.querySelector('[name="sorting"]:checked').value,
+                facets: true,
             };
 
             console.log(document.querySelector('#publication_type').value);
@@ -33,10 +34,19 @@ function send_query() {
                 body: JSON.stringify(searchCriteria),
             })
                 .then(response => response.json())
-                .then(data => {
+                .then(response_data => {
 
+                    if (response_data.errors) {
+                        document.getElementById('results').innerHTML = '';
+                        document.getElementById('results_number').textContent =
+                            response_data.errors.map(error => error.message).join('. ');
+                        return;
+                    }
+
+                    const data = response_data.datasets;
                     console.log(data);
                     document.getElementById('results').innerHTML = '';
+                    render_facets(response_data.facets);
 
                     // results counter
                     const resultCount = data.length;
@@ -65,19 +75,6 @@ function send_query() {
                                     </div>
                                     <p class="text-secondary">${formatDate(dataset.created_at)}</p>
 
-                                    <div class="row mb-2">
-
-                                        <div class="col-md-4 col-12">
-                                            <span class=" text-secondary">
-                                                Description
-                                            </span>
-                                        </div>
-                                        <div class="col-md-8 col-12">
-                                            <p class="card-text">${dataset.description}</p>
-                                        </div>
-
-                                    </div>
-
                                     <div class="row mb-2">
 
                                         <div class="col-md-4 col-12">
@@ -118,6 +115,10 @@ function send_query() {
                                             <a href="/dataset/download/${dataset.id}" class="btn btn-outline-primary btn-sm" id="search" style="border-radius: 5px;">
                                                 Download (${dataset.total_size_in_human_format})
                                             </a>
+                                            <button class="btn btn-outline-secondary btn-sm" style="border-radius: 5px;" onclick="toggle_details(${dataset.id})">
+                                                Details (${dataset.files_count} ${dataset.files_count === 1 ? 'file' : 'files'})
+                                            </button>
+                                            <div id="details-${dataset.id}" class="mt-2" style="display: none;"></div>
                                         </div>
 
 
@@ -134,6 +135,98 @@ function send_query() {
     });
 }
 
+function toggle_details(datasetId) {
+    const details = document.getElementById(`details-${datasetId}`);
+    if (details.style.display === 'block') {
+        details.style.display = 'none';
+        return;
+    }
+    details.style.display = 'block';
+    if (details.dataset.loaded) {
+        return;
+    }
+
+    // The explore results only carry the card fields: the description and files are fetched on demand
+    fetch(`/explore/datasets/${datasetId}`)
+        .then(response => response.json())
+        .then(dataset => {
+            details.dataset.loaded = 'true';
+            // The description and file names are user input: they are set as text
+            const description = document.createElement('p');
+            description.className = 'card-text';
+            description.textContent = dataset.description;
+            details.replaceChildren(description, ...dataset.files.map(file => {
+                const line = document.createElement('p');
+                line.className = 'p-0 m-0';
+                const link = document.createElement('a');
+                link.href = file.url;
+                link.textContent = file.name;
+                line.append(link, ` (${file.size_in_human_format})`);
+                return line;
+            }));
+        });
+}
+
+function render_facets(facets) {
+    // Tags and author names are user input: they are only ever set as text, never parsed as HTML
+    const facet = (title, items, onclick) => {
+        if (items.length === 0) {
+            return null;
+        }
+        const container = document.createElement('div');
+        container.className = 'mb-2';
+        const heading = document.createElement('span');
+        heading.className = 'text-secondary';
+        heading.textContent = title;
+        const badges = document.createElement('div');
+        items.forEach(item => {
+            const badge = document.createElement('span');
+            badge.className = 'badge bg-light text-dark me-1 mb-1';
+            badge.textContent = `${item.label || item.value} (${item.count})`;
+            if (onclick) {
+                badge.style.cursor = 'pointer';
+                badge.addEventListener('click', () => onclick(item));
+            }
+            badges.appendChild(badge);
+        });
+        container.append(heading, badges);
+        return container;
+    };
+
+    document.getElementById('facets').replaceChildren(...[
+        facet('Publication type', facets.publication_type, item => set_publication_type_as_query(item.label)),
+        facet('Tags', facets.tags, item => set_tag_as_query(`tags:${item.value}`)),
+        facet('Authors', facets.authors, item => set_tag_as_query(`author:${item.value}`)),
+        facet('Year', facets.year, null),
+    ].filter(element => element !== null));
+}
+
+const SUGGESTION_PREFIXES = {tag: 'tags:', author: 'author:', title: 'title:', model: '', feature: 'feature:'};
+
+function render_suggestions() {
+    const query = document.getElementById('query').value;
+    const datalist = document.getElementById('suggestions');
+
+    if (query.trim().length < 2 || query.includes(':')) {
+        datalist.innerHTML = '';
+        return;
+    }
+
+    fetch(`/explore/suggest?q=${encodeURIComponent(query)}`)
+        .then(response => response.json())
+        .then(suggestions => {
+            datalist.innerHTML = '';
+            suggestions.forEach(suggestion => {
+                const option = document.createElement('option');
+                option.value = SUGGESTION_PREFIXES[suggestion.type] + suggestion.value;
+                option.label = `${suggestion.type} (${suggestion.count})`;
+                datalist.appendChild(option);
+            });
+        });
+}
+
+document.getElementById('query').addEventListener('input', render_suggestions);
+
 function formatDate(dateString) {
     const options = {day: 'numeric', month: 'long', year: 'numeric', hour: 'numeric', minute: 'numeric'};
     const date = new Date(dateString);
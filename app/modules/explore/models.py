@@ -0,0 +1,55 @@
+from datetime import datetime
+
+from app import db
+
+
+class SavedSearch(db.Model):
+    """An explore search stored for a user, matched against every new or synchronized dataset."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    name = db.Column(db.String(120), nullable=False)
+    query_string = db.Column(db.String(512), nullable=False, default='')
+    publication_type = db.Column(db.String(64), nullable=False, default='any')
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Id of the last match returned by the "new since last check" feed
+    last_match_id = db.Column(db.Integer, nullable=False, default=0)
+
+    terms = db.relationship('SavedSearchTerm', backref='saved_search', lazy=True, cascade="all, delete")
+    matches = db.relationship('SavedSearchMatch', backref='saved_search', lazy='dynamic', cascade="all, delete")
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'query': self.query_string,
+            'publication_type': self.publication_type,
+            'created_at': self.created_at,
+        }
+
+    def __repr__(self):
+        return f'SavedSearch<{self.id}, {self.name}>'
+
+
+class SavedSearchTerm(db.Model):
+    """
+    One value a dataset must have for the saved search to possibly match it: the alternatives of its most
+    selective exact predicate, or ("*", "") for searches without one. New datasets only check the saved
+    searches found under their own values.
+    """
+    saved_search_id = db.Column(db.Integer, db.ForeignKey('saved_search.id'), primary_key=True)
+    field = db.Column(db.String(32), primary_key=True)
+    value = db.Column(db.String(255), primary_key=True)
+
+    __table_args__ = (db.Index('ix_saved_search_term_field_value', 'field', 'value'),)
+
+
+class SavedSearchMatch(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    saved_search_id = db.Column(db.Integer, db.ForeignKey('saved_search.id'), nullable=False)
+    data_set_id = db.Column(db.Integer, db.ForeignKey('data_set.id'), nullable=False)
+    matched_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('saved_search_id', 'data_set_id', name='uq_saved_search_match'),
+        db.Index('ix_saved_search_match_saved_search_id_id', 'saved_search_id', 'id'),
+    )
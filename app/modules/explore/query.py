@@ -0,0 +1,345 @@
+"""
+The explore query language.
+
+A query is a ';'-separated list of terms. A term is either a filter, "name:value", or free text matched
+against the titles and tags. Queries are parsed into an immutable `Query` of predicates and planned into
+a `Plan` that orders the predicates by estimated selectivity and lists the joins they need once; the
+repository turns a plan into a single SQL statement. Compiled plans are cached per query string.
+"""
+import difflib
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+from app.modules.dataset.models import PublicationType, name_tokens, split_tags
+from app.modules.featuremodel.models import normalize_feature_name
+
+# Filters that narrow the results, and those whose last occurrence overrides the previous ones
+NARROWING_FILTERS = ('tags', 'author', 'title', 'feature', 'constraint')
+OVERRIDING_FILTERS = (
+    'models_min', 'models_max', 'min_size', 'max_size', 'features_min', 'features_max', 'constraints_min',
+    'constraints_max', 'depth_min', 'depth_max', 'configurations_min', 'configurations_max',
+)
+KNOWN_FILTERS = NARROWING_FILTERS + OVERRIDING_FILTERS
+
+# Range predicates and the filters giving their minimum and maximum. The feature model metrics are those
+# rolled up per dataset by the analysis pipeline: datasets not analysed yet match no range on them
+RANGE_FILTERS = {
+    'files': ('models_min', 'models_max'),
+    'size': ('min_size', 'max_size'),
+    'number_of_features': ('features_min', 'features_max'),
+    'cross_tree_constraints': ('constraints_min', 'constraints_max'),
+    'max_depth': ('depth_min', 'depth_max'),
+    'configurations': ('configurations_min', 'configurations_max'),
+}
+
+# Filters written as "a,b" (every group) and "a|b" (any value of a group)
+SET_FILTERS = ('tags', 'feature', 'constraint')
+
+# A term is read as a filter when what comes before its first ':' looks like a name. Unknown names are
+# reported as mistyped filters only when the value follows the colon directly and is not the rest of a
+# URL, so free text such as "note: video" or "http://example.com" is searched as text
+FILTER_NAME = re.compile(r'[A-Za-z_]+')
+
+# Estimated fraction of the datasets one value of each predicate keeps, and the relative cost of evaluating
+# it: exact values are index lookups, substrings scan the titles, file ranges aggregate the files and
+# metric ranges read one indexed column
+SELECTIVITY = {
+    'publication_type': 1 / len(PublicationType),
+    'tags': 0.05,
+    'author': 0.05,
+    'feature': 0.1,
+    'constraint': 0.1,
+    'title': 0.2,
+    'text': 0.3,
+    'files': 0.5,
+    'size': 0.5,
+    'number_of_features': 0.5,
+    'cross_tree_constraints': 0.5,
+    'max_depth': 0.5,
+    'configurations': 0.5,
+}
+COST = {
+    'publication_type': 1,
+    'tags': 1,
+    'author': 2,
+    'feature': 1,
+    'constraint': 1,
+    'title': 4,
+    'text': 5,
+    'files': 3,
+    'size': 3,
+    'number_of_features': 2,
+    'cross_tree_constraints': 2,
+    'max_depth': 2,
+    'configurations': 2,
+}
+
+# The relation every predicate reads besides the datasets themselves
+JOINS = {
+    'publication_type': 'ds_meta_data',
+    'tags': 'ds_meta_data',
+    'author': 'ds_meta_data',
+    'title': 'ds_meta_data',
+    'text': 'ds_meta_data',
+    'files': 'file_stats',
+    'size': 'file_stats',
+    'number_of_features': 'ds_metrics',
+    'cross_tree_constraints': 'ds_metrics',
+    'max_depth': 'ds_metrics',
+    'configurations': 'ds_metrics',
+}
+
+COMPILED_QUERY_CACHE_SIZE = 1024
+
+
+class QueryError(ValueError):
+    """A query that cannot be compiled. `errors` lists one dict per wrong term."""
+
+    def __init__(self, errors: list):
+        super().__init__('; '.join(error['message'] for error in errors))
+        self.errors = errors
+
+
+@dataclass(frozen=True)
+class Predicate:
+    """
+    One condition of a query. Set filters have one predicate per group, with the sorted alternatives as
+    value; ranges (RANGE_FILTERS) have a (minimum, maximum) pair where either bound may be None.
+    """
+    field: str
+    value: object
+
+    @property
+    def selectivity(self) -> float:
+        if self.field in SET_FILTERS:
+            return min(1.0, SELECTIVITY[self.field] * len(self.value))
+        if self.field == 'author':
+            return SELECTIVITY['author'] ** len(self.value.split())
+        if self.field in RANGE_FILTERS:
+            return SELECTIVITY[self.field] ** sum(bound is not None for bound in self.value)
+        return SELECTIVITY[self.field]
+
+    @property
+    def rank(self) -> float:
+        """Predicates are best evaluated by increasing (selectivity - 1) / cost."""
+        return (self.selectivity - 1) / COST[self.field]
+
+
+@dataclass(frozen=True)
+class Query:
+    predicates: frozenset
+
+    @property
+    def key(self) -> tuple:
+        """Canonical form: queries with the same key match the same datasets."""
+        return tuple(sorted((predicate.field, repr(predicate.value)) for predicate in self.predicates))
+
+    def without(self, *fields) -> 'Query':
+        return Query(frozenset(predicate for predicate in self.predicates if predicate.field not in fields))
+
+    def values(self, field: str) -> list:
+        return [predicate.value for predicate in self.predicates if predicate.field == field]
+
+
+@dataclass(frozen=True)
+class Plan:
+    query: Query
+    predicates: tuple
+    joins: tuple
+
+
+def parse_query(query_string: str, publication_type: str = "any") -> Query:
+    """
+    Parses a query into its predicates. Values are matched case-insensitively, so they are folded here;
+    duplicated predicates and OR groups implied by a narrower one ("a" implies "a|b") are dropped.
+    Unknown filters raise a QueryError listing every wrong term. Invalid numbers and unknown publication
+    types are ignored, as they always were.
+    """
+    errors = []
+    predicates = set()
+    overriding = {}
+    position = 0
+    for term in (query_string or "").split(';'):
+        start = position + len(term) - len(term.lstrip())
+        position += len(term) + 1
+        term = term.strip()
+        if not term:
+            continue
+
+        name, separator, value = term.partition(':')
+        if not separator or not FILTER_NAME.fullmatch(name) or (
+                name.lower() not in KNOWN_FILTERS and not looks_like_filter_value(value)):
+            predicates.add(Predicate('text', term.lower()))
+            continue
+
+        name = name.lower()
+        value = value.strip()
+        if name not in KNOWN_FILTERS:
+            errors.append(unknown_filter_error(name, term, start))
+        elif name in OVERRIDING_FILTERS:
+            overriding[name] = value
+        elif name == 'tags':
+            predicates.update(Predicate('tags', tuple(sorted(split_tags(group.replace('|', ',')))))
+                              for group in value.split(','))
+        elif name in ('feature', 'constraint'):
+            predicates.update(
+                Predicate(name, tuple(sorted({normalize_feature_name(alternative)
+                                              for alternative in group.split('|')} - {''})))
+                for group in value.split(',')
+            )
+        elif name == 'author':
+            predicates.add(Predicate('author', ' '.join(name_tokens(value))))
+        else:
+            predicates.add(Predicate(name, value.lower()))
+
+    if errors:
+        raise QueryError(errors)
+
+    predicates = {predicate for predicate in predicates if predicate.field not in SET_FILTERS or predicate.value}
+    predicates -= implied_groups(predicates)
+
+    for field, (minimum, maximum) in RANGE_FILTERS.items():
+        parse = parse_size if field == 'size' else parse_count
+        bounds = (parse(overriding.get(minimum)), parse(overriding.get(maximum)))
+        if bounds != (None, None):
+            predicates.add(Predicate(field, bounds))
+
+    for member in PublicationType:
+        if member.value.lower() == publication_type:
+            predicates.add(Predicate('publication_type', member.name))
+            break
+
+    return Query(frozenset(predicates))
+
+
+def looks_like_filter_value(value: str) -> bool:
+    return bool(value) and not value[0].isspace() and not value.startswith('//')
+
+
+def implied_groups(predicates) -> set:
+    """OR groups of a set filter that a narrower group of the same filter already implies."""
+    return {
+        predicate for predicate in predicates
+        if predicate.field in SET_FILTERS and any(
+            other.field == predicate.field and other.value != predicate.value
+            and set(other.value) <= set(predicate.value)
+            for other in predicates
+        )
+    }
+
+
+def parse_count(value):
+    return int(value) if value and value.isdigit() else None
+
+
+def parse_size(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def unknown_filter_error(name: str, term: str, position: int) -> dict:
+    error = {
+        'code': 'unknown_filter',
+        'filter': name,
+        'term': term,
+        'position': position,
+        'message': f"Unknown filter '{name}'",
+        'allowed': list(KNOWN_FILTERS),
+    }
+    close = difflib.get_close_matches(name, KNOWN_FILTERS, n=1)
+    if close:
+        error['suggestion'] = close[0]
+        error['message'] += f", did you mean '{close[0]}'?"
+    return error
+
+
+def plan_query(query: Query) -> Plan:
+    """Orders the predicates, most selective for their cost first, and collects the joins they need once."""
+    predicates = tuple(sorted(
+        query.predicates, key=lambda predicate: (predicate.rank, predicate.field, repr(predicate.value))
+    ))
+    joins = tuple(dict.fromkeys(JOINS[predicate.field] for predicate in predicates if predicate.field in JOINS))
+    return Plan(query, predicates, joins)
+
+
+@lru_cache(maxsize=COMPILED_QUERY_CACHE_SIZE)
+def compile_query(query_string: str, publication_type: str = "any") -> Plan:
+    return plan_query(parse_query(query_string, publication_type))
+
+
+@dataclass(frozen=True)
+class Document:
+    """
+    What the predicates of a query read from one dataset, folded as the parser folds the values, so a plan
+    can be matched in memory against a single dataset instead of querying for it.
+    """
+    title: str
+    publication_type: str
+    tags: frozenset
+    features: frozenset
+    constraints: frozenset
+    # The name tokens of each author linked to a person
+    authors: tuple
+    files: int
+    size: int
+    # The metrics of the dataset's feature models (see DSMetrics), None until they are analysed
+    number_of_features: int = None
+    cross_tree_constraints: int = None
+    max_depth: int = None
+    configurations: float = None
+
+    def terms(self) -> list:
+        """The anchor terms (see `anchor_terms`) under which the saved searches that may match it are found."""
+        return (
+            [('tags', tag) for tag in self.tags]
+            + [('feature', name) for name in self.features]
+            + [('constraint', name) for name in self.constraints]
+            + [('publication_type', self.publication_type), ('*', '')]
+        )
+
+
+def matches(plan: Plan, document: Document) -> bool:
+    """Whether the dataset described by `document` is a result of the plan, as the SQL statement decides it."""
+    for predicate in plan.predicates:
+        field, value = predicate.field, predicate.value
+        if field == 'publication_type':
+            matched = document.publication_type == value
+        elif field == 'tags':
+            matched = not document.tags.isdisjoint(value)
+        elif field == 'feature':
+            matched = not document.features.isdisjoint(value)
+        elif field == 'constraint':
+            matched = not document.constraints.isdisjoint(value)
+        elif field == 'author':
+            matched = any(
+                all(any(token.startswith(prefix) for token in tokens) for prefix in value.split())
+                for tokens in document.authors
+            )
+        elif field == 'title':
+            matched = value in document.title
+        elif field == 'text':
+            matched = value in document.title or any(tag.startswith(value) for tag in document.tags)
+        else:
+            number = getattr(document, field)
+            minimum, maximum = value
+            matched = number is not None and (minimum is None or number >= minimum) and \
+                (maximum is None or number <= maximum)
+        if not matched:
+            return False
+    return True
+
+
+def anchor_terms(plan: Plan) -> list:
+    """
+    The (field, value) terms a saved search is indexed under: the alternatives of its first exact predicate
+    in plan order, the most selective one, since every result must have one of them.
+    """
+    for predicate in plan.predicates:
+        if predicate.field in SET_FILTERS:
+            return [(predicate.field, value) for value in predicate.value]
+        if predicate.field == 'publication_type':
+            return [(predicate.field, predicate.value)]
+    return [('*', '')]
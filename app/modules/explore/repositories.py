@@ -1,104 +1,303 @@
-from sqlalchemy import or_
-from sqlalchemy.orm import aliased
+from collections import Counter
+
+from sqlalchemy import and_, distinct, extract, func, or_, true, tuple_
+from sqlalchemy.orm import aliased, selectinload
 from app import db
-from app.modules.dataset.models import DSMetaData, DataSet, Author, PublicationType
+from app.modules.dataset.models import Author, DSMetaData, DSMetrics, DataSet, Tag, ds_meta_data_tag
+from app.modules.dataset.repositories import AuthorIdentityRepository, TagRepository, dataset_loading_profile
+from app.modules.explore.models import SavedSearch, SavedSearchMatch, SavedSearchTerm
+from app.modules.explore.query import Plan, Predicate, compile_query
+from app.modules.featuremodel.models import FeatureModel
+from app.modules.featuremodel.repositories import FeatureNameRepository
+from app.modules.hubfile.models import Hubfile
 from core.repositories.BaseRepository import BaseRepository
+from core.resources.streaming import STREAM_BATCH_SIZE
 
 
 class ExploreRepository(BaseRepository):
     def __init__(self):
         super().__init__(DataSet)
+        self.tag_repository = TagRepository()
+        self.author_identity_repository = AuthorIdentityRepository()
+        self.feature_name_repository = FeatureNameRepository()
 
-    def filter_datasets(self, query_string, sorting="newest", publication_type="any", uvl_min="", uvl_max=""):
+    def filter_datasets(self, query, sorting="newest", publication_type="any", dataset_ids=None):
+        """
+        Ids of the datasets matching an explore query, given as a string or an already compiled Plan, in the
+        requested order. One SQL statement selecting only the ids: every predicate, the file count and size
+        ranges included, is a condition of its WHERE clause, in the order chosen by the planner, and each
+        relation is joined once. Raises QueryError for unknown filters.
+        """
+        plan = query if isinstance(query, Plan) else compile_query(query, publication_type)
 
         ds_meta_data_alias = aliased(DSMetaData)
-        author_meta_data_alias = aliased(DSMetaData)
-        min_size_filter = None
-        max_size_filter = None
-
-        query = db.session.query(DataSet).join(ds_meta_data_alias, DataSet.ds_meta_data)
-
-        if publication_type != "any":
-            matching_type = None
-            for member in PublicationType:
-                if member.value.lower() == publication_type:
-                    matching_type = member
-                    break
-            if matching_type is not None:
-                query = query.filter(ds_meta_data_alias.publication_type == matching_type.name)
-        query_filter = query_string.strip()
-
-        for filter_item in query_filter.split(';'):
-
-            if filter_item.startswith('tags:'):
-                tag_value = filter_item[5:].strip()
-                query = query.filter(ds_meta_data_alias.tags.ilike(f'%{tag_value}%'))
-
-            elif filter_item.startswith('models_max:'):
-                models_max_value = filter_item[11:].strip()
-                uvl_max = models_max_value
-
-            elif filter_item.startswith('models_min:'):
-                models_min_value = filter_item[11:].strip()
-                uvl_min = models_min_value
-
-            elif filter_item.startswith('min_size:'):
-                try:
-                    min_size_filter = int(filter_item[9:].strip())
-                except ValueError:
-                    min_size_filter = None
-
-            elif filter_item.startswith('max_size:'):
-                try:
-                    max_size_filter = int(filter_item[9:].strip())
-                except ValueError:
-                    max_size_filter = None
-
-            elif filter_item.startswith('author:'):
-                author_name = filter_item[7:].strip()
-                query = query.join(author_meta_data_alias).join(Author).filter(Author.name.ilike(f'%{author_name}%'))
-
-            elif filter_item.startswith('title:'):
-                title_value = filter_item[6:].strip()
-                query = query.filter(ds_meta_data_alias.title.ilike(f'%{title_value}%'))
-
-            else:
-                query = query.filter(
-                    or_(
-                        ds_meta_data_alias.title.ilike(f"%{filter_item}%"),
-                        ds_meta_data_alias.tags.ilike(f"%{filter_item}%")
-                    )
-                )
+        ds_metrics_alias = aliased(DSMetrics)
+        file_stats = None
+
+        query = db.session.query(DataSet.id)
+        joined = set()
+        for join in plan.joins:
+            if join in ('ds_meta_data', 'ds_metrics') and 'ds_meta_data' not in joined:
+                query = query.join(ds_meta_data_alias, DataSet.ds_meta_data)
+                joined.add('ds_meta_data')
+            if join == 'ds_metrics':
+                # Datasets not analysed yet have no metrics, and match no range on them
+                query = query.join(ds_metrics_alias, ds_meta_data_alias.ds_metrics_id == ds_metrics_alias.id)
+            elif join == 'file_stats':
+                file_stats = self.file_stats()
+                query = query.outerjoin(file_stats, file_stats.c.data_set_id == DataSet.id)
+
+        if dataset_ids is not None:
+            query = query.filter(DataSet.id.in_(dataset_ids))
+
+        for predicate in plan.predicates:
+            query = query.filter(self.condition(predicate, ds_meta_data_alias, file_stats, ds_metrics_alias))
 
         if sorting == "oldest":
             query = query.order_by(DataSet.created_at.asc())
         else:
             query = query.order_by(DataSet.created_at.desc())
 
-        results = query.all()
+        return [dataset_id for dataset_id, in query]
+
+    def condition(self, predicate: Predicate, ds_meta_data_alias, file_stats, ds_metrics_alias=None):
+        """The SQL condition of a query predicate."""
+        field, value = predicate.field, predicate.value
+
+        if field == 'publication_type':
+            return ds_meta_data_alias.publication_type == value
+
+        if field == 'tags':
+            # One exact index lookup per "a|b" group
+            return ds_meta_data_alias.id.in_(self.tag_repository.ds_meta_data_ids_with_any(list(value)))
+
+        if field in ('feature', 'constraint'):
+            # Same syntax as tags, over the feature names indexed at upload time
+            return DataSet.id.in_(self.feature_name_repository.data_set_ids_with_any(
+                set(value), in_constraints=field == 'constraint'
+            ))
+
+        if field == 'author':
+            # Accent- and case-insensitive: "munoz" matches "Muñoz", through the author index
+            identity_ids = self.author_identity_repository.identity_ids_matching(value)
+            return ds_meta_data_alias.id.in_(
+                self.author_identity_repository.ds_meta_data_ids_by_identities(identity_ids)
+            )
+
+        if field == 'title':
+            return ds_meta_data_alias.title.ilike(f'%{value}%')
+
+        if field == 'text':
+            return or_(
+                ds_meta_data_alias.title.ilike(f"%{value}%"),
+                ds_meta_data_alias.id.in_(self.tag_repository.ds_meta_data_ids_with_prefix(value)),
+            )
+
+        if field in ('files', 'size'):
+            # Datasets without files have no row in the file stats
+            column = func.coalesce(file_stats.c.files_count if field == 'files' else file_stats.c.total_size, 0)
+        else:
+            column = getattr(ds_metrics_alias, field)
+        minimum, maximum = value
+        return and_(
+            column >= minimum if minimum is not None else true(),
+            column <= maximum if maximum is not None else true(),
+        )
+
+    def file_stats(self):
+        """Subquery of the number of files and their total size per dataset."""
+        return (
+            db.session.query(
+                FeatureModel.data_set_id.label('data_set_id'),
+                func.count(Hubfile.id).label('files_count'),
+                func.sum(Hubfile.size).label('total_size'),
+            )
+            .join(Hubfile, Hubfile.feature_model_id == FeatureModel.id)
+            .group_by(FeatureModel.data_set_id)
+            .subquery()
+        )
+
+    def facet_counts(self, dataset_ids, batch_size: int = STREAM_BATCH_SIZE) -> dict:
+        """
+        Counters of the datasets among `dataset_ids` per publication type, tag, author name and creation year.
+        Each is a GROUP BY statement per batch of ids, so no dataset row is loaded.
+        """
+        counts = {'publication_type': Counter(), 'tags': Counter(), 'authors': Counter(), 'year': Counter()}
+        year = extract('year', DataSet.created_at)
+        for start in range(0, len(dataset_ids), batch_size):
+            in_batch = DataSet.id.in_(dataset_ids[start:start + batch_size])
+            queries = {
+                'publication_type': db.session.query(DSMetaData.publication_type, func.count(DataSet.id))
+                .select_from(DataSet).join(DSMetaData, DataSet.ds_meta_data)
+                .filter(in_batch).group_by(DSMetaData.publication_type),
+                'tags': db.session.query(Tag.name, func.count(DataSet.id))
+                .select_from(DataSet)
+                .join(ds_meta_data_tag, ds_meta_data_tag.c.ds_meta_data_id == DataSet.ds_meta_data_id)
+                .join(Tag, Tag.id == ds_meta_data_tag.c.tag_id)
+                .filter(in_batch).group_by(Tag.name),
+                # A dataset listing the same name twice counts once
+                'authors': db.session.query(Author.name, func.count(distinct(DataSet.id)))
+                .select_from(DataSet).join(Author, Author.ds_meta_data_id == DataSet.ds_meta_data_id)
+                .filter(in_batch).group_by(Author.name),
+                'year': db.session.query(year, func.count(DataSet.id)).filter(in_batch).group_by(year),
+            }
+            for facet, query in queries.items():
+                counts[facet].update(dict(query.all()))
+        return counts
 
-        if min_size_filter is not None:
-            results = [ds for ds in results if ds.get_file_total_size() >= min_size_filter]
+    def get_datasets_by_ids(self, dataset_ids):
+        if not dataset_ids:
+            return []
+        datasets = (
+            db.session.query(DataSet)
+            .options(*dataset_loading_profile('listing'))
+            .filter(DataSet.id.in_(dataset_ids))
+            .all()
+        )
+        # Keep the order of the cached results
+        datasets_by_id = {dataset.id: dataset for dataset in datasets}
+        return [datasets_by_id[dataset_id] for dataset_id in dataset_ids if dataset_id in datasets_by_id]
 
-        if max_size_filter is not None:
-            results = [ds for ds in results if ds.get_file_total_size() <= max_size_filter]
+    def get_dataset_cards(self, dataset_ids) -> list:
+        """
+        The columns shown on an explore card, in the order of `dataset_ids`, as plain dicts.
 
-        if uvl_min.isdigit() or uvl_max.isdigit():
-            results = [
-                ds for ds in results
-                if num_uvls(ds, uvl_min, uvl_max)
-            ]
+        Only the needed columns are selected, the file count and size are aggregated in SQL and the authors
+        are fetched in one more statement, so no ORM object is built for datasets, files or authors.
+        """
+        if not dataset_ids:
+            return []
 
-        return results
+        files = (
+            db.session.query(
+                FeatureModel.data_set_id.label('data_set_id'),
+                func.count(Hubfile.id).label('files_count'),
+                func.sum(Hubfile.size).label('total_size'),
+            )
+            .join(Hubfile, Hubfile.feature_model_id == FeatureModel.id)
+            .filter(FeatureModel.data_set_id.in_(dataset_ids))
+            .group_by(FeatureModel.data_set_id)
+            .subquery()
+        )
+        rows = (
+            db.session.query(
+                DataSet.id,
+                DataSet.created_at,
+                DSMetaData.id.label('ds_meta_data_id'),
+                DSMetaData.title,
+                DSMetaData.publication_type,
+                DSMetaData.dataset_doi,
+                DSMetaData.tags,
+                files.c.files_count,
+                files.c.total_size,
+            )
+            .join(DSMetaData, DataSet.ds_meta_data)
+            .outerjoin(files, files.c.data_set_id == DataSet.id)
+            .filter(DataSet.id.in_(dataset_ids))
+            .all()
+        )
 
+        authors = {}
+        author_rows = (
+            db.session.query(Author.ds_meta_data_id, Author.name, Author.affiliation, Author.orcid)
+            .filter(Author.ds_meta_data_id.in_([row.ds_meta_data_id for row in rows]))
+            .order_by(Author.id)
+        )
+        for author in author_rows:
+            authors.setdefault(author.ds_meta_data_id, []).append(
+                {'name': author.name, 'affiliation': author.affiliation, 'orcid': author.orcid}
+            )
+
+        cards = {
+            row.id: {
+                'id': row.id,
+                'created_at': row.created_at,
+                'title': row.title,
+                'publication_type': row.publication_type,
+                'dataset_doi': row.dataset_doi,
+                'tags': row.tags,
+                'files_count': row.files_count or 0,
+                'total_size': row.total_size or 0,
+                'authors': authors.get(row.ds_meta_data_id, []),
+            }
+            for row in rows
+        }
+        return [cards[dataset_id] for dataset_id in dataset_ids if dataset_id in cards]
+
+    def iter_dataset_cards(self, dataset_ids, batch_size: int = STREAM_BATCH_SIZE):
+        """The cards of `dataset_ids` in order, fetched one batch of ids at a time."""
+        for start in range(0, len(dataset_ids), batch_size):
+            yield from self.get_dataset_cards(dataset_ids[start:start + batch_size])
+
+    def get_indexed_datasets(self, data_set_ids=None, feature_model_ids=None, ds_meta_data_ids=None,
+                             fm_meta_data_ids=None):
+        """
+        Datasets with everything the in-memory explore indexes are built from. Without ids, every dataset;
+        otherwise the datasets with any of the given ids, feature model ids or metadata ids.
+        """
+        query = db.session.query(DataSet).options(
+            *dataset_loading_profile('detail'),
+            selectinload(DataSet.feature_models).selectinload(FeatureModel.files)
+            .selectinload(Hubfile.feature_names),
+        )
+        if data_set_ids is None and feature_model_ids is None and ds_meta_data_ids is None \
+                and fm_meta_data_ids is None:
+            return query.all()
+
+        return query.filter(or_(
+            DataSet.id.in_(data_set_ids or []),
+            DataSet.ds_meta_data_id.in_(ds_meta_data_ids or []),
+            DataSet.id.in_(
+                db.session.query(FeatureModel.data_set_id).filter(or_(
+                    FeatureModel.id.in_(feature_model_ids or []),
+                    FeatureModel.fm_meta_data_id.in_(fm_meta_data_ids or []),
+                ))
+            ),
+        )).all()
+
+
+class SavedSearchRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(SavedSearch)
+
+    def get_by_user(self, user_id: int) -> list:
+        return self.model.query.filter_by(user_id=user_id).order_by(SavedSearch.id).all()
+
+    def get_for_user(self, user_id: int, saved_search_id: int):
+        return self.model.query.filter_by(id=saved_search_id, user_id=user_id).first()
+
+    def get_candidates(self, terms) -> list:
+        """The saved searches indexed under any of the (field, value) terms, through the terms index."""
+        matching = db.session.query(SavedSearchTerm.saved_search_id).filter(
+            tuple_(SavedSearchTerm.field, SavedSearchTerm.value).in_(list(terms))
+        )
+        return self.model.query.filter(SavedSearch.id.in_(matching)).all()
+
+    def count_new(self, user_id: int) -> dict:
+        """Number of matches past the last check of every saved search of the user, by saved search id."""
+        rows = (
+            db.session.query(SavedSearch.id, func.count(SavedSearchMatch.id))
+            .join(SavedSearchMatch, and_(SavedSearchMatch.saved_search_id == SavedSearch.id,
+                                         SavedSearchMatch.id > SavedSearch.last_match_id))
+            .filter(SavedSearch.user_id == user_id)
+            .group_by(SavedSearch.id)
+        )
+        return dict(rows.all())
+
+
+class SavedSearchMatchRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(SavedSearchMatch)
 
-def num_uvls(dataset, num_min, num_max):
-    max_valid = num_max.isdigit()
-    min_valid = num_min.isdigit()
-    number = dataset.get_files_count()
+    def get_matched_search_ids(self, data_set_id: int) -> set:
+        rows = db.session.query(SavedSearchMatch.saved_search_id).filter_by(data_set_id=data_set_id)
+        return {saved_search_id for saved_search_id, in rows}
 
-    if min_valid and max_valid:
-        return number >= int(num_min) and number <= int(num_max)
-    else:
-        return (min_valid and number >= int(num_min)
-                or max_valid and number <= int(num_max))
+    def get_after(self, saved_search_id: int, last_id: int, limit: int) -> list:
+        return (
+            self.model.query
+            .filter(SavedSearchMatch.saved_search_id == saved_search_id, SavedSearchMatch.id > last_id)
+            .order_by(SavedSearchMatch.id)
+            .limit(limit)
+            .all()
+        )
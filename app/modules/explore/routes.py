@@ -1,7 +1,11 @@
-from flask import render_template, request, jsonify
+from flask import abort, render_template, request, jsonify
+from flask_login import current_user, login_required
+from app.modules.dataset.services import DataSetSerializer, DataSetService
 from app.modules.explore import explore_bp
 from app.modules.explore.forms import ExploreForm
-from app.modules.explore.services import ExploreService
+from app.modules.explore.query import QueryError
+from app.modules.explore.services import ExploreService, SavedSearchService
+from core.resources.streaming import ndjson_response, wants_ndjson
 
 
 @explore_bp.route('/explore', methods=['GET', 'POST'])
@@ -20,5 +24,85 @@ def index():
         publication_type = criteria.get("publication_type", "any")
 
         # Llama al servicio de exploración con los parámetros
-        datasets = ExploreService().filter(query_string, sorting, publication_type)
-        return jsonify([dataset.to_dict() for dataset in datasets])
+        explore_service = ExploreService()
+        ndjson = wants_ndjson()
+        try:
+            # Facets are only part of the JSON response: a stream only needs the ids before its first line
+            dataset_ids, facets = explore_service.search_ids(query_string, sorting, publication_type,
+                                                             facets=not ndjson)
+        except QueryError as error:
+            return jsonify({"errors": error.errors}), 400
+        serializer = DataSetSerializer()
+        if ndjson:
+            # One card per line, read in batches
+            return ndjson_response(serializer.serialize_card(card) for card in explore_service.iter_cards(dataset_ids))
+        serialized = [serializer.serialize_card(card) for card in explore_service.get_cards(dataset_ids)]
+
+        if criteria.get("facets"):
+            return jsonify({"datasets": serialized, "facets": facets})
+        return jsonify(serialized)
+
+
+@explore_bp.route('/explore/datasets/<int:dataset_id>', methods=['GET'])
+def dataset_detail(dataset_id):
+    dataset = DataSetService().get_or_404(dataset_id)
+    return jsonify(DataSetSerializer().serialize(dataset))
+
+
+@explore_bp.route('/explore/tags', methods=['GET'])
+def tag_cloud():
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify(ExploreService().tag_cloud(limit))
+
+
+@explore_bp.route('/explore/suggest', methods=['GET'])
+def suggest():
+    prefix = request.args.get('q', '')
+    limit = min(request.args.get('limit', 10, type=int), 20)
+    return jsonify(ExploreService().suggest(prefix, limit))
+
+
+@explore_bp.route('/explore/saved-searches', methods=['GET'])
+@login_required
+def saved_searches():
+    return jsonify(SavedSearchService().get_by_user(current_user.id))
+
+
+@explore_bp.route('/explore/saved-searches', methods=['POST'])
+@login_required
+def create_saved_search():
+    data = request.get_json() or {}
+    name = (data.get("name") or "").strip()
+    if not name:
+        return jsonify({"errors": [{"code": "missing_name", "message": "A name is required"}]}), 400
+
+    try:
+        saved_search = SavedSearchService().create(current_user.id, name[:120], data.get("query", ""),
+                                                   data.get("publication_type", "any"))
+    except QueryError as error:
+        return jsonify({"errors": error.errors}), 400
+    return jsonify(saved_search.to_dict()), 201
+
+
+@explore_bp.route('/explore/saved-searches/<int:saved_search_id>', methods=['DELETE'])
+@login_required
+def delete_saved_search(saved_search_id):
+    service = SavedSearchService()
+    saved_search = service.get_for_user(current_user.id, saved_search_id)
+    if saved_search is None:
+        abort(404)
+    service.delete(saved_search)
+    return '', 204
+
+
+@explore_bp.route('/explore/saved-searches/<int:saved_search_id>/new', methods=['GET'])
+@login_required
+def saved_search_feed(saved_search_id):
+    service = SavedSearchService()
+    saved_search = service.get_for_user(current_user.id, saved_search_id)
+    if saved_search is None:
+        abort(404)
+
+    dataset_ids = service.new_since_last_check(saved_search)
+    serializer = DataSetSerializer()
+    return jsonify([serializer.serialize_card(card) for card in ExploreService().get_cards(dataset_ids)])
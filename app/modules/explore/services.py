@@ -1,4 +1,395 @@
-from app.modules.explore.repositories import ExploreRepository
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.modules.dataset.models import Author, DSMetaData, DSMetrics, DataSet, name_tokens
+from app.modules.dataset.repositories import TagRepository
+from app.modules.explore.models import SavedSearch, SavedSearchMatch, SavedSearchTerm
+from app.modules.explore.query import Document, QueryError, anchor_terms, compile_query, matches, plan_query
+from app.modules.explore.repositories import ExploreRepository, SavedSearchMatchRepository, SavedSearchRepository
+from app.modules.featuremodel.models import FMMetaData, FeatureModel
+from app.modules.hubfile.models import Hubfile
+from core.caches.result_cache import ResultCache
+from core.caches.single_flight import SingleFlight
+from core.services.BaseService import BaseService
+from core.search.prefix_trie import PrefixTrie
+from core.search.trigram_index import TrigramIndex
+
+logger = logging.getLogger(__name__)
+
+# Number of tags and authors returned in the facets
+FACET_LIMIT = 10
+
+# Writes to any of these models can change the result of an explore query
+INVALIDATING_MODELS = (DataSet, DSMetaData, DSMetrics, Author, FeatureModel, Hubfile)
+
+
+def explore_cache_generation_path() -> str:
+    # In the uploads volume, which the web and worker containers share, so the metrics stored by the
+    # analysis jobs invalidate the searches of every web worker
+    return os.getenv('EXPLORE_CACHE_GENERATION_FILE') or os.path.join(os.getenv('WORKING_DIR', ''), 'uploads',
+                                                                      'cache', 'explore_generation')
+
+
+# Processes that do not share the generation file only see each other's writes once the TTL expires
+explore_cache = ResultCache(
+    ttl=float(os.getenv('EXPLORE_CACHE_TTL', '60')),
+    max_entries=int(os.getenv('EXPLORE_CACHE_MAX_ENTRIES', '1024')),
+    shared_path=explore_cache_generation_path(),
+)
+
+# Identical searches in flight are computed once per worker, or once per host when a lock directory
+# shared by all the gunicorn workers is configured
+explore_flight = SingleFlight(lock_dir=os.getenv('EXPLORE_SINGLE_FLIGHT_DIR') or None)
+
+
+def normalize_criteria(query_string: str, sorting="newest", publication_type="any") -> tuple:
+    """
+    Builds a canonical cache key for an explore search from its compiled query, so searches that only differ
+    in case, order, duplicated or implied filters share the key. Unknown sortings fall back to the default.
+    Raises QueryError for unknown filters.
+    """
+    plan = compile_query(query_string or "", publication_type)
+    return plan.query.key, "oldest" if sorting == "oldest" else "newest"
+
+
+def compute_facets(counts: dict, limit: int = FACET_LIMIT) -> dict:
+    """
+    The facets of a search from the counters of ExploreRepository.facet_counts(): every publication type and
+    year, and the `limit` most frequent tags and authors.
+    """
+    def most_common(counter: Counter) -> list:
+        ranked = sorted(counter.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [{'value': value, 'count': count} for value, count in ranked]
+
+    return {
+        'publication_type': [
+            {'value': publication_type.value, 'label': publication_type.name.replace('_', ' ').title(),
+             'count': count}
+            for publication_type, count in sorted(counts['publication_type'].items(),
+                                                  key=lambda item: (-item[1], item[0].value))
+        ],
+        'tags': most_common(counts['tags']),
+        'authors': most_common(counts['authors']),
+        'year': [{'value': year, 'count': count} for year, count in sorted(counts['year'].items(), reverse=True)],
+    }
+
+
+def invalidate_explore_cache(session, flush_context=None):
+    changed = list(session.new) + list(session.dirty) + list(session.deleted)
+    if any(isinstance(instance, INVALIDATING_MODELS) for instance in changed):
+        session.info['explore_cache_dirty'] = True
+        explore_cache.bump_generation()
+
+
+def invalidate_explore_cache_on_commit(session):
+    # Bump again once the data is visible, so a search computed between flush and commit is discarded
+    if session.info.pop('explore_cache_dirty', False):
+        explore_cache.bump_generation()
+
+
+event.listen(Session, 'after_flush', invalidate_explore_cache)
+event.listen(Session, 'after_commit', invalidate_explore_cache_on_commit)
+
+
+# Words of a title or name from which completions start: "Sample dataset" is suggested for "sam" and "dat"
+SUGGESTION_MAX_WORDS = 8
+
+# Fuzzy matching kicks in when the exact search returns fewer datasets than this
+FUZZY_MIN_RESULTS = int(os.getenv('EXPLORE_FUZZY_MIN_RESULTS', '1'))
+# Minimum trigram similarity between a query word and an indexed word
+FUZZY_THRESHOLD = float(os.getenv('EXPLORE_FUZZY_THRESHOLD', '0.3'))
+# Shorter words have too few trigrams to be matched reliably
+FUZZY_MIN_WORD_LENGTH = 3
+
+
+def suggestion_keys(text: str) -> set:
+    tokens = name_tokens(text)
+    return {' '.join(tokens[start:]) for start in range(min(len(tokens), SUGGESTION_MAX_WORDS))}
+
+
+def suggestion_terms(dataset) -> set:
+    """(type, value) pairs a dataset contributes to the suggestions, loaded by get_indexed_datasets()."""
+    ds_meta_data = dataset.ds_meta_data
+    terms = {('title', ds_meta_data.title)}
+    terms.update(('tag', tag) for tag in ds_meta_data.get_tag_names())
+    terms.update(('author', author.name) for author in ds_meta_data.authors)
+
+    for feature_model in dataset.feature_models:
+        fm_meta_data = feature_model.fm_meta_data
+        if fm_meta_data is None:
+            continue
+        terms.add(('model', fm_meta_data.title))
+        terms.update(('tag', tag) for tag in fm_meta_data.get_tag_names())
+        terms.update(('author', author.name) for author in fm_meta_data.authors)
+        for hubfile in feature_model.files:
+            terms.update(('feature', feature_name.name) for feature_name in hubfile.feature_names)
+    return terms
+
+
+def fuzzy_words(text: str) -> set:
+    return {word for word in name_tokens(text) if len(word) >= FUZZY_MIN_WORD_LENGTH}
+
+
+class DatasetIndex:
+    """
+    Base of the in-memory indexes over the datasets.
+
+    A background thread of each process, started by the first lookup, builds the index and keeps it up to
+    date, so lookups never touch the database. Writes only record which datasets changed and wake the thread,
+    which reloads those datasets and updates the index. Every `ttl` seconds the thread builds a whole new
+    index aside, to pick up the writes made by other workers, and swaps it in at once. Lookups find nothing
+    until the first build is done.
+    """
+
+    def __init__(self, ttl: float = 600):
+        self.ttl = ttl
+        self._pending = {'data_set': set(), 'feature_model': set(), 'ds_meta_data': set(), 'fm_meta_data': set()}
+        self._state = self._empty()
+        self._built_at = None
+        self._updating = False
+        self._clears = 0
+        self._pid = None
+        self._lock = threading.Lock()
+        self._updated = threading.Condition(self._lock)
+        self._wake = threading.Event()
+
+    def mark_dirty(self, pending: dict) -> None:
+        with self._lock:
+            for kind, ids in pending.items():
+                self._pending[kind].update(ids)
+        self._wake.set()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._state = self._empty()
+            self._built_at = None
+            self._clears += 1
+            for ids in self._pending.values():
+                ids.clear()
+        self._wake.set()
+
+    def ensure_started(self, app) -> None:
+        # The thread belongs to the process that started it: a forked web worker starts its own
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, args=(app,), name=f'{type(self).__name__}-refresh', daemon=True).start()
+
+    @property
+    def built(self) -> bool:
+        return self._built_at is not None
+
+    def wait_until_current(self, timeout: float = 10) -> bool:
+        """Waits until the index is built and holds every change recorded so far. False after `timeout`."""
+        with self._updated:
+            return self._updated.wait_for(
+                lambda: self._built_at is not None and not self._updating and not any(self._pending.values()),
+                timeout,
+            )
+
+    def refresh(self, repository: ExploreRepository) -> None:
+        """
+        Rebuilds the index when it is older than the TTL, and otherwise reloads the datasets that changed. The
+        datasets are read without holding the lock, so lookups go on meanwhile.
+        """
+        with self._lock:
+            rebuild = self._built_at is None or time.monotonic() - self._built_at > self.ttl
+            pending = {kind: set(ids) for kind, ids in self._pending.items()}
+            for ids in self._pending.values():
+                ids.clear()
+            if not rebuild and not any(pending.values()):
+                return
+            self._updating = True
+            clears = self._clears
+
+        try:
+            if rebuild:
+                state = self._empty()
+                for dataset in repository.get_indexed_datasets():
+                    self._index(state, dataset.id, dataset)
+                datasets, deleted = [], set()
+            else:
+                datasets = repository.get_indexed_datasets(**{f'{kind}_ids': ids for kind, ids in pending.items()})
+                deleted = pending['data_set'] - {dataset.id for dataset in datasets}
+
+            with self._lock:
+                if self._clears != clears:
+                    # Cleared meanwhile: the next pass builds it again
+                    return
+                if rebuild:
+                    self._state = state
+                    self._built_at = time.monotonic()
+                for dataset in datasets:
+                    self._index(self._state, dataset.id, dataset)
+                for dataset_id in deleted:
+                    self._index(self._state, dataset_id, None)
+        finally:
+            with self._lock:
+                self._updating = False
+                self._updated.notify_all()
+
+    def _run(self, app) -> None:
+        with app.app_context():
+            repository = ExploreRepository()
+            while True:
+                self._wake.clear()
+                try:
+                    self.refresh(repository)
+                except Exception as exc:
+                    logger.exception(f"Could not refresh the {type(self).__name__}: {exc}")
+                finally:
+                    # Nothing is kept in the session between passes, so each one reads fresh data
+                    repository.session.remove()
+
+                with self._lock:
+                    built_at = self._built_at
+                if built_at is None:
+                    self._wake.wait(DATASET_INDEX_RETRY_SECONDS)
+                else:
+                    self._wake.wait(max(0.0, built_at + self.ttl - time.monotonic()))
+
+    def _empty(self):
+        """A new, empty index."""
+        raise NotImplementedError
+
+    def _index(self, state, dataset_id: int, dataset) -> None:
+        """Replaces what the index `state` holds for a dataset. `dataset` is None when it was deleted."""
+        raise NotImplementedError
+
+
+class SuggestionIndex(DatasetIndex):
+    """
+    Typeahead over dataset titles, tags, authors, feature model titles and feature names, weighted by the
+    number of datasets each entry appears in.
+    """
+
+    def __init__(self, ttl: float = 600, top_k: int = 20):
+        self.top_k = top_k
+        super().__init__(ttl)
+
+    @property
+    def trie(self) -> PrefixTrie:
+        return self._state.trie
+
+    def suggest(self, prefix: str, limit: int = 10) -> list:
+        key = ' '.join(name_tokens(prefix))
+        if not key:
+            return []
+        with self._lock:
+            completions = self._state.trie.complete(key, limit)
+        return [{'type': kind, 'value': value, 'count': count} for (kind, value), count in completions]
+
+    def _empty(self):
+        return SimpleNamespace(trie=PrefixTrie(top_k=self.top_k), terms={})
+
+    def _index(self, state, dataset_id: int, dataset) -> None:
+        terms = suggestion_terms(dataset) if dataset is not None else set()
+        previous = state.terms.pop(dataset_id, set())
+        for kind, value in previous - terms:
+            for key in suggestion_keys(value):
+                state.trie.remove(key, (kind, value))
+        for kind, value in terms - previous:
+            for key in suggestion_keys(value):
+                state.trie.add(key, (kind, value))
+        if terms:
+            state.terms[dataset_id] = terms
+
+
+class FuzzyIndex(DatasetIndex):
+    """Trigram index over the words of dataset titles, tags and author names, pointing to dataset ids."""
+
+    @property
+    def trigrams(self) -> TrigramIndex:
+        return self._state.trigrams
+
+    def search(self, text: str, threshold: float = FUZZY_THRESHOLD) -> dict:
+        """
+        Scores the datasets in which every word of `text` has a similar word. The score is the mean
+        similarity of the closest words. Words too short to be matched are ignored.
+        """
+        scores = None
+        words = fuzzy_words(text)
+        with self._lock:
+            for word in words:
+                matches = self._state.trigrams.search(word, threshold)
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {dataset_id: scores[dataset_id] + similarity
+                              for dataset_id, similarity in matches.items() if dataset_id in scores}
+        return {dataset_id: score / len(words) for dataset_id, score in (scores or {}).items()}
+
+    def _empty(self):
+        return SimpleNamespace(trigrams=TrigramIndex(), words={})
+
+    def _index(self, state, dataset_id: int, dataset) -> None:
+        words = Counter()
+        if dataset is not None:
+            ds_meta_data = dataset.ds_meta_data
+            words.update(fuzzy_words(ds_meta_data.title))
+            words.update(fuzzy_words(' '.join(ds_meta_data.get_tag_names())))
+            words.update(fuzzy_words(' '.join(author.name for author in ds_meta_data.authors)))
+
+        for word in state.words.pop(dataset_id, set()):
+            state.trigrams.remove(word, dataset_id)
+        for word in words:
+            state.trigrams.add(word, dataset_id)
+        if words:
+            state.words[dataset_id] = set(words)
+
+
+DATASET_INDEX_TTL = float(os.getenv('EXPLORE_INDEX_TTL', '600'))
+# Seconds before the background thread tries again after failing to build an index
+DATASET_INDEX_RETRY_SECONDS = 5
+suggestion_index = SuggestionIndex(ttl=DATASET_INDEX_TTL)
+fuzzy_index = FuzzyIndex(ttl=DATASET_INDEX_TTL)
+DATASET_INDEXES = (suggestion_index, fuzzy_index)
+
+
+def track_dataset_changes(session, flush_context=None):
+    pending = session.info.setdefault('dataset_index_pending', {
+        'data_set': set(), 'feature_model': set(), 'ds_meta_data': set(), 'fm_meta_data': set()
+    })
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, DataSet):
+            pending['data_set'].add(instance.id)
+        elif isinstance(instance, FeatureModel):
+            pending['data_set'].add(instance.data_set_id)
+        elif isinstance(instance, Hubfile):
+            pending['feature_model'].add(instance.feature_model_id)
+        elif isinstance(instance, DSMetaData):
+            pending['ds_meta_data'].add(instance.id)
+        elif isinstance(instance, FMMetaData):
+            pending['fm_meta_data'].add(instance.id)
+        elif isinstance(instance, Author):
+            pending['ds_meta_data'].add(instance.ds_meta_data_id)
+            pending['fm_meta_data'].add(instance.fm_meta_data_id)
+
+
+def apply_dataset_changes(session):
+    # Only committed changes are reloaded, so a lookup never indexes data that is later rolled back
+    pending = session.info.pop('dataset_index_pending', None)
+    if pending:
+        for index in DATASET_INDEXES:
+            index.mark_dirty({kind: ids - {None} for kind, ids in pending.items()})
+
+
+def discard_dataset_changes(session):
+    session.info.pop('dataset_index_pending', None)
+
+
+event.listen(Session, 'after_flush', track_dataset_changes)
+event.listen(Session, 'after_commit', apply_dataset_changes)
+event.listen(Session, 'after_rollback', discard_dataset_changes)
 
 
 class ExploreService:
@@ -7,5 +398,191 @@ class ExploreService:
 
     def filter(self, query_string: str, sorting="newest", publication_type="any"):
         """Filtra los datasets a partir de una cadena de consulta."""
+        datasets, _ = self.search(query_string, sorting, publication_type)
+        return datasets
+
+    def search(self, query_string: str, sorting="newest", publication_type="any"):
+        """Returns the datasets matching the search and their facet counts."""
+        dataset_ids, facets = self.search_ids(query_string, sorting, publication_type)
+        return self.repository.get_datasets_by_ids(dataset_ids), facets
+
+    def search_ids(self, query_string: str, sorting="newest", publication_type="any", facets: bool = True):
+        """
+        Returns the ids of the datasets matching the search and their facet counts. Both are cached
+        together under the normalized search key. With `facets` False, an uncached search only runs the
+        id query, is not cached and returns None facets.
+        """
+        key = normalize_criteria(query_string, sorting, publication_type)
+        fuzzy_index.ensure_started(current_app._get_current_object())
+
+        result = explore_cache.get(key)
+        if result is None and not facets:
+            return self.matching_ids(query_string, sorting, publication_type), None
+        if result is None:
+            generation = explore_cache.generation
+
+            def compute():
+                dataset_ids = self.matching_ids(query_string, sorting, publication_type)
+                return {
+                    'dataset_ids': dataset_ids,
+                    'facets': compute_facets(self.repository.facet_counts(dataset_ids)),
+                }
+
+            # Results shared by other workers are only taken when computed after the last write seen here
+            result = explore_flight.do(key, compute, not_before=explore_cache.bumped_at)
+            # Until the fuzzy index is built the fuzzy matches are missing, so the result is not kept
+            if fuzzy_index.built:
+                explore_cache.set(key, result, generation)
+
+        return result['dataset_ids'], result['facets']
+
+    def matching_ids(self, query_string: str, sorting="newest", publication_type="any") -> list:
+        """Ids of the datasets matching the search, followed by the fuzzy matches when there are too few."""
         # Pasa los parámetros adicionales al repositorio
-        return self.repository.filter_datasets(query_string, sorting, publication_type)
+        dataset_ids = self.repository.filter_datasets(query_string, sorting, publication_type)
+        if len(dataset_ids) < FUZZY_MIN_RESULTS:
+            dataset_ids = dataset_ids + self.fuzzy_search(query_string, sorting, publication_type,
+                                                          exclude=dataset_ids)
+        return dataset_ids
+
+    def get_cards(self, dataset_ids) -> list:
+        return self.repository.get_dataset_cards(dataset_ids)
+
+    def iter_cards(self, dataset_ids):
+        return self.repository.iter_dataset_cards(dataset_ids)
+
+    def fuzzy_search(self, query_string: str, sorting="newest", publication_type="any", exclude=()):
+        """
+        Ids of the datasets whose titles, tags or authors approximately match the free-text part of the search,
+        most similar first. The other filters are applied as usual. Dataset ids in `exclude` are left out.
+        The fuzzy index is kept by its background thread, so none are found until it is built.
+        """
+        plan = compile_query(query_string or "", publication_type)
+        free_text = plan.query.values('text')
+        if not free_text:
+            return []
+
+        scores = None
+        for text in free_text:
+            matches = fuzzy_index.search(text)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {dataset_id: scores[dataset_id] + score
+                          for dataset_id, score in matches.items() if dataset_id in scores}
+
+        excluded = set(exclude)
+        dataset_ids = [dataset_id for dataset_id in scores if dataset_id not in excluded]
+        if not dataset_ids:
+            return []
+
+        dataset_ids = self.repository.filter_datasets(plan_query(plan.query.without('text')), sorting,
+                                                      dataset_ids=dataset_ids)
+        # sorted() is stable: equally similar datasets keep the requested order
+        return sorted(dataset_ids, key=lambda dataset_id: -scores[dataset_id])
+
+    def suggest(self, prefix: str, limit: int = 10) -> list:
+        suggestion_index.ensure_started(current_app._get_current_object())
+        return suggestion_index.suggest(prefix, limit)
+
+    def tag_cloud(self, limit: int = 50) -> list:
+        return [{'value': name, 'count': count} for name, count in TagRepository().tag_cloud(limit)]
+
+
+# Matches returned per call of the "new since last check" feed of a saved search
+SAVED_SEARCH_FEED_LIMIT = 100
+
+
+def percolation_document(dataset) -> Document:
+    """The Document a saved search is matched against, from a dataset loaded by get_indexed_datasets()."""
+    ds_meta_data = dataset.ds_meta_data
+    hubfiles = [hubfile for feature_model in dataset.feature_models for hubfile in feature_model.files]
+    metrics = ds_meta_data.ds_metrics
+    return Document(
+        title=ds_meta_data.title.lower(),
+        publication_type=ds_meta_data.publication_type.name,
+        tags=frozenset(ds_meta_data.get_tag_names()),
+        features=frozenset(name.name for hubfile in hubfiles for name in hubfile.feature_names),
+        constraints=frozenset(name.name for hubfile in hubfiles for name in hubfile.constraint_names),
+        authors=tuple(
+            frozenset(token.token for token in author.identity.tokens)
+            for author in ds_meta_data.authors if author.identity is not None
+        ),
+        files=len(hubfiles),
+        size=sum(hubfile.size for hubfile in hubfiles),
+        number_of_features=metrics.number_of_features if metrics else None,
+        cross_tree_constraints=metrics.cross_tree_constraints if metrics else None,
+        max_depth=metrics.max_depth if metrics else None,
+        configurations=metrics.configurations if metrics else None,
+    )
+
+
+class SavedSearchService(BaseService):
+    """
+    Saved explore searches, matched percolator-style: each new or synchronized dataset is checked once
+    against the saved searches indexed under its tags, features or publication type, and every match is
+    recorded, so the feeds only read the matches.
+    """
+
+    def __init__(self):
+        super().__init__(SavedSearchRepository())
+        self.match_repository = SavedSearchMatchRepository()
+        self.explore_repository = ExploreRepository()
+
+    def get_by_user(self, user_id: int) -> list:
+        new = self.repository.count_new(user_id)
+        return [dict(saved_search.to_dict(), new=new.get(saved_search.id, 0))
+                for saved_search in self.repository.get_by_user(user_id)]
+
+    def get_for_user(self, user_id: int, saved_search_id: int):
+        return self.repository.get_for_user(user_id, saved_search_id)
+
+    def create(self, user_id: int, name: str, query: str = "", publication_type: str = "any") -> SavedSearch:
+        """Raises QueryError when the query does not compile."""
+        plan = compile_query(query, publication_type)
+        saved_search = SavedSearch(user_id=user_id, name=name, query_string=query,
+                                   publication_type=publication_type)
+        saved_search.terms = [SavedSearchTerm(field=field, value=value[:255])
+                              for field, value in anchor_terms(plan)]
+        self.repository.session.add(saved_search)
+        self.repository.session.commit()
+        return saved_search
+
+    def delete(self, saved_search: SavedSearch) -> None:
+        self.repository.session.delete(saved_search)
+        self.repository.session.commit()
+
+    def percolate(self, dataset_id: int) -> list:
+        """Records the saved searches the dataset matches and has not matched yet, and returns their ids."""
+        datasets = self.explore_repository.get_indexed_datasets(data_set_ids=[dataset_id])
+        if not datasets:
+            return []
+        document = percolation_document(datasets[0])
+
+        already_matched = self.match_repository.get_matched_search_ids(dataset_id)
+        matched = []
+        for saved_search in self.repository.get_candidates(document.terms()):
+            if saved_search.id in already_matched:
+                continue
+            try:
+                plan = compile_query(saved_search.query_string, saved_search.publication_type)
+            except QueryError:
+                # Saved with a filter that no longer exists
+                continue
+            if matches(plan, document):
+                self.repository.session.add(SavedSearchMatch(saved_search_id=saved_search.id, data_set_id=dataset_id))
+                matched.append(saved_search.id)
+
+        self.repository.session.commit()
+        return matched
+
+    def new_since_last_check(self, saved_search: SavedSearch, limit: int = SAVED_SEARCH_FEED_LIMIT) -> list:
+        """
+        Ids of the datasets matched since the previous call, oldest first, and moves the check forward. At
+        most `limit` are returned; the rest come with the next calls.
+        """
+        new_matches = self.match_repository.get_after(saved_search.id, saved_search.last_match_id, limit)
+        if new_matches:
+            saved_search.last_match_id = new_matches[-1].id
+            self.repository.session.commit()
+        return [match.data_set_id for match in new_matches]
@@ -1,7 +1,25 @@
-import pytest
+import json
+import threading
+import time
+from types import SimpleNamespace
 
-from app.modules.dataset.models import PublicationType
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.modules.conftest import login, logout
+from app.modules.dataset.models import DataSet, PublicationType
+from app.modules.explore.query import Predicate, QueryError, compile_query, matches, parse_query
+from app.modules.explore.repositories import ExploreRepository
+from app.modules.explore.services import (
+    DATASET_INDEXES, DatasetIndex, SavedSearchService, explore_cache, fuzzy_index, normalize_criteria,
+    percolation_document, suggestion_index
+)
 from app.modules.utils.utilsdb import create_dataset_db
+from core.caches.result_cache import ResultCache
+from core.caches.single_flight import SingleFlight
+from core.search.prefix_trie import PrefixTrie
+from core.search.trigram_index import TrigramIndex, trigrams
 
 
 @pytest.fixture(scope='module')
@@ -20,6 +38,12 @@ def test_client(test_client):
         create_dataset_db(5, PublicationType.BOOK, tags="tag1,tag2", total_file_size=8000, num_files=3)
         create_dataset_db(6, PublicationType.REPORT, valid=False, tags="tag3", total_file_size=2000, num_files=1)
 
+    # Explore searches are only cached once the fuzzy index is built
+    for index in DATASET_INDEXES:
+        index.clear()
+    fuzzy_index.ensure_started(test_client.application)
+    assert fuzzy_index.wait_until_current()
+
     yield test_client
 
 
@@ -260,6 +284,38 @@ def test_filter_by_tags(test_client):
     assert num == 0, f"Wrong number of datasets for tags filter 'tag3': {num}"
 
 
+def test_filter_by_tags_exact_and_or(test_client):
+    # Tags are matched exactly: "tag" is not a substring match of "tag1" anymore
+    search_criteria = get_search_criteria(query="tags:tag")
+    response = test_client.post("/explore", json=search_criteria)
+    num = len(response.get_json())
+    assert num == 0, f"Wrong number of datasets for tags filter 'tag': {num}"
+
+    search_criteria = get_search_criteria(query="tags:tag2|tag3")
+    response = test_client.post("/explore", json=search_criteria)
+    num = len(response.get_json())
+    assert num == 5, f"Wrong number of datasets for tags filter 'tag2|tag3': {num}"
+
+    search_criteria = get_search_criteria(query="tags:TAG2, tag1")
+    response = test_client.post("/explore", json=search_criteria)
+    num = len(response.get_json())
+    assert num == 2, f"Wrong number of datasets for tags filter 'TAG2, tag1': {num}"
+
+    search_criteria = get_search_criteria(query="tags:tag1,tag2|tag3")
+    response = test_client.post("/explore", json=search_criteria)
+    num = len(response.get_json())
+    assert num == 3, f"Wrong number of datasets for tags filter 'tag1,tag2|tag3': {num}"
+
+
+def test_tag_cloud(test_client):
+    response = test_client.get("/explore/tags")
+    assert response.status_code == 200
+    tags = {item["value"]: item["count"] for item in response.get_json()}
+    assert tags["tag1"] == 4
+    assert tags["tag2"] == 3
+    assert tags["tag3"] == 2
+
+
 def test_filter_by_author(test_client):
     search_criteria = get_search_criteria(query="author:Thor Odinson")
     response = test_client.post("/explore", json=search_criteria)
@@ -300,6 +356,509 @@ def test_combined_query_filters(test_client):
     assert num == 1, f"Wrong number of datasets for combined query filters: {num}"
 
 
+def count_explore_queries(test_client, search_criteria):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with test_client.application.app_context():
+        engine = db.engine
+    explore_cache.bump_generation()
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = test_client.post("/explore", json=search_criteria)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return response, len(statements)
+
+
+def test_explore_constant_number_of_queries(test_client):
+    response, all_queries = count_explore_queries(test_client, get_search_criteria())
+    assert len(response.get_json()) == 6, "Wrong number of datasets"
+
+    response, one_queries = count_explore_queries(test_client, get_search_criteria(query="Sample dataset 1"))
+    assert len(response.get_json()) == 1, "Wrong number of datasets"
+
+    assert all_queries == one_queries, f"Explore issued {all_queries} queries for 6 results and {one_queries} for 1"
+
+
+def test_explore_facets(test_client):
+    search_criteria = dict(get_search_criteria(query="tags:tag1"), facets=True)
+    response = test_client.post("/explore", json=search_criteria)
+    assert response.status_code == 200, "The explore page could not be accessed."
+    data = response.get_json()
+    assert len(data["datasets"]) == 4
+
+    facets = data["facets"]
+    publication_types = {item["value"]: item["count"] for item in facets["publication_type"]}
+    assert publication_types == {"book": 2, "datamanagementplan": 2}
+    tags = {item["value"]: item["count"] for item in facets["tags"]}
+    assert tags == {"tag1": 4, "tag2": 2, "tag3": 1}
+    authors = {item["value"]: item["count"] for item in facets["authors"]}
+    assert authors["Thor Odinson"] == 2
+    assert sum(item["count"] for item in facets["year"]) == 4
+    assert {item["value"] for item in facets["year"]} >= {2021}
+
+
+def test_explore_loads_no_dataset_objects(test_client):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    explore_cache.clear()
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = test_client.post("/explore", json=dict(get_search_criteria(query="tags:tag1"), facets=True))
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    assert len(response.get_json()["datasets"]) == 4
+    # The search selects the ids, the facets are counted in SQL and the cards are the only data load
+    assert not any('data_set.user_id' in statement for statement in statements), "A DataSet object was loaded"
+
+
+def test_explore_returns_cards_and_detail_on_demand(test_client):
+    response = test_client.post("/explore", json=get_search_criteria(query="Sample dataset 4"))
+    card = response.get_json()[0]
+    assert card["title"] == "Sample dataset 4"
+    assert card["authors"] == [{"name": "Thor Odinson", "affiliation": "AI in Science", "orcid": "1111-2222"}]
+    assert card["tags"] == ["tag1", "tag3"]
+    assert card["files_count"] == 5
+    assert "files" not in card and "description" not in card
+
+    response = test_client.get(f"/explore/datasets/{card['id']}")
+    assert response.status_code == 200
+    detail = response.get_json()
+    assert detail["description"] == "Description for dataset 4"
+    assert len(detail["files"]) == detail["files_count"] == 5
+    assert detail["total_size_in_bytes"] == card["total_size_in_bytes"]
+
+    assert test_client.get("/explore/datasets/999999").status_code == 404
+
+
+def test_normalize_criteria():
+    assert normalize_criteria("tags:TAG1; title:Sample", "newest", "any") == \
+        normalize_criteria("title:sample;tags:tag1;;", "whatever", "error")
+    assert normalize_criteria("models_max:3;models_max:1") == normalize_criteria("models_max:1")
+    assert normalize_criteria("tags:tag2|tag1,tag3") == normalize_criteria("tags:tag3, TAG1|tag2")
+    assert normalize_criteria("", "oldest") != normalize_criteria("", "newest")
+    assert normalize_criteria("", publication_type="book") != normalize_criteria("", publication_type="any")
+
+
+def test_parse_query_reports_unknown_filters():
+    with pytest.raises(QueryError) as raised:
+        parse_query("tags:tag1; tag:tag2;colour:red")
+    first, second = raised.value.errors
+    assert first['code'] == 'unknown_filter'
+    assert (first['filter'], first['term'], first['position']) == ('tag', 'tag:tag2', 11)
+    assert first['suggestion'] == 'tags'
+    assert second['filter'] == 'colour' and 'suggestion' not in second
+
+    # Free text with spaces around the colon, or a URL, is not read as a filter
+    assert parse_query("note that: x").predicates == {Predicate('text', 'note that: x')}
+    assert parse_query("note: video").predicates == {Predicate('text', 'note: video')}
+    assert parse_query("tags:tag1;https://example.com/uvl").predicates == {
+        Predicate('tags', ('tag1',)), Predicate('text', 'https://example.com/uvl')
+    }
+
+
+def test_parse_query_drops_implied_groups():
+    assert parse_query("tags:a;tags:a|b,c").key == parse_query("tags:c,a").key
+    assert parse_query("feature:Chat;feature:chat|Voice").key == parse_query("feature:chat").key
+    assert parse_query("min_size:abc").key == parse_query("").key
+
+
+def test_plan_orders_predicates_and_joins_once():
+    plan = compile_query("some text;title:sample;min_size:10;models_max:3;tags:tag1;author:thor", "book")
+    fields = [predicate.field for predicate in plan.predicates]
+    assert fields.index('tags') < fields.index('title') < fields.index('text')
+    assert fields.index('author') < fields.index('files')
+    assert sorted(plan.joins) == ['ds_meta_data', 'file_stats']
+    assert compile_query("title:sample;min_size:10;models_max:3;tags:tag1", "book") is \
+        compile_query("title:sample;min_size:10;models_max:3;tags:tag1", "book")
+
+
+def test_urls_in_the_query_are_free_text(test_client):
+    response = test_client.post("/explore", json=get_search_criteria(query="http://example.com"))
+    assert response.status_code == 200 and response.get_json() == []
+
+
+def test_unknown_filter_returns_structured_errors(test_client):
+    response = test_client.post("/explore", json=get_search_criteria(query="tag:tag1"))
+    assert response.status_code == 400
+    error, = response.get_json()["errors"]
+    assert error["filter"] == "tag" and error["suggestion"] == "tags"
+
+
+def test_ranges_are_filtered_in_sql(test_client):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    explore_cache.clear()
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        response = test_client.post("/explore", json=get_search_criteria(query="min_size:3000;models_max:4"))
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+    assert len(response.get_json()) == 4
+    # No dataset is loaded to check its files: the filter statement compares the aggregates itself
+    assert any('coalesce(' in statement.lower() and 'order by' in statement.lower() for statement in statements)
+
+
+def test_explore_streams_ndjson(test_client):
+    search_criteria = get_search_criteria(query="tags:tag1")
+    expected = test_client.post("/explore", json=search_criteria).get_json()
+
+    response = test_client.post("/explore", json=search_criteria, headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line) for line in lines] == expected
+
+    # An uncached stream runs the id query only: no facet is counted and nothing is cached
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    explore_cache.clear()
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = test_client.post("/explore", json=search_criteria, headers={"Accept": "application/x-ndjson"})
+        lines = response.get_data(as_text=True).splitlines()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    assert [json.loads(line) for line in lines] == expected
+    assert not any('group by tag.name' in statement.lower() for statement in statements)
+    assert explore_cache.stats()['entries'] == 0
+
+
+def test_explore_cache_hits_and_invalidation(test_client):
+    search_criteria = get_search_criteria(query="tags:tag3")
+    response = test_client.post("/explore", json=search_criteria)
+    assert len(response.get_json()) == 2
+
+    hits = explore_cache.stats()['hits']
+    response = test_client.post("/explore", json=get_search_criteria(query=" tags:TAG3 ;"))
+    assert len(response.get_json()) == 2
+    assert explore_cache.stats()['hits'] == hits + 1, "Equivalent query did not hit the cache"
+
+    with test_client.application.app_context():
+        create_dataset_db(7, tags="tag3")
+
+    response = test_client.post("/explore", json=search_criteria)
+    assert len(response.get_json()) == 3, "Cache was not invalidated after creating a dataset"
+
+    assert 0 < explore_cache.stats()['hit_ratio'] <= 1
+    # The stats are not published
+    assert test_client.get("/explore/cache/stats").status_code == 404
+
+
+def test_explore_cache_invalidated_by_metrics(test_client):
+    search_criteria = get_search_criteria(query="features_min:1000")
+    assert test_client.post("/explore", json=search_criteria).get_json() == []
+
+    # The analysis jobs only write the metrics
+    with test_client.application.app_context():
+        dataset = DataSet.query.order_by(DataSet.id).first()
+        dataset.ds_meta_data.ds_metrics.number_of_features = 2000
+        db.session.commit()
+
+    assert len(test_client.post("/explore", json=search_criteria).get_json()) == 1
+
+
+def test_result_cache_shared_generation(tmp_path):
+    path = str(tmp_path / "generation")
+    cache, other_process = ResultCache(shared_path=path), ResultCache(shared_path=path)
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+
+    other_process.bump_generation()
+    assert cache.get("key") is None
+    assert cache.bumped_at >= other_process.bumped_at - 1
+
+    # A result computed while another process wrote is not kept
+    generation = cache.generation
+    other_process.bump_generation()
+    cache.set("key", "value", generation)
+    assert cache.get("key") is None
+
+
+def test_filter_by_author_accent_insensitive(test_client):
+    with test_client.application.app_context():
+        create_dataset_db(8, authors=[{"name": "Muñoz, José", "affiliation": "US", "orcid": ""}])
+
+    for query in ("author:Munoz", "author:muñoz", "author:Jose Munoz", "author:mun jo"):
+        response = test_client.post("/explore", json=get_search_criteria(query=query))
+        num = len(response.get_json())
+        assert num == 1, f"Wrong number of datasets for author filter '{query}': {num}"
+
+
+def run_concurrently(flights, key, compute, num_threads=8):
+    results = []
+    threads = [
+        threading.Thread(target=lambda flight=flights[i % len(flights)]: results.append(flight.do(key, compute)))
+        for i in range(num_threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_single_flight_coalesces_threads():
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return [1, 2, 3]
+
+    results = run_concurrently([SingleFlight()], "tags:automotive", compute)
+    assert results == [[1, 2, 3]] * 8
+    assert len(calls) == 1, f"Computed {len(calls)} times instead of once"
+
+
+def test_single_flight_coalesces_workers(tmp_path):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return [4, 5]
+
+    # Two instances sharing a lock directory behave like two gunicorn workers
+    workers = [SingleFlight(lock_dir=str(tmp_path)), SingleFlight(lock_dir=str(tmp_path))]
+    results = run_concurrently(workers, "tags:automotive", compute)
+    assert results == [[4, 5]] * 8
+    assert len(calls) == 1, f"Computed {len(calls)} times instead of once"
+
+
+def test_single_flight_never_shares_results_older_than_a_write(tmp_path):
+    flight = SingleFlight(lock_dir=str(tmp_path), shared_ttl=60)
+    assert flight.do("key", lambda: "before") == "before"
+    assert flight.do("key", lambda: "again") == "before", "A shared result in its TTL was not reused"
+    written_at = time.time()
+    assert flight.do("key", lambda: "after", not_before=written_at) == "after"
+
+    # Files unused for longer than the TTL are removed by the next leader
+    assert len(list(tmp_path.iterdir())) == 2
+    flight.shared_ttl = 0
+    time.sleep(0.01)
+    flight.do("other", lambda: "value")
+    assert [path.name for path in tmp_path.iterdir()] == []
+
+
+def test_single_flight_propagates_errors():
+    def compute():
+        time.sleep(0.1)
+        raise ValueError("boom")
+
+    flight = SingleFlight()
+    errors = []
+
+    def search():
+        try:
+            flight.do("key", compute)
+        except ValueError as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=search) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 4
+    assert flight.in_flight() == 0
+
+
+def test_prefix_trie_ranks_and_removes():
+    trie = PrefixTrie(top_k=3)
+    for key, entry, weight in [("tag1", "tag1", 4), ("tag2", "tag2", 2), ("tag3", "tag3", 1), ("team", "team", 3)]:
+        trie.add(key, entry, weight)
+
+    assert trie.complete("t") == [("tag1", 4), ("team", 3), ("tag2", 2)]
+    assert trie.complete("tag", limit=1) == [("tag1", 4)]
+
+    trie.remove("tag1", "tag1", 4)
+    assert trie.complete("t") == [("team", 3), ("tag2", 2), ("tag3", 1)]
+    assert trie.complete("tag1") == []
+    assert len(trie) == 3
+
+
+def test_suggest(test_client):
+    # The first lookup starts the background build and finds nothing until it is done
+    test_client.get("/explore/suggest?q=ta")
+    assert suggestion_index.wait_until_current()
+    response = test_client.get("/explore/suggest?q=ta")
+    assert response.status_code == 200
+    suggestions = response.get_json()
+    assert suggestions[0] == {"type": "tag", "value": "tag1", "count": 4}
+
+    # Completions start at any word of a title, accents and case folded
+    values = [suggestion["value"] for suggestion in test_client.get("/explore/suggest?q=DATASET 1").get_json()]
+    assert "Sample dataset 1" in values
+    values = [suggestion["value"] for suggestion in test_client.get("/explore/suggest?q=jos").get_json()]
+    assert values == ["Muñoz, José"]
+
+    assert test_client.get("/explore/suggest?q=").get_json() == []
+
+
+def test_suggest_updates_incrementally_without_queries(test_client):
+    test_client.get("/explore/suggest?q=ta")
+    assert suggestion_index.wait_until_current()
+    built_at = suggestion_index._built_at
+
+    with test_client.application.app_context():
+        create_dataset_db(9, tags="zebra")
+        engine = db.engine
+
+    assert suggestion_index.wait_until_current()
+    assert suggestion_index._built_at == built_at, "The index was rebuilt instead of updated"
+    suggestions = test_client.get("/explore/suggest?q=zeb").get_json()
+    assert suggestions == [{"type": "tag", "value": "zebra", "count": 1}]
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        test_client.get("/explore/suggest?q=sample")
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    assert statements == [], "Suggestions touched the database"
+    assert len(suggestion_index.trie) > 0
+
+
+class DatasetIdsIndex(DatasetIndex):
+    def _empty(self):
+        return set()
+
+    def _index(self, state, dataset_id, dataset):
+        state.discard(dataset_id)
+        if dataset is not None:
+            state.add(dataset_id)
+
+
+def test_dataset_index_is_rebuilt_aside():
+    reading, release = threading.Event(), threading.Event()
+
+    class Repository:
+        datasets = [SimpleNamespace(id=1)]
+
+        def get_indexed_datasets(self, **ids):
+            reading.set()
+            release.wait(5)
+            return list(self.datasets)
+
+    index, repository = DatasetIdsIndex(ttl=0), Repository()
+    release.set()
+    index.refresh(repository)
+    assert index._state == {1}
+
+    reading.clear()
+    release.clear()
+    repository.datasets = [SimpleNamespace(id=2)]
+    rebuild = threading.Thread(target=index.refresh, args=(repository,))
+    rebuild.start()
+    assert reading.wait(5)
+    # Lookups take the lock: it is free and the old index is served while the new one is read
+    assert index._lock.acquire(timeout=1), "The datasets were read holding the index lock"
+    assert index._state == {1}
+    index._lock.release()
+    release.set()
+    rebuild.join()
+    assert index._state == {2} and index.wait_until_current(timeout=1)
+
+
+def test_trigram_index_similarity():
+    assert trigrams("cat") == {"  c", " ca", "cat", "at "}
+
+    index = TrigramIndex()
+    index.add("automotive", 1)
+    index.add("automotive", 2)
+    index.add("feature", 2)
+    index.add("feature", 2)
+
+    assert set(index.search("atomotive")) == {1, 2}
+    assert 0.3 < index.search("featre")[2] < 1
+    assert index.search("feature")[2] == 1
+    assert index.search("zebra") == {}
+
+    index.remove("feature", 2)
+    assert 2 in index.search("feature"), "A word still referenced by the document was removed"
+    index.remove("feature", 2)
+    assert index.search("feature") == {}
+    assert len(index) == 1
+
+
+def test_fuzzy_search_fallback(test_client):
+    with test_client.application.app_context():
+        create_dataset_db(10, tags="automotive", authors=[{"name": "Ada Lovelace", "affiliation": "", "orcid": ""}])
+    assert fuzzy_index.wait_until_current()
+
+    for query in ("atomotive", "Lovelase", "automotiv;adda lovelace"):
+        response = test_client.post("/explore", json=get_search_criteria(query=query))
+        titles = [dataset["title"] for dataset in response.get_json()]
+        assert titles == ["Sample dataset 10"], f"Wrong fuzzy results for '{query}': {titles}"
+
+    # Fuzzy matches still honour the other filters
+    for query in ("tags:tag1;atomotive", "xqzvw"):
+        response = test_client.post("/explore", json=get_search_criteria(query=query))
+        assert response.get_json() == [], f"Unexpected fuzzy results for '{query}'"
+
+
+def test_percolation_agrees_with_sql(test_client):
+    repository = ExploreRepository()
+    with test_client.application.app_context():
+        datasets = repository.get_indexed_datasets()
+        for query in ("tags:tag1", "tags:tag2|tag3;models_min:3", "author:thor", "title:dataset 1",
+                      "sample;min_size:4000", "max_size:5000", "automotive"):
+            plan = compile_query(query, "any")
+            expected = set(repository.filter_datasets(plan))
+            percolated = {dataset.id for dataset in datasets if matches(plan, percolation_document(dataset))}
+            assert percolated == expected, f"Percolation disagrees with SQL for '{query}'"
+
+
+def test_saved_search_feed(test_client):
+    login(test_client, "test@example.com", "test1234")
+    try:
+        response = test_client.post("/explore/saved-searches", json={"name": "Mine", "query": "tag:tag1"})
+        assert response.status_code == 400 and response.get_json()["errors"][0]["suggestion"] == "tags"
+
+        response = test_client.post("/explore/saved-searches", json={"name": "Mine", "query": "tags:tag3;sample"})
+        assert response.status_code == 201
+        saved_search_id = response.get_json()["id"]
+        feed = f"/explore/saved-searches/{saved_search_id}/new"
+        assert test_client.get(feed).get_json() == []
+
+        service = SavedSearchService()
+        with test_client.application.app_context():
+            create_dataset_db(13, tags="tag3,tag9")
+            create_dataset_db(14, tags="tag9")
+            matching, other = DataSet.query.order_by(DataSet.id.desc()).limit(2).all()[::-1]
+            assert service.percolate(matching.id) == [saved_search_id]
+            assert service.percolate(other.id) == []
+            # Synchronizing an already matched dataset does not notify it again
+            assert service.percolate(matching.id) == []
+
+        listed, = test_client.get("/explore/saved-searches").get_json()
+        assert listed["new"] == 1
+        assert [card["title"] for card in test_client.get(feed).get_json()] == ["Sample dataset 13"]
+        assert test_client.get(feed).get_json() == []
+
+        assert test_client.delete(f"/explore/saved-searches/{saved_search_id}").status_code == 204
+        assert test_client.get(feed).status_code == 404
+    finally:
+        logout(test_client)
+
+
 def get_search_criteria(query="", sorting="newest", publication_type="any", uvl_min="", uvl_max=""):
     search_criteria = {
         "max_uvl": uvl_max,
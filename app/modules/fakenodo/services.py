@@ -5,9 +5,11 @@ from dotenv import load_dotenv
 from flask_login import current_user
 
 from app.modules.dataset.models import DSMetaData, DataSet
+from app.modules.dataset.repositories import DSMetaDataRepository
 from app.modules.fakenodo.models import Deposition
 from app.modules.fakenodo.repositories import DepositionRepository
 from app.modules.featuremodel.models import FeatureModel
+from app.modules.jobs.services import job_handler
 
 from core.configuration.configuration import uploads_folder_name
 from core.services.BaseService import BaseService
@@ -149,3 +151,16 @@ class DepositionService(BaseService):
 
     def _generateDoi(self, deposition_id: int) -> str:
         return f"10.5072/UVL{str(deposition_id)}"
+
+
+@job_handler('fakenodo.create_deposition')
+def create_deposition_job(payload: dict, progress) -> dict:
+    """Job enqueued after upload, so the upload does not wait for the deposition and its DOI."""
+    dataset = DataSet.query.get(payload['dataset_id'])
+    response = DepositionService().createDeposition(dataset=dataset, doi=payload.get('publication_doi'))
+
+    values = {'deposition_id': response['deposition_id']}
+    if response.get('doi'):
+        values['dataset_doi'] = response['doi']
+    DSMetaDataRepository().update(dataset.ds_meta_data_id, **values)
+    return {'deposition_id': response['deposition_id'], 'doi': response.get('doi')}
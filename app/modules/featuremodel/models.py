@@ -1,7 +1,41 @@
 from app import db
 from sqlalchemy import Enum as SQLAlchemyEnum
 
-from app.modules.dataset.models import Author, PublicationType
+from app.modules.dataset.models import Author, PublicationType, TaggedMixin
+
+
+fm_meta_data_tag = db.Table(
+    'fm_meta_data_tag',
+    db.Column('fm_meta_data_id', db.Integer, db.ForeignKey('fm_meta_data.id'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True, index=True),
+)
+
+# Inverted index from feature names to the UVL files declaring them, and to the files whose constraints
+# reference them. Filled when a file is uploaded (see FeatureIndexService) or by `rosemary features:index`.
+hubfile_feature_name = db.Table(
+    'hubfile_feature_name',
+    db.Column('hubfile_id', db.Integer, db.ForeignKey('file.id'), primary_key=True),
+    db.Column('feature_name_id', db.Integer, db.ForeignKey('feature_name.id'), primary_key=True, index=True),
+)
+
+hubfile_constraint_name = db.Table(
+    'hubfile_constraint_name',
+    db.Column('hubfile_id', db.Integer, db.ForeignKey('file.id'), primary_key=True),
+    db.Column('feature_name_id', db.Integer, db.ForeignKey('feature_name.id'), primary_key=True, index=True),
+)
+
+
+def normalize_feature_name(name: str) -> str:
+    """Feature names are matched case-insensitively and without the quotes UVL uses for names with spaces."""
+    return (name or "").strip().strip('"').strip().lower()[:255]
+
+
+class FeatureName(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), nullable=False, unique=True, index=True)
+
+    def __repr__(self):
+        return f'FeatureName<{self.name}>'
 
 
 class FeatureModel(db.Model):
@@ -15,7 +49,7 @@ class FeatureModel(db.Model):
         return f'FeatureModel<{self.id}>'
 
 
-class FMMetaData(db.Model):
+class FMMetaData(db.Model, TaggedMixin):
     id = db.Column(db.Integer, primary_key=True)
     uvl_filename = db.Column(db.String(120), nullable=False)
     title = db.Column(db.String(120), nullable=False)
@@ -28,15 +62,33 @@ class FMMetaData(db.Model):
     fm_metrics = db.relationship('FMMetrics', uselist=False, backref='fm_meta_data')
     authors = db.relationship('Author', backref='fm_metadata', lazy=True, cascade="all, delete",
                               foreign_keys=[Author.fm_meta_data_id])
+    normalized_tags = db.relationship('Tag', secondary=fm_meta_data_tag, lazy=True,
+                                      backref=db.backref('fm_meta_data', lazy='dynamic'))
 
     def __repr__(self):
         return f'FMMetaData<{self.title}'
 
 
 class FMMetrics(db.Model):
+    """
+    Metrics of a feature model, computed by the analysis pipeline from the content of its UVL file (see
+    FeatureModelMetricsService). `configurations` is None when counting them was not tractable.
+    """
     id = db.Column(db.Integer, primary_key=True)
     solver = db.Column(db.Text)
     not_solver = db.Column(db.Text)
+    # Checksum of the analysed file and version of the analyzer, so each content is analysed once
+    checksum = db.Column(db.String(120))
+    analyzer_version = db.Column(db.Integer)
+    features = db.Column(db.Integer, index=True)
+    leaf_features = db.Column(db.Integer, index=True)
+    cross_tree_constraints = db.Column(db.Integer, index=True)
+    depth = db.Column(db.Integer, index=True)
+    configurations = db.Column(db.Float, index=True)
+    analysis_error = db.Column(db.Text)
+    analysed_at = db.Column(db.DateTime)
+
+    __table_args__ = (db.Index('ix_fm_metrics_checksum_analyzer_version', 'checksum', 'analyzer_version'),)
 
     def __repr__(self):
         return f'FMMetrics<solver={self.solver}, not_solver={self.not_solver}>'
@@ -1,6 +1,15 @@
 
-from sqlalchemy import func
-from app.modules.featuremodel.models import FMMetaData, FeatureModel
+from sqlalchemy import func, or_
+from app import db
+from app.modules.featuremodel.models import (
+    FMMetaData,
+    FMMetrics,
+    FeatureModel,
+    FeatureName,
+    hubfile_constraint_name,
+    hubfile_feature_name
+)
+from app.modules.hubfile.models import Hubfile
 from core.repositories.BaseRepository import BaseRepository
 
 
@@ -16,3 +25,107 @@ class FeatureModelRepository(BaseRepository):
 class FMMetaDataRepository(BaseRepository):
     def __init__(self):
         super().__init__(FMMetaData)
+
+
+class FMMetricsRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(FMMetrics)
+
+    def dataset_rollup(self, dataset_id: int):
+        """
+        (models, models with metrics, models with a configuration count, features, cross-tree constraints,
+        maximum depth, configurations) of the dataset's feature models, aggregated in one statement.
+        """
+        return (
+            db.session.query(
+                func.count(FeatureModel.id),
+                func.count(FMMetrics.features),
+                func.count(FMMetrics.configurations),
+                func.sum(FMMetrics.features),
+                func.sum(FMMetrics.cross_tree_constraints),
+                func.max(FMMetrics.depth),
+                func.sum(FMMetrics.configurations),
+            )
+            .outerjoin(FMMetaData, FeatureModel.fm_meta_data_id == FMMetaData.id)
+            .outerjoin(FMMetrics, FMMetaData.fm_metrics_id == FMMetrics.id)
+            .filter(FeatureModel.data_set_id == dataset_id)
+            .one()
+        )
+
+    def pending_analysis(self, analyzer_version: int):
+        """
+        Query of (hubfile, fm meta data) for the first file of each feature model whose metrics were not
+        computed from its current content by this analyzer version, in order of file id.
+        """
+        first_files = db.session.query(func.min(Hubfile.id)).group_by(Hubfile.feature_model_id)
+        return (
+            db.session.query(Hubfile, FMMetaData)
+            .join(FeatureModel, Hubfile.feature_model_id == FeatureModel.id)
+            .join(FMMetaData, FeatureModel.fm_meta_data_id == FMMetaData.id)
+            .outerjoin(FMMetrics, FMMetaData.fm_metrics_id == FMMetrics.id)
+            .filter(Hubfile.id.in_(first_files))
+            .filter(or_(
+                FMMetrics.id.is_(None),
+                FMMetrics.checksum.is_(None),
+                FMMetrics.checksum != Hubfile.checksum,
+                FMMetrics.analyzer_version.is_(None),
+                FMMetrics.analyzer_version != analyzer_version,
+            ))
+            .order_by(Hubfile.id)
+        )
+
+    def get_analysed(self, checksums, analyzer_version: int) -> dict:
+        """Metrics already computed by this analyzer version for any of the contents, by checksum."""
+        if not checksums:
+            return {}
+        return {
+            metrics.checksum: metrics
+            for metrics in self.model.query.filter(
+                FMMetrics.checksum.in_(set(checksums)), FMMetrics.analyzer_version == analyzer_version
+            ).all()
+        }
+
+
+class FeatureNameRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(FeatureName)
+
+    def get_or_create_many(self, names) -> dict:
+        """FeatureName rows for the given normalized names, adding the missing ones to the session."""
+        names = set(names)
+        if not names:
+            return {}
+        feature_names = {
+            feature_name.name: feature_name
+            for feature_name in self.model.query.filter(FeatureName.name.in_(names)).all()
+        }
+        for name in names - feature_names.keys():
+            feature_names[name] = FeatureName(name=name)
+            self.session.add(feature_names[name])
+        return feature_names
+
+    def data_set_ids_with_any(self, names, in_constraints: bool = False):
+        """
+        Subquery of the ids of the datasets with a file declaring any of the names or, with
+        `in_constraints`, referencing any of them in a constraint.
+        """
+        association = hubfile_constraint_name if in_constraints else hubfile_feature_name
+        return (
+            db.session.query(FeatureModel.data_set_id)
+            .join(Hubfile, Hubfile.feature_model_id == FeatureModel.id)
+            .join(association, association.c.hubfile_id == Hubfile.id)
+            .join(FeatureName, FeatureName.id == association.c.feature_name_id)
+            .filter(FeatureName.name.in_(names))
+        )
+
+    def files_with(self, name: str) -> list:
+        """(hubfile id, file name, feature model id, dataset id) of the files declaring a feature."""
+        return (
+            db.session.query(Hubfile.id, Hubfile.name, FeatureModel.id, FeatureModel.data_set_id)
+            .join(FeatureModel, Hubfile.feature_model_id == FeatureModel.id)
+            .join(hubfile_feature_name, hubfile_feature_name.c.hubfile_id == Hubfile.id)
+            .join(FeatureName, FeatureName.id == hubfile_feature_name.c.feature_name_id)
+            .filter(FeatureName.name == name)
+            .order_by(Hubfile.id)
+            .all()
+        )
@@ -2,6 +2,7 @@ from app.modules.featuremodel import featuremodel_bp
 from flask import jsonify, render_template, request
 from flask_login import current_user, login_required
 from app.modules.dataset.services import RatingService
+from app.modules.featuremodel.services import FeatureIndexService
 
 
 @featuremodel_bp.route('/featuremodel', methods=['GET'])
@@ -22,3 +23,8 @@ def rate_model():
     # Obtiene el promedio actualizado
     average_rating = RatingService.get_average_model_rating(model_id)
     return jsonify({"model_id": model_id, "average_rating": average_rating})
+
+
+@featuremodel_bp.route('/featuremodel/features/<path:name>', methods=['GET'])
+def files_with_feature(name):
+    return jsonify(FeatureIndexService().files_with(name))
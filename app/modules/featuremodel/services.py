@@ -1,6 +1,32 @@
-from app.modules.featuremodel.repositories import FMMetaDataRepository, FeatureModelRepository
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from flamapy.metamodels.fm_metamodel.transformations import UVLReader
+
+from app.modules.dataset.models import DSMetrics, DataSet
+from app.modules.explore.services import SavedSearchService
+from app.modules.featuremodel.models import FMMetrics, FeatureModel, normalize_feature_name
+from app.modules.featuremodel.repositories import (
+    FMMetaDataRepository,
+    FMMetricsRepository,
+    FeatureModelRepository,
+    FeatureNameRepository
+)
+from app.modules.flamapy.analysis import ANALYZER_VERSION, analyze_feature_model
+from app.modules.flamapy.services import (
+    FLAMAPY_QUEUE_TIMEOUT, feature_model_cache_dir, flamapy_pool, parse_feature_model
+)
+from app.modules.hubfile.models import Hubfile
+from app.modules.hubfile.repositories import HubfileRepository
 from app.modules.hubfile.services import HubfileService
+from app.modules.jobs.services import job_handler
 from core.services.BaseService import BaseService
+from core.workers.process_pool import PoolSaturated, ProcessPool, TaskMemoryExceeded, TaskTimeout
+
+logger = logging.getLogger(__name__)
+
+METRIC_COLUMNS = ('features', 'leaf_features', 'cross_tree_constraints', 'depth', 'configurations')
 
 
 class FeatureModelService(BaseService):
@@ -20,3 +46,244 @@ class FeatureModelService(BaseService):
     class FMMetaDataService(BaseService):
         def __init__(self):
             super().__init__(FMMetaDataRepository())
+
+
+def read_feature_names(path: str, checksum: str = None) -> tuple:
+    """
+    Normalized names of the features declared in a UVL file and of those referenced by its constraints.
+    With the checksum of the file, the parsed model is cached for the flamapy operations.
+    """
+    feature_model = parse_feature_model(checksum, path) if checksum else UVLReader(path).transform()
+    features = {normalize_feature_name(feature.name) for feature in feature_model.get_features()}
+    constrained = {
+        normalize_feature_name(name)
+        for constraint in feature_model.get_constraints()
+        for name in constraint.get_features()
+    }
+    return features - {''}, constrained - {''}
+
+
+class FeatureIndexService(BaseService):
+    """Maintains the inverted index from feature names to the UVL files declaring them."""
+
+    def __init__(self):
+        super().__init__(FeatureNameRepository())
+        self.hubfile_repository = HubfileRepository()
+
+    def index_hubfile(self, hubfile: Hubfile, path: str) -> None:
+        """
+        Parses the file once and replaces its indexed names, without committing. Files that cannot be
+        parsed are indexed with no names, so they are not parsed again until their content changes.
+        """
+        try:
+            features, constrained = read_feature_names(path, hubfile.checksum)
+        except Exception as exc:
+            logger.warning(f"Could not index the features of {path}: {exc}")
+            features, constrained = set(), set()
+
+        feature_names = self.repository.get_or_create_many(features | constrained)
+        hubfile.feature_names = [feature_names[name] for name in sorted(features)]
+        hubfile.constraint_names = [feature_names[name] for name in sorted(constrained)]
+        hubfile.indexed_checksum = hubfile.checksum
+
+    def backfill(self, reindex: bool = False, batch_size: int = 100, on_indexed=None) -> int:
+        """
+        Indexes the files uploaded before the index existed, or every file with `reindex`, committing every
+        `batch_size` files so an interrupted run resumes where it stopped.
+        """
+        hubfile_service = HubfileService()
+        count = 0
+        last_id = 0
+        while True:
+            batch = (
+                self.hubfile_repository.get_unindexed(reindex)
+                .filter(Hubfile.id > last_id)
+                .limit(batch_size)
+                .all()
+            )
+            if not batch:
+                return count
+
+            for hubfile in batch:
+                self.index_hubfile(hubfile, hubfile_service.get_path_by_hubfile(hubfile))
+                last_id = hubfile.id
+                count += 1
+                if on_indexed is not None:
+                    on_indexed(hubfile)
+            self.repository.session.commit()
+
+    def files_with(self, name: str) -> list:
+        return [
+            {'hubfile_id': hubfile_id, 'name': file_name, 'feature_model_id': feature_model_id,
+             'dataset_id': data_set_id}
+            for hubfile_id, file_name, feature_model_id, data_set_id
+            in self.repository.files_with(normalize_feature_name(name))
+        ]
+
+
+class FeatureModelMetricsService(BaseService):
+    """
+    The analysis pipeline: computes the metrics of each feature model in the flamapy pool and rolls them up
+    into the metrics of its dataset.
+    """
+
+    def __init__(self, pool: ProcessPool = flamapy_pool):
+        super().__init__(FMMetricsRepository())
+        self.hubfile_service = HubfileService()
+        self.pool = pool
+
+    def analyze(self, feature_model: FeatureModel):
+        """
+        Analyses the UVL file of the feature model, without committing, unless its content was already
+        analysed by this analyzer version. Files that cannot be analysed keep the error, so they are not
+        analysed again until their content changes. Raises PoolSaturated if no worker is free.
+        """
+        fm_meta_data = feature_model.fm_meta_data
+        if fm_meta_data is None or not feature_model.files:
+            return None
+        hubfile = feature_model.files[0]
+        metrics = fm_meta_data.fm_metrics
+        analysed = (hubfile.checksum, ANALYZER_VERSION)
+        if metrics is not None and (metrics.checksum, metrics.analyzer_version) == analysed:
+            return metrics
+
+        values, error = self.compute(hubfile.checksum, self.hubfile_service.get_path_by_hubfile(hubfile))
+        return self.store(fm_meta_data, hubfile.checksum, values, error)
+
+    def store(self, fm_meta_data, checksum: str, values: dict, error: str = None) -> FMMetrics:
+        """Sets the metrics computed from the content with `checksum`, without committing."""
+        metrics = fm_meta_data.fm_metrics
+        if metrics is None:
+            metrics = FMMetrics()
+            fm_meta_data.fm_metrics = metrics
+        for column in METRIC_COLUMNS:
+            setattr(metrics, column, values.get(column))
+        metrics.checksum = checksum
+        metrics.analyzer_version = ANALYZER_VERSION
+        metrics.analysis_error = error
+        metrics.analysed_at = datetime.now(timezone.utc)
+        return metrics
+
+    def compute(self, checksum: str, path: str) -> tuple:
+        """(metrics, error) of a UVL file."""
+        try:
+            return self.pool.run(analyze_feature_model, checksum, path, cache_dir=feature_model_cache_dir(),
+                                 queue_timeout=FLAMAPY_QUEUE_TIMEOUT), None
+        except PoolSaturated:
+            raise
+        except (TaskTimeout, TaskMemoryExceeded) as exc:
+            # Counting the configurations is the only step that can blow up: keep the other metrics
+            logger.warning(f"Could not count the configurations of {path}: {exc}")
+            try:
+                return self.pool.run(analyze_feature_model, checksum, path, count_configurations=False,
+                                     cache_dir=feature_model_cache_dir(), queue_timeout=FLAMAPY_QUEUE_TIMEOUT), None
+            except PoolSaturated:
+                raise
+            except Exception as exc:
+                return {}, f'{type(exc).__name__}: {exc}'
+        except Exception as exc:
+            logger.warning(f"Could not analyse {path}: {exc}")
+            return {}, f'{type(exc).__name__}: {exc}'
+
+    def roll_up(self, dataset: DataSet) -> DSMetrics:
+        """Recomputes the dataset metrics from those of its feature models, without committing."""
+        models, analysed, counted, features, constraints, depth, configurations = \
+            self.repository.dataset_rollup(dataset.id)
+        ds_meta_data = dataset.ds_meta_data
+        metrics = ds_meta_data.ds_metrics
+        if metrics is None or len(metrics.ds_meta_data) > 1:
+            # Older seeds shared one row between datasets
+            metrics = DSMetrics()
+            ds_meta_data.ds_metrics = metrics
+        metrics.number_of_models = models
+        metrics.number_of_features = features if analysed else None
+        metrics.cross_tree_constraints = constraints if analysed else None
+        metrics.max_depth = depth
+        metrics.configurations = configurations if models and counted == models else None
+        metrics.analysed_at = datetime.now(timezone.utc)
+        return metrics
+
+    def analyze_dataset(self, dataset_id: int, on_progress=None) -> DSMetrics:
+        dataset = DataSet.query.get(dataset_id)
+        if dataset is None:
+            return None
+        feature_models = dataset.feature_models
+        for index, feature_model in enumerate(feature_models, 1):
+            self.analyze(feature_model)
+            if on_progress is not None:
+                on_progress(index / len(feature_models), f'Analysed {index} of {len(feature_models)} models')
+        self.repository.session.flush()
+        metrics = self.roll_up(dataset)
+        self.repository.session.commit()
+        self.percolate([dataset_id])
+        return metrics
+
+    def percolate(self, dataset_ids) -> None:
+        """
+        Matches the saved searches against the datasets whose metrics were just stored: searches on metric
+        ranges could not match them before. Searches already matched are skipped.
+        """
+        saved_search_service = SavedSearchService()
+        for dataset_id in dataset_ids:
+            try:
+                saved_search_service.percolate(dataset_id)
+            except Exception as exc:
+                # Saved searches are a convenience, they must not fail the analysis
+                logger.exception(f"Exception while matching the saved searches against dataset {dataset_id}: {exc}")
+                saved_search_service.repository.session.rollback()
+
+    def count_pending(self) -> int:
+        return self.repository.pending_analysis(ANALYZER_VERSION).count()
+
+    def backfill(self, batch_size: int = 100, on_batch=None) -> int:
+        """
+        Analyses every feature model not analysed from its current content by this analyzer version, e.g.
+        after the analyzer changed. Pending files are read `batch_size` at a time and their distinct contents
+        analysed in parallel, one per pool worker. Contents already analysed for another model are copied
+        instead. Each batch is committed with the metrics of its datasets, so an interrupted run resumes
+        where it stopped. Returns the number of models analysed.
+        """
+        count = 0
+        last_id = 0
+        with ThreadPoolExecutor(max_workers=self.pool.max_workers) as executor:
+            while True:
+                batch = (
+                    self.repository.pending_analysis(ANALYZER_VERSION)
+                    .filter(Hubfile.id > last_id)
+                    .limit(batch_size)
+                    .all()
+                )
+                if not batch:
+                    return count
+
+                analysed = {
+                    checksum: ({column: getattr(metrics, column) for column in METRIC_COLUMNS},
+                               metrics.analysis_error)
+                    for checksum, metrics
+                    in self.repository.get_analysed([hubfile.checksum for hubfile, _ in batch],
+                                                    ANALYZER_VERSION).items()
+                }
+                paths = {hubfile.checksum: self.hubfile_service.get_path_by_hubfile(hubfile)
+                         for hubfile, _ in batch if hubfile.checksum not in analysed}
+                analysed.update(zip(paths, executor.map(self.compute, paths, paths.values())))
+
+                for hubfile, fm_meta_data in batch:
+                    self.store(fm_meta_data, hubfile.checksum, *analysed[hubfile.checksum])
+                self.repository.session.flush()
+                dataset_ids = sorted({hubfile.feature_model.data_set_id for hubfile, _ in batch})
+                for dataset_id in dataset_ids:
+                    self.roll_up(DataSet.query.get(dataset_id))
+                self.repository.session.commit()
+                self.percolate(dataset_ids)
+
+                last_id = batch[-1][0].id
+                count += len(batch)
+                if on_batch is not None:
+                    on_batch(len(batch))
+
+
+@job_handler('featuremodel.analyze_dataset')
+def analyze_dataset_job(payload: dict, progress) -> dict:
+    """Job enqueued after upload, so the upload does not wait for the analysis of its models."""
+    metrics = FeatureModelMetricsService().analyze_dataset(payload['dataset_id'], on_progress=progress)
+    return {'number_of_models': metrics.number_of_models if metrics else 0}
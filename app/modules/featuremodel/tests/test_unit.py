@@ -1,5 +1,22 @@
+import os
+from unittest.mock import patch
+
 import pytest
 
+from app import db
+from app.modules.auth.models import User
+from app.modules.dataset.models import DataSet
+from app.modules.explore.models import SavedSearchMatch
+from app.modules.explore.services import SavedSearchService
+from app.modules.featuremodel import services
+from app.modules.featuremodel.services import FeatureIndexService, FeatureModelMetricsService, read_feature_names
+from app.modules.flamapy.analysis import ANALYZER_VERSION
+from app.modules.flamapy.services import feature_model_cache, flamapy_pool
+from app.modules.hubfile.models import Hubfile
+from app.modules.jobs.services import JobService
+from app.modules.utils.utilsdb import create_dataset_db
+from core.workers.process_pool import TaskTimeout
+
 
 @pytest.fixture(scope='module')
 def test_client(test_client):
@@ -7,9 +24,9 @@ def test_client(test_client):
     Extends the test_client fixture to add additional specific data for module testing.
     """
     with test_client.application.app_context():
-        # Add HERE new elements to the database that you want to exist in the test context.
-        # DO NOT FORGET to use db.session.add(<element>) and db.session.commit() to save the data.
-        pass
+        create_dataset_db(1)
+        create_dataset_db(2)
+        create_dataset_db(3, valid=False)
 
     yield test_client
 
@@ -22,3 +39,134 @@ def test_sample_assertion(test_client):
     """
     greeting = "Hello, World!"
     assert greeting == "Hello, World!", "The greeting does not coincide with 'Hello, World!'"
+
+
+def test_read_feature_names():
+    features, constrained = read_feature_names('app/modules/dataset/uvl_examples/file1.uvl')
+    assert {"chat", "peer 2 peer", "server", "data storage"} <= features
+    assert constrained == {"server", "data storage", "video", "audio", "media player"}
+
+
+def test_feature_index_backfill_and_search(test_client, monkeypatch, tmp_path):
+    monkeypatch.setenv('WORKING_DIR', os.getenv('WORKING_DIR', ''))
+    # The fixtures reuse checksums across modules, so parsed models must not come from other tests
+    monkeypatch.setenv('FLAMAPY_CACHE_DIR', str(tmp_path))
+    feature_model_cache.clear()
+    with test_client.application.app_context():
+        indexed = []
+        assert FeatureIndexService().backfill(batch_size=2, on_indexed=indexed.append) == 3
+        assert Hubfile.query.filter(Hubfile.indexed_checksum.is_(None)).count() == 0
+        assert FeatureIndexService().backfill() == 0, "Indexed files were parsed again"
+
+        # The invalid file is indexed without names, so it is not parsed again
+        invalid = Hubfile.query.filter_by(name='invalidfile.uvl').one()
+        assert invalid.feature_names == []
+        db.session.rollback()
+
+    response = test_client.get("/featuremodel/features/Chat")
+    assert [item["name"] for item in response.get_json()] == ["file1.uvl", "file2.uvl"]
+
+    # Datasets 1 and 2 hold the same model, dataset 3 an invalid file
+    for query, expected in (("feature:chat", 2), ('feature:"Peer 2 Peer"', 2), ("feature:chat|nope", 2),
+                            ("feature:chat,nope", 0), ("constraint:media player", 2), ("feature:nope", 0)):
+        response = test_client.post("/explore", json={"query": query, "sorting": "newest",
+                                                      "publication_type": "any"})
+        assert len(response.get_json()) == expected, f"Wrong number of datasets for '{query}'"
+
+
+def test_analysis_pipeline(test_client, monkeypatch, tmp_path):
+    monkeypatch.setenv('WORKING_DIR', os.getenv('WORKING_DIR', ''))
+    monkeypatch.setenv('FLAMAPY_CACHE_DIR', str(tmp_path))
+    feature_model_cache.clear()
+    with test_client.application.app_context():
+        first, second, invalid = [dataset.id for dataset in DataSet.query.order_by(DataSet.id).all()]
+        service = FeatureModelMetricsService()
+        JobService().enqueue('featuremodel.analyze_dataset', {'dataset_id': first})
+        assert JobService().work(once=True) == 1
+
+        dataset = db.session.get(DataSet, first)
+        fm_metrics = dataset.feature_models[0].fm_meta_data.fm_metrics
+        assert (fm_metrics.features, fm_metrics.leaf_features, fm_metrics.cross_tree_constraints, fm_metrics.depth,
+                fm_metrics.configurations) == (10, 7, 2, 2, 24)
+        ds_metrics = dataset.ds_meta_data.ds_metrics
+        assert (ds_metrics.number_of_models, ds_metrics.number_of_features, ds_metrics.cross_tree_constraints,
+                ds_metrics.max_depth, ds_metrics.configurations) == (1, 10, 2, 2, 24)
+
+        # Each content is analysed once per analyzer version
+        with patch.object(flamapy_pool, 'run') as run:
+            service.analyze_dataset(first)
+            run.assert_not_called()
+
+        # Models too large to count keep their other metrics
+        structure = {'features': 10, 'leaf_features': 7, 'cross_tree_constraints': 2, 'depth': 2,
+                     'configurations': None}
+        with patch.object(flamapy_pool, 'run', side_effect=[TaskTimeout(), structure]):
+            ds_metrics = service.analyze_dataset(second)
+        assert ds_metrics.number_of_features == 10 and ds_metrics.configurations is None
+
+        ds_metrics = service.analyze_dataset(invalid)
+        assert ds_metrics.number_of_models == 1 and ds_metrics.number_of_features is None
+        assert db.session.get(DataSet, invalid).feature_models[0].fm_meta_data.fm_metrics.analysis_error
+
+    for query, expected in (("features_min:10", 2), ("features_min:11", 0), ("configurations_min:20", 1),
+                            ("depth_max:2;constraints_min:2", 2), ("depth_max:1", 0)):
+        response = test_client.post("/explore", json={"query": query, "sorting": "newest",
+                                                      "publication_type": "any"})
+        assert len(response.get_json()) == expected, f"Wrong number of datasets for '{query}'"
+
+
+def test_analysis_backfill(test_client, monkeypatch, tmp_path):
+    monkeypatch.setenv('WORKING_DIR', os.getenv('WORKING_DIR', ''))
+    monkeypatch.setenv('FLAMAPY_CACHE_DIR', str(tmp_path))
+    feature_model_cache.clear()
+    with test_client.application.app_context():
+        create_dataset_db(4)
+        create_dataset_db(5)
+        # Same content as the previous file, so it is analysed once
+        Hubfile.query.filter_by(checksum='checksum5').one().checksum = 'checksum4'
+        db.session.commit()
+        service = FeatureModelMetricsService()
+        assert service.count_pending() == 2
+
+        with patch.object(flamapy_pool, 'run', wraps=flamapy_pool.run) as run:
+            assert service.backfill() == 2
+            assert run.call_count == 1
+        assert service.count_pending() == 0 and service.backfill() == 0
+        datasets = DataSet.query.order_by(DataSet.id).all()
+        assert [dataset.ds_meta_data.ds_metrics.number_of_features for dataset in datasets[-2:]] == [10, 10]
+
+        # A new analyzer version analyses every model again, resuming after an interruption
+        monkeypatch.setattr(services, 'ANALYZER_VERSION', ANALYZER_VERSION + 1)
+        structure = {'features': 3, 'leaf_features': 2, 'cross_tree_constraints': 0, 'depth': 1,
+                     'configurations': 2}
+
+        def interrupt(size):
+            raise KeyboardInterrupt()
+
+        with patch.object(flamapy_pool, 'run', return_value=structure):
+            assert service.count_pending() == 5
+            with pytest.raises(KeyboardInterrupt):
+                service.backfill(batch_size=2, on_batch=interrupt)
+            assert service.count_pending() == 3
+            batches = []
+            assert service.backfill(batch_size=2, on_batch=batches.append) == 3 and batches == [2, 1]
+        assert {dataset.ds_meta_data.ds_metrics.number_of_features for dataset in datasets} == {3}
+
+
+def test_analysis_matches_saved_metric_searches(test_client, monkeypatch, tmp_path):
+    monkeypatch.setenv('WORKING_DIR', os.getenv('WORKING_DIR', ''))
+    monkeypatch.setenv('FLAMAPY_CACHE_DIR', str(tmp_path))
+    feature_model_cache.clear()
+    with test_client.application.app_context():
+        user = User.query.filter_by(email='test@example.com').one()
+        saved_search = SavedSearchService().create(user.id, 'Large models', 'features_min:5;depth_max:3')
+        saved_search_id = saved_search.id
+        create_dataset_db(6)
+        dataset_id = DataSet.query.order_by(DataSet.id.desc()).first().id
+
+        # At upload the metrics are not known yet, so no metric range matches
+        assert SavedSearchService().percolate(dataset_id) == []
+        JobService().enqueue('featuremodel.analyze_dataset', {'dataset_id': dataset_id})
+        assert JobService().work(once=True) == 1
+        assert [match.data_set_id for match in SavedSearchMatch.query.filter_by(saved_search_id=saved_search_id)] \
+            == [dataset_id]
@@ -0,0 +1,83 @@
+"""
+Numeric metrics of feature models, computed in the flamapy pool after upload and stored in FMMetrics.
+
+The number of configurations is counted on a BDD of the model's CNF. BDDs of some models grow
+exponentially, so building one stops past FLAMAPY_BDD_MAX_NODES nodes and the count is left unknown.
+"""
+import os
+from typing import Optional
+
+from flamapy.metamodels.fm_metamodel.models import FeatureModel
+from flamapy.metamodels.pysat_metamodel.transformations import FmToPysat
+
+from app.modules.flamapy.services import parse_feature_model
+
+try:
+    from dd.cudd import BDD
+except ImportError:  # pragma: no cover - CUDD bindings are optional, the pure Python BDDs are slower
+    from dd.autoref import BDD
+
+# Bump whenever a metric is added or computed differently: models analysed by other versions are analysed again
+ANALYZER_VERSION = 1
+
+BDD_MAX_NODES = int(os.getenv('FLAMAPY_BDD_MAX_NODES', '1000000'))
+
+
+class BDDTooLarge(Exception):
+    pass
+
+
+def build_bdd(feature_model: FeatureModel, max_nodes: int = BDD_MAX_NODES) -> tuple:
+    """
+    (bdd, root, variables) of the model, where `variables` maps each feature name to its BDD variable.
+    The clauses are conjoined in the order of the CNF, which follows the tree, so related features end up
+    close in the variable order. Raises BDDTooLarge past `max_nodes` nodes.
+    """
+    sat_model = FmToPysat(feature_model).transform()
+    bdd = BDD()
+    variables = {name: f'x{index}' for name, index in sat_model.variables.items()}
+    bdd.declare(*(f'x{index}' for index in sorted(sat_model.variables.values())))
+
+    root = bdd.true
+    for clause in sat_model.get_all_clauses():
+        disjunction = bdd.false
+        for literal in clause:
+            variable = bdd.var(f'x{abs(literal)}')
+            disjunction |= variable if literal > 0 else ~variable
+        root &= disjunction
+        if len(bdd) > max_nodes:
+            raise BDDTooLarge(f'The BDD exceeds {max_nodes} nodes')
+    return bdd, root, variables
+
+
+def tree_depth(feature_model: FeatureModel) -> int:
+    """Number of edges in the longest path from the root to a leaf."""
+    depth = 0
+    stack = [(feature_model.root, 0)]
+    while stack:
+        feature, level = stack.pop()
+        depth = max(depth, level)
+        stack.extend((child, level + 1) for child in feature.get_children())
+    return depth
+
+
+def analyze_feature_model(checksum: str, path: str, count_configurations: bool = True,
+                          cache_dir: Optional[str] = None) -> dict:
+    """Pool task: the metrics of a UVL file. The configuration count is None when it is not tractable."""
+    feature_model = parse_feature_model(checksum, path, cache_dir)
+    features = feature_model.get_features()
+    metrics = {
+        'features': len(features),
+        'leaf_features': sum(1 for feature in features if feature.is_leaf()),
+        'cross_tree_constraints': len(feature_model.get_constraints()),
+        'depth': tree_depth(feature_model),
+        'configurations': None,
+    }
+    if count_configurations:
+        try:
+            bdd, root, variables = build_bdd(feature_model)
+            # Stored as a float: counts of large models do not fit in an integer column
+            metrics['configurations'] = float(bdd.count(root, nvars=len(variables)))
+        except (BDDTooLarge, OverflowError):
+            pass
+    return metrics
@@ -0,0 +1,183 @@
+"""
+Feature models compiled to BDDs, for counting, uniform sampling and commonality.
+
+Building the BDD of a model can take minutes, so it is built once per content in the flamapy pool and
+stored, keyed by checksum, as a plain node table that is read back without dd. Nodes are numbered bottom-up:
+0 and 1 are the false and true terminals, and each other node is (level, low, high), where level `i` is the
+variable of the feature `names[i]`. Terminals are at level len(names).
+
+A node's count is its number of satisfying assignments of the variables from its level down. With the counts,
+a sample is drawn by walking from the root and taking each branch with probability proportional to its
+count, so it costs one step per variable, whatever the size of the BDD.
+"""
+import os
+import random
+from typing import Optional
+
+import msgpack
+from flamapy.metamodels.fm_metamodel.models import FeatureModel
+
+from app.modules.flamapy.analysis import BDD_MAX_NODES, build_bdd
+from app.modules.flamapy.configuration import display_name
+from app.modules.flamapy.services import (
+    FLAMAPY_QUEUE_TIMEOUT, feature_model_cache_dir, flamapy_pool, parse_feature_model
+)
+from core.caches.two_tier_cache import TwoTierCache
+
+# Bump whenever the layout changes: entries of other versions are read as misses
+BDD_FORMAT_VERSION = 1
+
+
+class CompiledBDD:
+    def __init__(self, names: list, levels: list, lows: list, highs: list, root: int):
+        self.names = names
+        self.levels = levels
+        self.lows = lows
+        self.highs = highs
+        self.root = root
+        self._commonality = None
+
+        counts = [0, 1]
+        for node in range(2, len(levels)):
+            counts.append(self._branch_count(counts, node, lows[node]) + self._branch_count(counts, node, highs[node]))
+        self.counts = counts
+
+    def _branch_count(self, counts: list, node: int, child: int) -> int:
+        # The variables skipped by the edge take any value
+        return counts[child] << (self.levels[child] - self.levels[node] - 1)
+
+    def count(self) -> int:
+        """Number of configurations of the model."""
+        return self.counts[self.root] << self.levels[self.root]
+
+    def sample(self, size: int, rng: Optional[random.Random] = None) -> list:
+        """`size` configurations drawn uniformly and independently, each as the names of its selected features."""
+        if self.count() == 0:
+            raise ValueError('The model has no configurations')
+        rng = rng or random.Random()
+        samples = []
+        for _ in range(size):
+            selected = [name for name in self.names[:self.levels[self.root]] if rng.getrandbits(1)]
+            node = self.root
+            while node > 1:
+                level, low, high = self.levels[node], self.lows[node], self.highs[node]
+                high_count = self._branch_count(self.counts, node, high)
+                take_high = rng.randrange(high_count + self._branch_count(self.counts, node, low)) < high_count
+                if take_high:
+                    selected.append(self.names[level])
+                node = high if take_high else low
+                selected.extend(name for name in self.names[level + 1:self.levels[node]] if rng.getrandbits(1))
+            samples.append(selected)
+        return samples
+
+    def commonality(self) -> dict:
+        """
+        Number of configurations selecting each feature. A pass down the BDD counts the paths reaching each
+        node, and the models through a node or an edge are its paths times the counts below it.
+        """
+        if self._commonality is None:
+            levels, counts = self.levels, self.counts
+            variables = len(self.names)
+            paths = [0] * len(levels)
+            paths[self.root] = 1 << levels[self.root]
+            selecting = [0] * (variables + 1)
+            # Models through an edge skipping a variable are half with it and half without
+            skipped = [0] * (variables + 1)
+
+            def skip(start: int, end: int, models: int) -> None:
+                if start < end:
+                    skipped[start] += models // 2
+                    skipped[end] -= models // 2
+
+            skip(0, levels[self.root], self.count())
+            for node in range(len(levels) - 1, 1, -1):
+                if not paths[node]:
+                    continue
+                level = levels[node]
+                for child in (self.lows[node], self.highs[node]):
+                    through = paths[node] << (levels[child] - level - 1)
+                    paths[child] += through
+                    skip(level + 1, levels[child], through * counts[child])
+                selecting[level] += paths[node] * self._branch_count(counts, node, self.highs[node])
+
+            commonality, running = {}, 0
+            for level, name in enumerate(self.names):
+                running += skipped[level]
+                commonality[name] = selecting[level] + running
+            self._commonality = commonality
+        return self._commonality
+
+
+def compile_bdd(feature_model: FeatureModel, max_nodes: int = BDD_MAX_NODES) -> CompiledBDD:
+    bdd, root, variables = build_bdd(feature_model, max_nodes)
+    # The node table keeps the current order, which must not change while it is read
+    bdd.configure(reordering=False)
+    names = [None] * len(variables)
+    for name, variable in variables.items():
+        names[bdd.level_of_var(variable)] = display_name(name)
+
+    def children(node) -> tuple:
+        # dd answers the successors of the regular node: those of a complemented node are their negations
+        return (~node.low, ~node.high) if node.negated else (node.low, node.high)
+
+    levels, lows, highs = [len(names), len(names)], [0, 1], [0, 1]
+    numbers = {int(bdd.false): 0, int(bdd.true): 1}
+    stack = [root]
+    while stack:
+        node = stack[-1]
+        if int(node) in numbers:
+            stack.pop()
+            continue
+        low, high = children(node)
+        pending = [child for child in (low, high) if int(child) not in numbers]
+        if pending:
+            stack.extend(pending)
+            continue
+        stack.pop()
+        numbers[int(node)] = len(levels)
+        levels.append(node.level)
+        lows.append(numbers[int(low)])
+        highs.append(numbers[int(high)])
+    return CompiledBDD(names, levels, lows, highs, numbers[int(root)])
+
+
+def dump_compiled_bdd(compiled: CompiledBDD) -> bytes:
+    return msgpack.packb([BDD_FORMAT_VERSION, compiled.names, compiled.levels, compiled.lows, compiled.highs,
+                          compiled.root], use_bin_type=True)
+
+
+def load_compiled_bdd(data: bytes) -> CompiledBDD:
+    format_version, names, levels, lows, highs, root = msgpack.unpackb(data, raw=False)
+    if format_version != BDD_FORMAT_VERSION:
+        raise ValueError(f'Unsupported BDD format version {format_version}')
+    return CompiledBDD(names, levels, lows, highs, root)
+
+
+def compiled_bdd_cache_dir() -> str:
+    return os.getenv('FLAMAPY_BDD_CACHE_DIR') or os.path.join(os.getenv('WORKING_DIR', ''), 'uploads', 'cache',
+                                                              'bdds')
+
+
+# Compiled BDDs by checksum of their UVL file. The memory tier holds at most FLAMAPY_BDD_CACHE_MAX_NODES nodes
+compiled_bdd_cache = TwoTierCache(
+    dump_compiled_bdd,
+    load_compiled_bdd,
+    compiled_bdd_cache_dir,
+    max_weight=int(os.getenv('FLAMAPY_BDD_CACHE_MAX_NODES', '5000000')),
+    weigh=lambda compiled: len(compiled.levels),
+    suffix=f'.v{BDD_FORMAT_VERSION}.bdd',
+)
+
+
+def compile_feature_model(checksum: str, path: str, cache_dir: Optional[str] = None) -> CompiledBDD:
+    """Pool task: the BDD of a UVL file. Raises BDDTooLarge when it exceeds FLAMAPY_BDD_MAX_NODES nodes."""
+    return compile_bdd(parse_feature_model(checksum, path, cache_dir))
+
+
+def compiled_bdd(checksum: str, path: str) -> CompiledBDD:
+    """The BDD of a UVL file, compiled in the flamapy pool the first time its content is seen."""
+    return compiled_bdd_cache.get(
+        checksum,
+        lambda: flamapy_pool.run(compile_feature_model, checksum, path, feature_model_cache_dir(),
+                                 queue_timeout=FLAMAPY_QUEUE_TIMEOUT),
+    )
@@ -0,0 +1,231 @@
+"""
+Interactive configuration of feature models.
+
+A session loads the CNF of a model once into a pysat solver and keeps it while the user configures a
+product. Each selection is passed to the solver as an assumption rather than as a clause, so the solver and
+everything it learnt are reused from one step to the next and a step takes milliseconds.
+
+Sessions live in the memory of the web process that created them: behind several processes, requests of a
+session must be routed to the same one.
+"""
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from pysat.solvers import Solver
+
+CONFIGURATION_SOLVER = os.getenv('FLAMAPY_CONFIGURATION_SOLVER', 'glucose4')
+
+# Sessions kept at once, and seconds a session is kept without being used
+CONFIGURATION_MAX_SESSIONS = int(os.getenv('FLAMAPY_CONFIGURATION_MAX_SESSIONS', '100'))
+CONFIGURATION_IDLE_SECONDS = float(os.getenv('FLAMAPY_CONFIGURATION_IDLE_SECONDS', '900'))
+
+
+class SessionExpired(Exception):
+    pass
+
+
+class UnknownFeature(Exception):
+    pass
+
+
+class SelectionConflict(Exception):
+    """The selection is not possible along with the previous ones, listed in `conflicts`."""
+
+    def __init__(self, feature: Optional[str], conflicts: list):
+        if feature is None:
+            super().__init__("The model has no products")
+        else:
+            super().__init__(f"'{feature}' cannot be chosen along with {', '.join(conflicts) or 'the model'}")
+        self.conflicts = conflicts
+
+
+def display_name(name: str) -> str:
+    # Names with spaces are quoted in UVL
+    return name[1:-1] if len(name) > 1 and name[0] == name[-1] == '"' else name
+
+
+def read_dimacs(path: str) -> tuple:
+    """(features, clauses) of a CNF written by flamapy, where `features` maps each variable to its feature name."""
+    features = {}
+    clauses = []
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if line.startswith('c '):
+                _, variable, name = line.rstrip('\n').split(' ', 2)
+                features[int(variable)] = display_name(name)
+            elif line.strip() and not line.startswith('p '):
+                clauses.append([int(literal) for literal in line.split()[:-1]])
+    return features, clauses
+
+
+class ConfigurationSession:
+    def __init__(self, session_id: str, hubfile_id: int, features: dict, clauses: list):
+        self.id = session_id
+        self.hubfile_id = hubfile_id
+        self.features = features
+        self.variables = {name: variable for variable, name in features.items()}
+        # Feature choices of the user: True when selected, False when deselected
+        self.choices = {}
+        self.last_used = time.monotonic()
+        self._lock = threading.Lock()
+        self._solver = Solver(name=CONFIGURATION_SOLVER, bootstrap_with=clauses)
+        try:
+            self._decided = self._decide(self.choices)
+        except SelectionConflict:
+            # A model without products
+            self.close()
+            raise
+
+    def state(self) -> dict:
+        with self._lock:
+            self._check_open()
+            return self._state()
+
+    def choose(self, feature: str, selected: Optional[bool]) -> dict:
+        """
+        Selects or deselects the feature, or withdraws the choice with None, and returns the new state.
+        Raises SelectionConflict, leaving the session as it was, when no product has the new choices.
+        """
+        with self._lock:
+            self._check_open()
+            variable = self.variables.get(feature)
+            if variable is None:
+                raise UnknownFeature(f"The model has no feature '{feature}'")
+            choices = dict(self.choices)
+            choices.pop(variable, None)
+            if selected is not None:
+                choices[variable] = selected
+            self._decided = self._decide(choices, feature)
+            self.choices = choices
+            return self._state()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._solver is not None:
+                self._solver.delete()
+                self._solver = None
+
+    def _check_open(self) -> None:
+        if self._solver is None:
+            raise SessionExpired(f"The configuration session {self.id} has expired")
+        self.last_used = time.monotonic()
+
+    def _decide(self, choices: dict, feature: str = None) -> dict:
+        """
+        Value of every feature that has the same value in all the products with the given choices. A value is
+        decided when the solver finds no product with the opposite one, and each product found rules out the
+        features it gives another value, so most features cost no solver call.
+        """
+        assumptions = [variable if selected else -variable for variable, selected in choices.items()]
+        if not self._solver.solve(assumptions=assumptions):
+            core = self._solver.get_core() or []
+            conflicts = sorted(self.features[abs(literal)] for literal in core if abs(literal) in self.features)
+            raise SelectionConflict(feature, [name for name in conflicts if name != feature])
+
+        candidates = {abs(literal): literal > 0 for literal in self._solver.get_model()
+                      if abs(literal) in self.features and abs(literal) not in choices}
+        decided = {}
+        while candidates:
+            variable, value = candidates.popitem()
+            literal = variable if value else -variable
+            if self._solver.solve(assumptions=assumptions + [-literal]):
+                for other in self._solver.get_model():
+                    if candidates.get(abs(other), other > 0) != (other > 0):
+                        del candidates[abs(other)]
+            else:
+                decided[variable] = value
+                # Known to hold, it prunes the following calls
+                assumptions.append(literal)
+        return decided
+
+    def _state(self) -> dict:
+        def names(values: dict, selected: bool) -> list:
+            return sorted(self.features[variable] for variable, value in values.items() if value is selected)
+
+        undecided = set(self.features) - set(self.choices) - set(self._decided)
+        return {
+            'session_id': self.id,
+            'file_id': self.hubfile_id,
+            'selected': names(self.choices, True),
+            'deselected': names(self.choices, False),
+            'forced': names(self._decided, True),
+            'impossible': names(self._decided, False),
+            'open': sorted(self.features[variable] for variable in undecided),
+            'complete': not undecided,
+        }
+
+
+class ConfigurationSessions:
+    """
+    Bounded pool of configuration sessions. Sessions unused for `idle_seconds` are evicted, and when the pool
+    is full the least recently used one is evicted to make room. Evicting a session frees its solver.
+    """
+
+    def __init__(self, max_sessions: int = CONFIGURATION_MAX_SESSIONS,
+                 idle_seconds: float = CONFIGURATION_IDLE_SECONDS):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.evictions = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, hubfile_id: int, features: dict, clauses: list) -> ConfigurationSession:
+        session = ConfigurationSession(secrets.token_urlsafe(16), hubfile_id, features, clauses)
+        with self._lock:
+            evicted = self._evict_idle()
+            while len(self._sessions) >= self.max_sessions:
+                evicted.append(self._sessions.popitem(last=False)[1])
+            self._sessions[session.id] = session
+            self.evictions += len(evicted)
+        self._close(evicted)
+        return session
+
+    def get(self, session_id: str) -> ConfigurationSession:
+        with self._lock:
+            evicted = self._evict_idle()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = time.monotonic()
+                self._sessions.move_to_end(session_id)
+            self.evictions += len(evicted)
+        self._close(evicted)
+        if session is None:
+            raise SessionExpired(f"The configuration session {session_id} has expired")
+        return session
+
+    def close(self, session_id: str) -> None:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            session.close()
+
+    def clear(self) -> None:
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        self._close(sessions)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'sessions': len(self._sessions), 'max_sessions': self.max_sessions,
+                    'idle_seconds': self.idle_seconds, 'evictions': self.evictions}
+
+    def _evict_idle(self) -> list:
+        # Sessions are kept in order of use, so the idle ones are at the start
+        evicted = []
+        deadline = time.monotonic() - self.idle_seconds
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.last_used > deadline:
+                break
+            evicted.append(self._sessions.popitem(last=False)[1])
+        return evicted
+
+    def _close(self, sessions: list) -> None:
+        # Outside the pool lock: closing waits for a step running on the session
+        for session in sessions:
+            session.close()
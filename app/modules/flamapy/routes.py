@@ -1,69 +1,79 @@
 import logging
+import os
+import random
+from app.modules.dataset.services import DataSetService
 from app.modules.hubfile.services import HubfileService
-from flask import send_file, jsonify
+from flask import abort, jsonify, make_response, request, send_file
 from app.modules.flamapy import flamapy_bp
-from flamapy.metamodels.fm_metamodel.transformations import UVLReader, GlencoeWriter, SPLOTWriter
-from flamapy.metamodels.pysat_metamodel.transformations import FmToPysat, DimacsWriter
-import tempfile
-import os
-
-from antlr4 import CommonTokenStream, FileStream
-from uvl.UVLCustomLexer import UVLCustomLexer
-from uvl.UVLPythonParser import UVLPythonParser
-from antlr4.error.ErrorListener import ErrorListener
+from app.modules.flamapy.analysis import BDDTooLarge
+from app.modules.flamapy.compilation import compiled_bdd
+from app.modules.flamapy.configuration import SelectionConflict, SessionExpired, UnknownFeature
+from app.modules.flamapy.services import EXPORT_FORMATS, FlamapyService, flamapy_pool
+from core.resources.streaming import zip_response
+from core.workers.process_pool import PoolSaturated, TaskMemoryExceeded, TaskTimeout
 
 logger = logging.getLogger(__name__)
 
+flamapy_service = FlamapyService()
 
-@flamapy_bp.route('/flamapy/check_uvl/<int:file_id>', methods=['GET'])
-def check_uvl(file_id):
-    class CustomErrorListener(ErrorListener):
-        def __init__(self):
-            self.errors = []
-
-        def syntaxError(self, recognizer, offendingSymbol, line, column, msg, e):
-            if "\\t" in msg:
-                warning_message = (
-                    f"The UVL has the following warning that prevents reading it: "
-                    f"Line {line}:{column} - {msg}"
-                )
-                print(warning_message)
-                self.errors.append(warning_message)
-            else:
-                error_message = (
-                    f"The UVL has the following error that prevents reading it: "
-                    f"Line {line}:{column} - {msg}"
-                )
-                self.errors.append(error_message)
+# Seconds a client is asked to wait before retrying when the flamapy pool is saturated
+RETRY_AFTER = 30
 
-    try:
-        hubfile = HubfileService().get_by_id(file_id)
-        input_stream = FileStream(hubfile.get_path())
-        lexer = UVLCustomLexer(input_stream)
+# Files a single batch validation request may check
+CHECK_UVL_BATCH_LIMIT = 500
+
+# Configurations a single sampling request may draw
+SAMPLE_LIMIT = 1000
 
-        error_listener = CustomErrorListener()
 
-        lexer.removeErrorListeners()
-        lexer.addErrorListener(error_listener)
+@flamapy_bp.errorhandler(PoolSaturated)
+def pool_saturated(error):
+    response = jsonify({"message": "The analysis service is busy, please retry later"})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(RETRY_AFTER)
+    return response
 
-        stream = CommonTokenStream(lexer)
-        parser = UVLPythonParser(stream)
 
-        parser.removeErrorListeners()
-        parser.addErrorListener(error_listener)
+@flamapy_bp.errorhandler(TaskTimeout)
+@flamapy_bp.errorhandler(TaskMemoryExceeded)
+@flamapy_bp.errorhandler(BDDTooLarge)
+def task_limit_exceeded(error):
+    return jsonify({"message": f"The model exceeds the analysis limits: {error}"}), 422
 
-        # tree = parser.featureModel()
 
-        if error_listener.errors:
-            return jsonify({"errors": error_listener.errors}), 400
+@flamapy_bp.errorhandler(SessionExpired)
+def session_expired(error):
+    return jsonify({"message": str(error)}), 404
 
-        # Optional: Print the parse tree
-        # print(tree.toStringTree(recog=parser))
 
-        return jsonify({"message": "Valid Model"}), 200
+@flamapy_bp.errorhandler(SelectionConflict)
+def selection_conflict(error):
+    return jsonify({"message": str(error), "conflicts": error.conflicts}), 409
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+
+@flamapy_bp.route('/flamapy/check_uvl/<int:file_id>', methods=['GET'])
+def check_uvl(file_id):
+    hubfile = HubfileService().get_or_404(file_id)
+    errors = flamapy_service.validate([hubfile.get_path()])[0]
+    if errors:
+        return jsonify({"errors": errors}), 400
+    return jsonify({"message": "Valid Model"}), 200
+
+
+@flamapy_bp.route('/flamapy/check_uvl', methods=['POST'])
+def check_uvl_batch():
+    """Validates the files with the ids in the `file_ids` list of the JSON body, in a single pass."""
+    file_ids = (request.get_json(silent=True) or {}).get('file_ids')
+    if not isinstance(file_ids, list) or not all(isinstance(file_id, int) for file_id in file_ids):
+        return jsonify({"message": "file_ids must be a list of file ids"}), 400
+    if len(file_ids) > CHECK_UVL_BATCH_LIMIT:
+        return jsonify({"message": f"At most {CHECK_UVL_BATCH_LIMIT} files can be checked at once"}), 400
+
+    hubfiles = HubfileService().get_by_ids(file_ids)
+    results = {str(file_id): {"valid": False, "errors": ["File not found"]} for file_id in file_ids}
+    for hubfile, errors in zip(hubfiles, flamapy_service.validate([hubfile.get_path() for hubfile in hubfiles])):
+        results[str(hubfile.id)] = {"valid": not errors, "errors": errors}
+    return jsonify({"results": results})
 
 
 @flamapy_bp.route('/flamapy/valid/<int:file_id>', methods=['GET'])
@@ -73,45 +83,135 @@ def valid(file_id):
 
 @flamapy_bp.route('/flamapy/to_glencoe/<int:file_id>', methods=['GET'])
 def to_glencoe(file_id):
-    temp_file = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
-    try:
-        hubfile = HubfileService().get_or_404(file_id)
-        fm = UVLReader(hubfile.get_path()).transform()
-        GlencoeWriter(temp_file.name, fm).transform()
-
-        # Return the file in the response
-        return send_file(temp_file.name, as_attachment=True, download_name=f'{hubfile.name}_glencoe.txt')
-    finally:
-        # Clean up the temporary file
-        os.remove(temp_file.name)
+    return send_export(file_id, 'glencoe')
 
 
 @flamapy_bp.route('/flamapy/to_splot/<int:file_id>', methods=['GET'])
 def to_splot(file_id):
-    temp_file = tempfile.NamedTemporaryFile(suffix='.splx', delete=False)
-    try:
-        hubfile = HubfileService().get_by_id(file_id)
-        fm = UVLReader(hubfile.get_path()).transform()
-        SPLOTWriter(temp_file.name, fm).transform()
-
-        # Return the file in the response
-        return send_file(temp_file.name, as_attachment=True, download_name=f'{hubfile.name}_splot.txt')
-    finally:
-        # Clean up the temporary file
-        os.remove(temp_file.name)
+    return send_export(file_id, 'splot')
 
 
 @flamapy_bp.route('/flamapy/to_cnf/<int:file_id>', methods=['GET'])
 def to_cnf(file_id):
-    temp_file = tempfile.NamedTemporaryFile(suffix='.cnf', delete=False)
+    return send_export(file_id, 'cnf')
+
+
+def send_export(file_id, export_format):
+    """
+    Streams the stored conversion of the file. Artifacts only change with the file content or the flamapy
+    version, which make up the ETag, so a client holding it gets a 304 without the artifact being read.
+    """
+    hubfile = HubfileService().get_or_404(file_id)
+    etag = flamapy_service.export_etag(hubfile, export_format)
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+
+    path = flamapy_service.export(hubfile, export_format)
+    return send_file(path, as_attachment=True, download_name=f'{hubfile.name}_{export_format}.txt', etag=etag,
+                     conditional=True)
+
+
+@flamapy_bp.route('/flamapy/dataset/<int:dataset_id>/to/<export_format>', methods=['GET'])
+def dataset_to(dataset_id, export_format):
+    """
+    Streams a ZIP archive with every file of the dataset converted to `export_format`, each entry sent as
+    soon as its conversion finishes. A file that cannot be converted gets an error entry instead.
+    """
+    if export_format not in EXPORT_FORMATS:
+        abort(404)
+    dataset = DataSetService().get_or_404(dataset_id)
+    # Once the archive starts the status can no longer change, so a saturated pool is reported up front
+    stats = flamapy_pool.stats()
+    if stats['queued'] >= stats['max_queue']:
+        raise PoolSaturated('Every worker is busy and the queue is full')
+
+    _, suffix = EXPORT_FORMATS[export_format]
+
+    def entries():
+        names = set()
+        for hubfile, path, error in flamapy_service.export_files(dataset.files(), export_format):
+            name = os.path.splitext(hubfile.name)[0]
+            if name in names:
+                name = f'{name}_{hubfile.id}'
+            names.add(name)
+            if error is None:
+                yield name + suffix, path
+            else:
+                logger.warning(f"Could not convert file {hubfile.id} to {export_format}: {error}")
+                yield f'{name}.error.txt', f'{type(error).__name__}: {error}\n'.encode('utf-8')
+
+    return zip_response(entries(), f'dataset_{dataset_id}_{export_format}.zip')
+
+
+@flamapy_bp.route('/flamapy/configure/<int:file_id>', methods=['POST'])
+def configure(file_id):
+    """
+    Opens a session to configure a product of the model, answering with the features that are already
+    decided. The session is then updated by posting choices to it.
+    """
+    hubfile = HubfileService().get_or_404(file_id)
+    session = flamapy_service.configure(hubfile)
+    return jsonify(session.state()), 201
+
+
+@flamapy_bp.route('/flamapy/configure/sessions/<session_id>', methods=['GET', 'POST', 'DELETE'])
+def configuration_session(session_id):
+    """
+    GET answers with the state of the session. POST selects (`selected` true) or deselects (false) the
+    `feature` of the JSON body, or withdraws its choice (null), and answers with the features now forced or
+    impossible. DELETE closes the session.
+    """
+    if request.method == 'DELETE':
+        flamapy_service.close_configuration_session(session_id)
+        return '', 204
+
+    session = flamapy_service.configuration_session(session_id)
+    if request.method == 'GET':
+        return jsonify(session.state())
+
+    body = request.get_json(silent=True) or {}
+    feature, selected = body.get('feature'), body.get('selected')
+    if not isinstance(feature, str) or not (selected is None or isinstance(selected, bool)):
+        return jsonify({"message": "feature must be a feature name and selected true, false or null"}), 400
     try:
-        hubfile = HubfileService().get_by_id(file_id)
-        fm = UVLReader(hubfile.get_path()).transform()
-        sat = FmToPysat(fm).transform()
-        DimacsWriter(temp_file.name, sat).transform()
-
-        # Return the file in the response
-        return send_file(temp_file.name, as_attachment=True, download_name=f'{hubfile.name}_cnf.txt')
-    finally:
-        # Clean up the temporary file
-        os.remove(temp_file.name)
+        return jsonify(session.choose(feature, selected))
+    except UnknownFeature as exc:
+        return jsonify({"message": str(exc)}), 400
+
+
+@flamapy_bp.route('/flamapy/bdd/<int:file_id>/count', methods=['GET'])
+def bdd_count(file_id):
+    hubfile = HubfileService().get_or_404(file_id)
+    return jsonify({"configurations": compiled_bdd(hubfile.checksum, hubfile.get_path()).count()})
+
+
+@flamapy_bp.route('/flamapy/bdd/<int:file_id>/sample', methods=['GET'])
+def bdd_sample(file_id):
+    """
+    `size` configurations of the model drawn uniformly, each as the list of its selected features. With a
+    `seed`, the same sample is drawn again.
+    """
+    size = request.args.get('size', 1, type=int)
+    seed = request.args.get('seed', type=int)
+    if not 1 <= size <= SAMPLE_LIMIT:
+        return jsonify({"message": f"size must be between 1 and {SAMPLE_LIMIT}"}), 400
+    hubfile = HubfileService().get_or_404(file_id)
+    compiled = compiled_bdd(hubfile.checksum, hubfile.get_path())
+    if compiled.count() == 0:
+        return jsonify({"message": "The model has no configurations"}), 422
+    return jsonify({"samples": compiled.sample(size, random.Random(seed))})
+
+
+@flamapy_bp.route('/flamapy/bdd/<int:file_id>/commonality', methods=['GET'])
+def bdd_commonality(file_id):
+    """Share of the configurations of the model that select each feature."""
+    hubfile = HubfileService().get_or_404(file_id)
+    compiled = compiled_bdd(hubfile.checksum, hubfile.get_path())
+    configurations = compiled.count()
+    return jsonify({
+        "configurations": configurations,
+        "commonality": {name: selecting / configurations if configurations else 0.0
+                        for name, selecting in compiled.commonality().items()},
+    })
@@ -0,0 +1,89 @@
+"""
+Compact msgpack form of flamapy feature models, so a parsed model can be stored and read back without
+running the UVL parser again.
+
+Features are stored in preorder as (name, parent index, abstract, attributes), relations in the order
+of their parent's relations as (parent index, child indexes, min, max) and constraints as (name, tree),
+where a tree node is (0, operation, left, right) for operations and (1, value) for leaves.
+"""
+import msgpack
+from flamapy.core.models.ast import AST, ASTOperation, Node
+from flamapy.metamodels.fm_metamodel.models import Attribute, Constraint, Domain, Feature, FeatureModel, Range, Relation
+
+# Bump whenever the layout changes: entries of other versions are read as misses
+FORMAT_VERSION = 1
+
+
+def dump_feature_model(feature_model: FeatureModel) -> bytes:
+    features = []
+    indexes = {}
+    relations = []
+
+    stack = [feature_model.root]
+    while stack:
+        feature = stack.pop()
+        indexes[id(feature)] = len(features)
+        parent = indexes.get(id(feature.parent)) if feature.parent is not None else None
+        features.append([feature.name, parent, feature.is_abstract,
+                         [dump_attribute(attribute) for attribute in feature.get_attributes()]])
+        for relation in feature.get_relations():
+            relations.append(relation)
+        # Reversed so children are popped, and numbered, in their declaration order
+        stack.extend(child for relation in reversed(feature.get_relations()) for child in reversed(relation.children))
+
+    return msgpack.packb([
+        FORMAT_VERSION,
+        features,
+        [[indexes[id(relation.parent)], [indexes[id(child)] for child in relation.children],
+          relation.card_min, relation.card_max] for relation in relations],
+        [[constraint.name, dump_node(constraint.ast.root)] for constraint in feature_model.get_constraints()],
+    ], use_bin_type=True)
+
+
+def load_feature_model(data: bytes) -> FeatureModel:
+    version, features, relations, constraints = msgpack.unpackb(data, raw=False, strict_map_key=False)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported feature model format {version}")
+
+    loaded = []
+    for name, parent, is_abstract, attributes in features:
+        feature = Feature(name, [], parent=loaded[parent] if parent is not None else None, is_abstract=is_abstract)
+        for attribute in attributes:
+            feature.add_attribute(load_attribute(attribute))
+        loaded.append(feature)
+
+    for parent, children, card_min, card_max in relations:
+        loaded[parent].add_relation(Relation(loaded[parent], [loaded[child] for child in children], card_min, card_max))
+
+    return FeatureModel(loaded[0], [Constraint(name, AST(load_node(tree))) for name, tree in constraints])
+
+
+def dump_attribute(attribute: Attribute) -> list:
+    domain = attribute.domain
+    if domain is not None:
+        domain = [[[item.min_value, item.max_value] for item in domain.get_range_list()], domain.get_element_list()]
+    return [attribute.name, domain, attribute.default_value, attribute.null_value]
+
+
+def load_attribute(data: list) -> Attribute:
+    name, domain, default_value, null_value = data
+    if domain is not None:
+        ranges, elements = domain
+        domain = Domain([Range(minimum, maximum) for minimum, maximum in ranges], elements)
+    return Attribute(name, domain, default_value, null_value)
+
+
+def dump_node(node: Node):
+    if node is None:
+        return None
+    if isinstance(node.data, ASTOperation):
+        return [0, node.data.value, dump_node(node.left), dump_node(node.right)]
+    return [1, node.data]
+
+
+def load_node(data) -> Node:
+    if data is None:
+        return None
+    if data[0] == 0:
+        return Node(ASTOperation(data[1]), load_node(data[2]), load_node(data[3]))
+    return Node(data[1])
@@ -1,7 +1,189 @@
-from app.modules.flamapy.repositories import FlamapyRepository
-from core.services.BaseService import BaseService
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from importlib.metadata import PackageNotFoundError, version
+from typing import Optional
 
+from flamapy.metamodels.fm_metamodel.models import FeatureModel
+from flamapy.metamodels.fm_metamodel.transformations import GlencoeWriter, SPLOTWriter, UVLReader
+from flamapy.metamodels.pysat_metamodel.transformations import DimacsWriter, FmToPysat
 
-class FlamapyService(BaseService):
-    def __init__(self):
-        super().__init__(FlamapyRepository())
+from app.modules.flamapy.configuration import ConfigurationSession, ConfigurationSessions, read_dimacs
+from app.modules.flamapy.serialization import FORMAT_VERSION, dump_feature_model, load_feature_model
+from app.modules.flamapy.validation import validate_uvl_files
+from app.modules.hubfile.models import Hubfile
+from core.caches.artifact_store import ArtifactStore
+from core.caches.two_tier_cache import TwoTierCache
+from core.workers.process_pool import ProcessPool
+
+
+def feature_model_cache_dir() -> str:
+    return os.getenv('FLAMAPY_CACHE_DIR') or os.path.join(os.getenv('WORKING_DIR', ''), 'uploads', 'cache',
+                                                          'feature_models')
+
+
+def feature_model_weight(feature_model: FeatureModel) -> int:
+    return len(feature_model.get_features()) + len(feature_model.get_constraints())
+
+
+# Parsed feature models by checksum of their UVL file. The memory tier holds at most
+# FLAMAPY_CACHE_MAX_FEATURES features and constraints per worker
+feature_model_cache = TwoTierCache(
+    dump_feature_model,
+    load_feature_model,
+    feature_model_cache_dir,
+    max_weight=int(os.getenv('FLAMAPY_CACHE_MAX_FEATURES', '200000')),
+    weigh=feature_model_weight,
+    suffix=f'.v{FORMAT_VERSION}.msgpack',
+)
+
+
+def parse_feature_model(checksum: str, path: str, cache_dir: Optional[str] = None) -> FeatureModel:
+    """
+    The feature model of a UVL file, parsed only the first time its content is seen. The model is shared
+    with the other callers and must not be modified. Pool tasks pass the `cache_dir` of the process that
+    submitted them, as pool workers keep the environment of the process that started the pool.
+    """
+    return feature_model_cache.get(checksum, lambda: UVLReader(path).transform(), directory=cache_dir)
+
+
+def flamapy_version() -> str:
+    """Versions of the flamapy packages the exports depend on: a new version regenerates the artifacts."""
+    versions = []
+    for package in ('flamapy-fw', 'flamapy-fm', 'flamapy-sat'):
+        try:
+            versions.append(version(package))
+        except PackageNotFoundError:
+            versions.append('none')
+    return '+'.join(dict.fromkeys(versions))
+
+
+FLAMAPY_VERSION = flamapy_version()
+
+
+def artifact_dir() -> str:
+    # Absolute, as send_file resolves relative paths against the application package
+    return os.path.abspath(os.getenv('FLAMAPY_ARTIFACT_DIR') or os.path.join(os.getenv('WORKING_DIR', ''), 'uploads',
+                                                                             'cache', 'artifacts'))
+
+
+def write_glencoe(feature_model: FeatureModel, path: str) -> None:
+    GlencoeWriter(path, feature_model).transform()
+
+
+def write_splot(feature_model: FeatureModel, path: str) -> None:
+    SPLOTWriter(path, feature_model).transform()
+
+
+def write_cnf(feature_model: FeatureModel, path: str) -> None:
+    DimacsWriter(path, FmToPysat(feature_model).transform()).transform()
+
+
+# Export formats: writer and file suffix
+EXPORT_FORMATS = {
+    'glencoe': (write_glencoe, '.json'),
+    'splot': (write_splot, '.splx'),
+    'cnf': (write_cnf, '.cnf'),
+}
+
+artifact_store = ArtifactStore(artifact_dir)
+
+# Flamapy work runs in its own processes, so web workers are never tied up by a large model
+flamapy_pool = ProcessPool(
+    max_workers=int(os.getenv('FLAMAPY_POOL_WORKERS', '2')),
+    max_queue=int(os.getenv('FLAMAPY_POOL_QUEUE', '8')),
+    time_limit=float(os.getenv('FLAMAPY_TASK_TIMEOUT', '120')),
+    memory_limit=int(os.getenv('FLAMAPY_TASK_MEMORY_MB', '2048')) * 1024 * 1024,
+    preload=('app.modules.flamapy.services', 'app.modules.flamapy.analysis', 'app.modules.flamapy.compilation'),
+)
+
+# Seconds a task may wait for a free worker before the request is turned away
+FLAMAPY_QUEUE_TIMEOUT = float(os.getenv('FLAMAPY_QUEUE_TIMEOUT', '30'))
+
+configuration_sessions = ConfigurationSessions()
+
+
+def export_feature_model(checksum: str, source_path: str, export_format: str, path: str,
+                         cache_dir: Optional[str] = None) -> None:
+    """Pool task: writes the UVL file converted to `export_format` to `path`."""
+    writer, _ = EXPORT_FORMATS[export_format]
+    writer(parse_feature_model(checksum, source_path, cache_dir), path)
+
+
+class FlamapyService:
+    def feature_model(self, hubfile: Hubfile) -> FeatureModel:
+        return parse_feature_model(hubfile.checksum, hubfile.get_path())
+
+    def export_etag(self, hubfile: Hubfile, export_format: str) -> str:
+        return artifact_store.etag(hubfile.checksum, export_format, FLAMAPY_VERSION)
+
+    def export(self, hubfile: Hubfile, export_format: str) -> str:
+        """
+        Path of the file converted to `export_format`, generated the first time the file content is
+        exported to it with the installed flamapy version.
+        """
+        return self._export(hubfile.checksum, hubfile.get_path(), export_format)
+
+    def export_files(self, hubfiles: list, export_format: str):
+        """
+        Converts the files to `export_format` in parallel, yielding (hubfile, path, error) as each conversion
+        finishes: stored artifacts right away, then the others as the pool completes them. At most one task
+        per pool worker is waiting at a time, so a large dataset does not fill the queue for everyone else.
+        """
+        _, suffix = EXPORT_FORMATS[export_format]
+        pending = []
+        for hubfile in hubfiles:
+            path = artifact_store.path(hubfile.checksum, export_format, FLAMAPY_VERSION, suffix=suffix)
+            if os.path.exists(path):
+                yield hubfile, path, None
+            else:
+                pending.append((hubfile, hubfile.get_path()))
+
+        executor = ThreadPoolExecutor(max_workers=flamapy_pool.max_workers)
+        try:
+            futures = {executor.submit(self._export, hubfile.checksum, source_path, export_format): hubfile
+                       for hubfile, source_path in pending}
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as exc:
+                    yield futures[future], None, exc
+        finally:
+            # A client that goes away stops the conversions that have not started yet
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _export(self, checksum: str, source_path: str, export_format: str) -> str:
+        _, suffix = EXPORT_FORMATS[export_format]
+        return artifact_store.get_or_create(
+            (checksum, export_format, FLAMAPY_VERSION),
+            lambda path: flamapy_pool.run(export_feature_model, checksum, source_path, export_format, path,
+                                          feature_model_cache_dir(), queue_timeout=FLAMAPY_QUEUE_TIMEOUT),
+            suffix=suffix,
+        )
+
+    def validate(self, paths: list) -> list:
+        """
+        Syntax errors of each UVL file, in order. The files are split in one chunk per pool worker, so a
+        batch costs a task per worker rather than one per file.
+        """
+        if not paths:
+            return []
+        size = -(-len(paths) // flamapy_pool.max_workers)
+        tasks = []
+        try:
+            for start in range(0, len(paths), size):
+                tasks.append(flamapy_pool.submit(validate_uvl_files, paths[start:start + size]))
+            return [errors for task in tasks for errors in task.result()]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def configure(self, hubfile: Hubfile) -> ConfigurationSession:
+        """Opens a configuration session on the stored CNF of the file, generated in the pool the first time."""
+        features, clauses = read_dimacs(self._export(hubfile.checksum, hubfile.get_path(), 'cnf'))
+        return configuration_sessions.create(hubfile.id, features, clauses)
+
+    def configuration_session(self, session_id: str) -> ConfigurationSession:
+        return configuration_sessions.get(session_id)
+
+    def close_configuration_session(self, session_id: str) -> None:
+        configuration_sessions.close(session_id)
@@ -1,4 +1,25 @@
+import os
+import tempfile
+import time
+import zipfile
+from io import BytesIO
+from unittest.mock import patch
+
 import pytest
+from flamapy.metamodels.fm_metamodel.transformations import UVLReader
+from flamapy.metamodels.pysat_metamodel.transformations import DimacsWriter, FmToPysat
+
+from app.modules.flamapy.analysis import BDDTooLarge
+from app.modules.flamapy.compilation import compiled_bdd_cache
+from app.modules.flamapy.configuration import ConfigurationSessions, SessionExpired, read_dimacs
+from app.modules.flamapy.serialization import dump_feature_model, load_feature_model
+from app.modules.flamapy.services import feature_model_cache, feature_model_weight, flamapy_pool
+from app.modules.flamapy.validation import validate_uvl
+from app.modules.dataset.models import DataSet
+from app.modules.hubfile.models import Hubfile
+from app.modules.utils.utilsdb import create_dataset_db
+from core.caches.two_tier_cache import TwoTierCache
+from core.workers.process_pool import PoolSaturated, ProcessPool, TaskCancelled, TaskMemoryExceeded, TaskTimeout
 
 
 @pytest.fixture(scope='module')
@@ -7,9 +28,7 @@ def test_client(test_client):
     Extends the test_client fixture to add additional specific data for module testing.
     """
     with test_client.application.app_context():
-        # Add HERE new elements to the database that you want to exist in the test context.
-        # DO NOT FORGET to use db.session.add(<element>) and db.session.commit() to save the data.
-        pass
+        create_dataset_db(1)
 
     yield test_client
 
@@ -22,3 +41,262 @@ def test_sample_assertion(test_client):
     """
     greeting = "Hello, World!"
     assert greeting == "Hello, World!", "The greeting does not coincide with 'Hello, World!'"
+
+
+def test_feature_model_round_trip():
+    path = 'app/modules/dataset/uvl_examples/file1.uvl'
+    feature_model = UVLReader(path).transform()
+    loaded = load_feature_model(dump_feature_model(feature_model))
+
+    assert [feature.name for feature in loaded.get_features()] == \
+        [feature.name for feature in feature_model.get_features()]
+    assert [str(constraint.ast) for constraint in loaded.get_constraints()] == \
+        [str(constraint.ast) for constraint in feature_model.get_constraints()]
+    assert dimacs(loaded) == dimacs(feature_model)
+
+
+def test_feature_model_cache_tiers(tmp_path):
+    parses = []
+
+    def parse():
+        parses.append(1)
+        return UVLReader('app/modules/dataset/uvl_examples/file1.uvl').transform()
+
+    cache = TwoTierCache(dump_feature_model, load_feature_model, str(tmp_path), max_weight=100,
+                         weigh=feature_model_weight)
+    first = cache.get('abc123', parse)
+    assert cache.get('abc123', parse) is first
+    assert os.path.exists(cache.path('abc123'))
+
+    # Another worker, or this one after eviction, reads the disk tier instead of parsing
+    other = TwoTierCache(dump_feature_model, load_feature_model, str(tmp_path), max_weight=100,
+                         weigh=feature_model_weight)
+    assert dimacs(other.get('abc123', parse)) == dimacs(first)
+    assert len(parses) == 1
+    assert other.stats()['disk_hits'] == 1
+
+    # Another directory, e.g. the one a task was given, shares no entry with the configured one
+    cache.get('abc123', parse, directory=str(tmp_path / 'other'))
+    assert len(parses) == 2 and os.path.exists(cache.path('abc123', str(tmp_path / 'other')))
+
+    # The memory tier is bounded by the number of features and constraints
+    small = TwoTierCache(dump_feature_model, load_feature_model, str(tmp_path), max_weight=20,
+                         weigh=feature_model_weight)
+    small.get('abc123', parse)
+    small.get('def456', parse)
+    assert small.stats()['entries'] == 1 and small.stats()['weight'] <= 20
+
+
+def test_exports_are_stored_and_revalidated(test_client, monkeypatch, tmp_path):
+    monkeypatch.setenv('WORKING_DIR', os.getenv('WORKING_DIR', ''))
+    monkeypatch.setenv('FLAMAPY_CACHE_DIR', str(tmp_path / 'models'))
+    monkeypatch.setenv('FLAMAPY_ARTIFACT_DIR', str(tmp_path / 'artifacts'))
+    feature_model_cache.clear()
+    with test_client.application.app_context():
+        hubfile = Hubfile.query.first()
+        hubfile_id, path = hubfile.id, hubfile.get_path()
+
+    response = test_client.get(f'/flamapy/to_cnf/{hubfile_id}')
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == dimacs(UVLReader(path).transform())
+    etag = response.headers['ETag']
+    stored = list((tmp_path / 'artifacts').rglob('*.cnf'))
+    assert len(stored) == 1
+    # The pool worker parsed the model into the cache directory of this process
+    assert list((tmp_path / 'models').rglob('*.msgpack'))
+
+    # The artifact is served again without converting, and revalidated without being read
+    with patch.object(flamapy_pool, 'run') as run:
+        assert test_client.get(f'/flamapy/to_cnf/{hubfile_id}').get_data() == response.get_data()
+        response = test_client.get(f'/flamapy/to_cnf/{hubfile_id}', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        run.assert_not_called()
+
+    for export_format in ('glencoe', 'splot'):
+        response = test_client.get(f'/flamapy/to_{export_format}/{hubfile_id}')
+        assert response.status_code == 200 and response.headers['ETag'] != etag
+    assert test_client.get('/flamapy/to_splot/999999').status_code == 404
+
+    # New conversions are turned away while the pool is saturated
+    with patch.object(flamapy_pool, 'run', side_effect=PoolSaturated()):
+        for path in (tmp_path / 'artifacts').rglob('*.json'):
+            path.unlink()
+        response = test_client.get(f'/flamapy/to_glencoe/{hubfile_id}')
+        assert response.status_code == 503 and response.headers['Retry-After']
+
+
+def test_dataset_is_converted_into_one_archive(test_client, monkeypatch, tmp_path):
+    monkeypatch.setenv('WORKING_DIR', os.getenv('WORKING_DIR', ''))
+    monkeypatch.setenv('FLAMAPY_CACHE_DIR', str(tmp_path / 'models'))
+    monkeypatch.setenv('FLAMAPY_ARTIFACT_DIR', str(tmp_path / 'artifacts'))
+    feature_model_cache.clear()
+    with test_client.application.app_context():
+        create_dataset_db(40, num_files=3)
+        create_dataset_db(45, valid=False)
+        invalid, dataset = DataSet.query.order_by(DataSet.id.desc()).limit(2).all()
+        dataset_id, invalid_id = dataset.id, invalid.id
+        hubfile = dataset.files()[0]
+        hubfile_id = hubfile.id
+        expected = {os.path.splitext(file.name)[0] + '.cnf': dimacs(UVLReader(file.get_path()).transform())
+                    for file in dataset.files()}
+
+    # One file is already stored, the others are converted for the archive
+    assert test_client.get(f'/flamapy/to_cnf/{hubfile_id}').status_code == 200
+    response = test_client.get(f'/flamapy/dataset/{dataset_id}/to/cnf')
+    assert response.status_code == 200 and response.mimetype == 'application/zip'
+    assert archive_contents(response) == expected
+    assert len(list((tmp_path / 'artifacts').rglob('*.cnf'))) == 3
+
+    # Every conversion is reused the next time
+    with patch.object(flamapy_pool, 'run') as run:
+        assert archive_contents(test_client.get(f'/flamapy/dataset/{dataset_id}/to/cnf')) == expected
+        run.assert_not_called()
+
+    response = test_client.get(f'/flamapy/dataset/{invalid_id}/to/splot')
+    assert list(archive_contents(response)) == ['invalidfile.error.txt']
+    assert test_client.get(f'/flamapy/dataset/{dataset_id}/to/pdf').status_code == 404
+    assert test_client.get('/flamapy/dataset/999999/to/cnf').status_code == 404
+
+
+def test_uvl_files_are_fully_parsed(test_client, monkeypatch):
+    monkeypatch.setenv('WORKING_DIR', os.getenv('WORKING_DIR', ''))
+    with test_client.application.app_context():
+        create_dataset_db(46, valid=False)
+        valid_id = Hubfile.query.filter_by(checksum='checksum1').first().id
+        invalid_id = Hubfile.query.filter_by(checksum='checksum46').first().id
+
+    assert test_client.get(f'/flamapy/check_uvl/{valid_id}').get_json() == {'message': 'Valid Model'}
+    response = test_client.get(f'/flamapy/check_uvl/{invalid_id}')
+    assert response.status_code == 400 and response.get_json()['errors']
+
+    # Errors found only by the parser are reported too
+    with tempfile.NamedTemporaryFile('w', suffix='.uvl') as uvl_file:
+        uvl_file.write('features\n    A\n        optional\n            B\n\nconstraints\n    B =>\n')
+        uvl_file.flush()
+        assert len(validate_uvl(uvl_file.name)) == 1
+
+    response = test_client.post('/flamapy/check_uvl', json={'file_ids': [valid_id, invalid_id, 999999]})
+    results = response.get_json()['results']
+    assert results[str(valid_id)] == {'valid': True, 'errors': []}
+    assert not results[str(invalid_id)]['valid'] and results[str(invalid_id)]['errors']
+    assert results['999999'] == {'valid': False, 'errors': ['File not found']}
+    assert test_client.post('/flamapy/check_uvl', json={'file_ids': 'all'}).status_code == 400
+
+
+def test_process_pool_limits():
+    pool = ProcessPool(max_workers=1, max_queue=1, time_limit=10, memory_limit=2 << 30)
+    assert pool.run(pow, 2, 10) == 1024
+    with pytest.raises(ValueError):
+        pool.run(int, 'not a number')
+
+    with pytest.raises(TaskTimeout):
+        pool.run(time.sleep, 10, time_limit=0.5)
+    # Memory errors are reported and the worker is replaced
+    with pytest.raises(TaskMemoryExceeded):
+        pool.run(bytearray, 8 << 30)
+    assert pool.run(pow, 3, 3) == 27
+
+    running = pool.submit(time.sleep, 10)
+    while pool.stats()['running'] == 0:
+        time.sleep(0.01)
+    queued = pool.submit(time.sleep, 10)
+    with pytest.raises(PoolSaturated):
+        pool.submit(pow, 2, 2)
+    assert queued.cancel() and running.cancel()
+    with pytest.raises(TaskCancelled):
+        running.result(5)
+    assert pool.run(pow, 2, 3, queue_timeout=5) == 8
+    assert pool.stats()['rejected'] == 1
+
+
+def test_configuration_sessions(test_client, monkeypatch, tmp_path):
+    monkeypatch.setenv('WORKING_DIR', os.getenv('WORKING_DIR', ''))
+    monkeypatch.setenv('FLAMAPY_CACHE_DIR', str(tmp_path / 'models'))
+    monkeypatch.setenv('FLAMAPY_ARTIFACT_DIR', str(tmp_path / 'artifacts'))
+    feature_model_cache.clear()
+    with test_client.application.app_context():
+        hubfile_id = Hubfile.query.first().id
+
+    response = test_client.post(f'/flamapy/configure/{hubfile_id}')
+    assert response.status_code == 201
+    state = response.get_json()
+    assert state['forced'] == ['Chat', 'Connection', 'Messages'] and state['impossible'] == []
+    url = f"/flamapy/configure/sessions/{state['session_id']}"
+
+    state = test_client.post(url, json={'feature': 'Server', 'selected': True}).get_json()
+    assert state['selected'] == ['Server'] and state['impossible'] == ['Peer 2 Peer']
+    assert 'Data Storage' in state['forced']
+    state = test_client.post(url, json={'feature': 'Video', 'selected': True}).get_json()
+    assert 'Media Player' in state['forced'] and not state['complete']
+
+    response = test_client.post(url, json={'feature': 'Media Player', 'selected': False})
+    assert response.status_code == 409 and 'Video' in response.get_json()['conflicts']
+    assert test_client.get(url).get_json() == state, "A conflicting choice changed the session"
+    assert test_client.post(url, json={'feature': 'Nope', 'selected': True}).status_code == 400
+
+    state = test_client.post(url, json={'feature': 'Server', 'selected': None}).get_json()
+    assert state['selected'] == ['Video'] and state['impossible'] == []
+    assert test_client.delete(url).status_code == 204
+    assert test_client.get(url).status_code == 404
+
+    # Idle sessions and, once the pool is full, the least recently used ones are evicted
+    features, clauses = read_dimacs(next((tmp_path / 'artifacts').rglob('*.cnf')))
+    sessions = ConfigurationSessions(max_sessions=2, idle_seconds=60)
+    first, second = sessions.create(1, features, clauses), sessions.create(1, features, clauses)
+    sessions.get(first.id)
+    sessions.create(1, features, clauses)
+    with pytest.raises(SessionExpired):
+        sessions.get(second.id)
+    with pytest.raises(SessionExpired):
+        second.state()
+    first.last_used -= 61
+    with pytest.raises(SessionExpired):
+        sessions.get(first.id)
+    assert sessions.stats()['sessions'] == 1 and sessions.evictions == 2
+
+
+def test_compiled_bdds(test_client, monkeypatch, tmp_path):
+    monkeypatch.setenv('WORKING_DIR', os.getenv('WORKING_DIR', ''))
+    monkeypatch.setenv('FLAMAPY_CACHE_DIR', str(tmp_path / 'models'))
+    monkeypatch.setenv('FLAMAPY_BDD_CACHE_DIR', str(tmp_path / 'bdds'))
+    feature_model_cache.clear()
+    compiled_bdd_cache.clear()
+    with test_client.application.app_context():
+        hubfile_id = Hubfile.query.first().id
+
+    assert test_client.get(f'/flamapy/bdd/{hubfile_id}/count').get_json() == {'configurations': 24}
+    assert len(list((tmp_path / 'bdds').rglob('*.bdd'))) == 1
+
+    # Compiled once, then every request is answered from the stored BDD
+    compiled_bdd_cache.clear()
+    with patch.object(flamapy_pool, 'run') as run:
+        response = test_client.get(f'/flamapy/bdd/{hubfile_id}/sample?size=200&seed=7')
+        samples = response.get_json()['samples']
+        assert test_client.get(f'/flamapy/bdd/{hubfile_id}/sample?size=200&seed=7').get_json()['samples'] == samples
+        commonality = test_client.get(f'/flamapy/bdd/{hubfile_id}/commonality').get_json()['commonality']
+        run.assert_not_called()
+
+    assert len(samples) == 200 and len({frozenset(sample) for sample in samples}) > 12
+    for sample in samples:
+        assert {'Chat', 'Connection', 'Messages'} <= set(sample)
+        assert ('Server' in sample) != ('Peer 2 Peer' in sample)
+        assert 'Server' not in sample or 'Data Storage' in sample
+    assert commonality['Chat'] == 1 and commonality['Server'] == 8 / 24 and commonality['Media Player'] == 21 / 24
+    assert test_client.get(f'/flamapy/bdd/{hubfile_id}/sample?size=0').status_code == 400
+
+    # Models whose BDD exceeds the limit are turned away
+    with patch('app.modules.flamapy.compilation.compiled_bdd_cache.get', side_effect=BDDTooLarge('Too large')):
+        assert test_client.get(f'/flamapy/bdd/{hubfile_id}/count').status_code == 422
+
+
+def dimacs(feature_model) -> str:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'model.cnf')
+        DimacsWriter(path, FmToPysat(feature_model).transform()).transform()
+        with open(path) as cnf_file:
+            return cnf_file.read()
+
+
+def archive_contents(response) -> dict:
+    with zipfile.ZipFile(BytesIO(response.get_data())) as archive:
+        return {name: archive.read(name).decode('utf-8') for name in archive.namelist()}
@@ -0,0 +1,97 @@
+"""
+Full syntax validation of UVL files: the file is lexed and parsed with the UVL grammar, so every error
+that would prevent reading it is reported, not only the lexer ones.
+
+The grammar's ATN is deserialized when the parser module is imported, and the prediction DFA built while
+parsing is shared by every parser in the process. Importing this module parses a small model, so a worker
+pays for both once and each validation costs only its own parse.
+"""
+from antlr4 import CommonTokenStream, FileStream, InputStream
+from antlr4.atn.PredictionMode import PredictionMode
+from antlr4.error.ErrorListener import ErrorListener
+from antlr4.error.ErrorStrategy import BailErrorStrategy
+from antlr4.error.Errors import ParseCancellationException
+from uvl.UVLCustomLexer import UVLCustomLexer
+from uvl.UVLPythonParser import UVLPythonParser
+
+WARM_UP_MODEL = '''features
+    Root
+        mandatory
+            A
+        optional
+            "B C"
+        alternative
+            D
+            E
+
+constraints
+    A => "B C"
+    D | !E
+'''
+
+
+class UVLErrorListener(ErrorListener):
+    def __init__(self):
+        self.errors = []
+
+    def syntaxError(self, recognizer, offendingSymbol, line, column, msg, e):
+        if "\\t" in msg:
+            self.errors.append(f"The UVL has the following warning that prevents reading it: "
+                               f"Line {line}:{column} - {msg}")
+        else:
+            self.errors.append(f"The UVL has the following error that prevents reading it: "
+                               f"Line {line}:{column} - {msg}")
+
+
+class _LexerError(Exception):
+    pass
+
+
+class _StopAtLexerError(ErrorListener):
+    """Stops the fast pass at the first lexer error; the bail strategy stops it at the first parser error."""
+
+    def syntaxError(self, recognizer, offendingSymbol, line, column, msg, e):
+        raise _LexerError(msg)
+
+
+def parse(input_stream, error_listener: ErrorListener, fast: bool = False) -> None:
+    lexer = UVLCustomLexer(input_stream)
+    lexer.removeErrorListeners()
+    lexer.addErrorListener(error_listener)
+    parser = UVLPythonParser(CommonTokenStream(lexer))
+    parser.removeErrorListeners()
+    if fast:
+        # The simpler SLL prediction is enough for valid files
+        parser._interp.predictionMode = PredictionMode.SLL
+        parser._errHandler = BailErrorStrategy()
+    else:
+        parser.addErrorListener(error_listener)
+    parser.featureModel()
+
+
+def validate_uvl(path: str) -> list:
+    """Syntax errors of the UVL file, empty if it is valid."""
+    try:
+        parse(FileStream(path, encoding='utf-8'), _StopAtLexerError(), fast=True)
+        return []
+    except (ParseCancellationException, _LexerError):
+        pass
+    except UnicodeDecodeError as exc:
+        return [f"The UVL is not valid UTF-8: {exc}"]
+
+    # Only invalid files are parsed again, with full prediction and error recovery, to report every error
+    error_listener = UVLErrorListener()
+    parse(FileStream(path, encoding='utf-8'), error_listener)
+    return error_listener.errors
+
+
+def validate_uvl_files(paths: list) -> list:
+    """Pool task: the syntax errors of each file."""
+    return [validate_uvl(path) for path in paths]
+
+
+def warm_up() -> None:
+    parse(InputStream(WARM_UP_MODEL), _StopAtLexerError(), fast=True)
+
+
+warm_up()
@@ -12,6 +12,12 @@ class Hubfile(db.Model):
     checksum = db.Column(db.String(120), nullable=False)
     size = db.Column(db.Integer, nullable=False)
     feature_model_id = db.Column(db.Integer, db.ForeignKey('feature_model.id'), nullable=False)
+    # Checksum of the content whose feature names are indexed, None until the file is indexed
+    indexed_checksum = db.Column(db.String(120))
+    feature_names = db.relationship('FeatureName', secondary='hubfile_feature_name', lazy=True,
+                                    backref=db.backref('hubfiles', lazy='dynamic'))
+    constraint_names = db.relationship('FeatureName', secondary='hubfile_constraint_name', lazy=True,
+                                       backref=db.backref('constrained_hubfiles', lazy='dynamic'))
 
     def get_formatted_size(self):
         from app.modules.dataset.services import SizeService
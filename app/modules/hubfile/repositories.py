@@ -24,6 +24,18 @@ class HubfileRepository(BaseRepository):
     def get_dataset_by_hubfile(self, hubfile: Hubfile) -> DataSet:
         return db.session.query(DataSet).join(FeatureModel).join(Hubfile).filter(Hubfile.id == hubfile.id).first()
 
+    def get_by_ids(self, ids: list) -> list:
+        return self.model.query.filter(Hubfile.id.in_(ids)).order_by(Hubfile.id).all()
+
+    def get_unindexed(self, reindex: bool = False):
+        """Files whose feature names were never indexed or were indexed for another content."""
+        query = self.model.query
+        if not reindex:
+            query = query.filter(
+                db.or_(Hubfile.indexed_checksum.is_(None), Hubfile.indexed_checksum != Hubfile.checksum)
+            )
+        return query.order_by(Hubfile.id)
+
 
 class HubfileViewRecordRepository(BaseRepository):
     def __init__(self):
@@ -22,6 +22,9 @@ class HubfileService(BaseService):
     def get_dataset_by_hubfile(self, hubfile: Hubfile) -> DataSet:
         return self.repository.get_dataset_by_hubfile(hubfile)
 
+    def get_by_ids(self, ids: list) -> list:
+        return self.repository.get_by_ids(ids)
+
     def get_path_by_hubfile(self, hubfile: Hubfile) -> str:
 
         hubfile_user = self.get_owner_user_by_hubfile(hubfile)
@@ -0,0 +1,21 @@
+import click
+from flask import current_app
+
+from core.blueprints.base_blueprint import BaseBlueprint
+
+jobs_bp = BaseBlueprint('jobs', __name__, template_folder='templates')
+
+
+@jobs_bp.cli.command('work', help="Runs the queued background jobs until interrupted.")
+@click.option('--concurrency', default=2, show_default=True, help="Jobs run at the same time.")
+@click.option('--poll-interval', default=1.0, show_default=True, help="Seconds between checks for new jobs.")
+@click.option('--once', is_flag=True, help="Exit once no job is due instead of waiting for new ones.")
+def work(concurrency, poll_interval, once):
+    """
+    Same as `rosemary worker`, for the images that do not ship rosemary, e.g. the production one:
+    `flask jobs work`.
+    """
+    from app.modules.jobs.services import run_workers
+
+    count = run_workers(current_app._get_current_object(), concurrency, poll_interval, once)
+    click.echo(f"Ran {count} jobs.")
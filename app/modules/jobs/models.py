@@ -0,0 +1,65 @@
+import json
+from datetime import datetime
+
+from app import db
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed')
+
+
+class Job(db.Model):
+    """
+    A unit of background work, stored so it survives restarts and is run by `rosemary worker`.
+
+    Queued jobs are taken by decreasing priority, then in order of creation, once `run_after` has passed. A
+    running job belongs to a worker until `lease_expires_at`: workers renew the lease while they run it, so
+    the jobs of a worker that died are taken again by another one.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(64), nullable=False, index=True)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(16), nullable=False, default='queued')
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    # Enqueueing a job with the key of an existing one returns the existing job
+    idempotency_key = db.Column(db.String(255), unique=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    worker = db.Column(db.String(120))
+    lease_expires_at = db.Column(db.DateTime)
+    progress = db.Column(db.Float, nullable=False, default=0)
+    progress_message = db.Column(db.String(255))
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_job_status_priority_run_after', 'status', 'priority', 'run_after'),
+        db.Index('ix_job_status_lease_expires_at', 'status', 'lease_expires_at'),
+    )
+
+    def get_payload(self) -> dict:
+        return json.loads(self.payload or '{}')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'priority': self.priority,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'progress': self.progress,
+            'progress_message': self.progress_message,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'run_after': self.run_after,
+        }
+
+    def __repr__(self):
+        return f'Job<{self.id}, {self.kind}, {self.status}>'
@@ -0,0 +1,51 @@
+from sqlalchemy import and_, or_
+
+from app.modules.jobs.models import Job
+from core.repositories.BaseRepository import BaseRepository
+
+
+class JobRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(Job)
+
+    def get_by_idempotency_key(self, idempotency_key: str):
+        return self.model.query.filter_by(idempotency_key=idempotency_key).first()
+
+    def claimable(self, now):
+        """Condition of the jobs a worker may take: queued and due, or running on an expired lease."""
+        return or_(
+            and_(Job.status == 'queued', Job.run_after <= now),
+            and_(Job.status == 'running', Job.lease_expires_at < now),
+        )
+
+    def get_claimable_ids(self, now, limit: int) -> list:
+        return [
+            job_id for job_id, in
+            self.session.query(Job.id)
+            .filter(self.claimable(now))
+            .order_by(Job.priority.desc(), Job.id)
+            .limit(limit)
+            .all()
+        ]
+
+    def claim(self, job_id: int, worker: str, now, lease_expires_at) -> bool:
+        """
+        Takes the job for the worker, unless another worker took it first: the update only applies while
+        the job is still claimable, so no row lock is needed and it works the same on every database.
+        """
+        return self.model.query.filter(Job.id == job_id, self.claimable(now)).update({
+            Job.status: 'running',
+            Job.worker: worker,
+            Job.lease_expires_at: lease_expires_at,
+            Job.attempts: Job.attempts + 1,
+            Job.started_at: now,
+        }, synchronize_session=False) == 1
+
+    def update_owned(self, job_id: int, worker: str, **values) -> bool:
+        """Updates the job only while the worker still owns it; False if its lease was lost."""
+        return self.model.query.filter(
+            Job.id == job_id, Job.worker == worker, Job.status == 'running'
+        ).update({getattr(Job, column): value for column, value in values.items()}, synchronize_session=False) == 1
+
+    def get_by_user(self, user_id: int, limit: int) -> list:
+        return self.model.query.filter_by(user_id=user_id).order_by(Job.id.desc()).limit(limit).all()
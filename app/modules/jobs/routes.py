@@ -0,0 +1,26 @@
+from flask import abort, jsonify
+from flask_login import current_user, login_required
+
+from app.modules.jobs import jobs_bp
+from app.modules.jobs.services import JobService
+
+job_service = JobService()
+
+
+@jobs_bp.route('/jobs', methods=['GET'])
+@login_required
+def list_jobs():
+    return jsonify([job.to_dict() for job in job_service.get_by_user(current_user.id)])
+
+
+@jobs_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def get_job(job_id):
+    """Status and progress of a job, for clients polling until it finishes."""
+    job = job_service.get_for_user(job_id, current_user.id)
+    if job is None:
+        abort(404)
+    response = jsonify(job.to_dict())
+    if job.status in ('queued', 'running'):
+        response.headers['Retry-After'] = '2'
+    return response
@@ -0,0 +1,227 @@
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from app.modules.jobs.models import Job
+from app.modules.jobs.repositories import JobRepository
+from core.services.BaseService import BaseService
+
+logger = logging.getLogger(__name__)
+
+# Handlers by job kind, registered with @job_handler by the modules that define the work
+JOB_HANDLERS = {}
+
+# Seconds a worker owns a job without renewing its lease, and between renewals
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '300'))
+JOB_HEARTBEAT_SECONDS = float(os.getenv('JOB_HEARTBEAT_SECONDS', '5'))
+
+# Failed attempts are retried after base * 2 ** (attempt - 1) seconds, with jitter, up to the maximum
+JOB_RETRY_BASE_SECONDS = float(os.getenv('JOB_RETRY_BASE_SECONDS', '10'))
+JOB_RETRY_MAX_SECONDS = float(os.getenv('JOB_RETRY_MAX_SECONDS', '3600'))
+
+# Candidate jobs read per claim, so concurrent workers rarely race for the same one
+CLAIM_CANDIDATES = 10
+
+JOBS_LIST_LIMIT = 50
+
+
+def job_handler(kind: str):
+    """
+    Registers the function running the jobs of `kind`. It is called with the job payload and a
+    `progress(fraction, message=None)` callback, and may return a JSON-serializable result.
+    """
+    def register(handler: Callable) -> Callable:
+        JOB_HANDLERS[kind] = handler
+        return handler
+    return register
+
+
+def retry_delay(attempts: int) -> float:
+    delay = min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    # Jitter spreads the retries of jobs that failed together, e.g. while a service was down
+    return delay * random.uniform(0.5, 1)
+
+
+def worker_name() -> str:
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+class _Heartbeat(threading.Thread):
+    """Renews the lease of a running job and saves its latest progress, from a session of its own."""
+
+    def __init__(self, app, job_id: int, worker: str):
+        super().__init__(name=f'job-heartbeat-{job_id}', daemon=True)
+        self.app = app
+        self.job_id = job_id
+        self.worker = worker
+        self.progress = None
+        self._finished = threading.Event()
+
+    def report(self, fraction: float, message: Optional[str] = None) -> None:
+        self.progress = (max(0.0, min(1.0, float(fraction))), message[:255] if message else None)
+
+    def run(self) -> None:
+        with self.app.app_context():
+            repository = JobRepository()
+            while not self._finished.wait(min(JOB_HEARTBEAT_SECONDS, JOB_LEASE_SECONDS / 3)):
+                values = {'lease_expires_at': datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)}
+                if self.progress is not None:
+                    values['progress'], values['progress_message'] = self.progress
+                try:
+                    repository.update_owned(self.job_id, self.worker, **values)
+                    repository.session.commit()
+                except Exception as exc:
+                    logger.warning(f"Could not renew the lease of job {self.job_id}: {exc}")
+                    repository.session.rollback()
+
+    def stop(self) -> None:
+        self._finished.set()
+        self.join()
+
+
+class JobService(BaseService):
+    """A durable job queue stored in the database, so it needs no broker and runs anywhere the app does."""
+
+    def __init__(self):
+        super().__init__(JobRepository())
+
+    def enqueue(self, kind: str, payload: dict = None, priority: int = 0, idempotency_key: str = None,
+                max_attempts: int = 5, delay: float = 0, user_id: int = None) -> Job:
+        """
+        Stores a new job and commits it. With an idempotency key already used, the existing job is returned
+        instead, whatever its status, so retried requests do not run the same work twice.
+        """
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"No handler for jobs of kind '{kind}'")
+        if idempotency_key is not None:
+            existing = self.repository.get_by_idempotency_key(idempotency_key)
+            if existing is not None:
+                return existing
+
+        job = Job(kind=kind, payload=json.dumps(payload or {}), priority=priority, idempotency_key=idempotency_key,
+                  max_attempts=max_attempts, run_after=datetime.utcnow() + timedelta(seconds=delay), user_id=user_id)
+        self.repository.session.add(job)
+        try:
+            self.repository.session.commit()
+        except IntegrityError:
+            # Another request enqueued the same key meanwhile
+            self.repository.session.rollback()
+            return self.repository.get_by_idempotency_key(idempotency_key)
+        return job
+
+    def get_for_user(self, job_id: int, user_id: int) -> Optional[Job]:
+        """The job, if the user enqueued it; jobs enqueued by the system are visible to every user."""
+        job = self.repository.get_by_id(job_id)
+        if job is None or job.user_id not in (None, user_id):
+            return None
+        return job
+
+    def get_by_user(self, user_id: int) -> list:
+        return self.repository.get_by_user(user_id, JOBS_LIST_LIMIT)
+
+    def claim_next(self, worker: str) -> Optional[Job]:
+        now = datetime.utcnow()
+        for job_id in self.repository.get_claimable_ids(now, CLAIM_CANDIDATES):
+            if self.repository.claim(job_id, worker, now, now + timedelta(seconds=JOB_LEASE_SECONDS)):
+                self.repository.session.commit()
+                job = self.repository.get_by_id(job_id)
+                self.repository.session.refresh(job)
+                return job
+        self.repository.session.commit()
+        return None
+
+    def run(self, job: Job, worker: str) -> str:
+        """Runs a claimed job and records its outcome. Returns the new status of the job."""
+        job_id, attempts, max_attempts = job.id, job.attempts, job.max_attempts
+        handler = JOB_HANDLERS.get(job.kind)
+        if attempts > max_attempts:
+            # Its previous workers died while running it, most likely because of the job itself
+            return self._finish(job_id, worker, 'failed', error='The job was abandoned by its workers')
+        if handler is None:
+            return self._finish(job_id, worker, 'failed', error=f"No handler for jobs of kind '{job.kind}'")
+
+        heartbeat = _Heartbeat(current_app._get_current_object(), job_id, worker)
+        heartbeat.start()
+        try:
+            result = handler(job.get_payload(), heartbeat.report)
+        except Exception as exc:
+            heartbeat.stop()
+            self.repository.session.rollback()
+            logger.exception(f"Job {job_id} failed on attempt {attempts} of {max_attempts}: {exc}")
+            error = f'{type(exc).__name__}: {exc}'
+            if attempts >= max_attempts:
+                return self._finish(job_id, worker, 'failed', error=error)
+            return self._finish(job_id, worker, 'queued', error=error,
+                                run_after=datetime.utcnow() + timedelta(seconds=retry_delay(attempts)))
+        heartbeat.stop()
+        self.repository.session.commit()
+        return self._finish(job_id, worker, 'succeeded', progress=1.0,
+                            result=json.dumps(result) if result is not None else None)
+
+    def _finish(self, job_id: int, worker: str, status: str, **values) -> str:
+        if status != 'queued':
+            values['finished_at'] = datetime.utcnow()
+        if not self.repository.update_owned(job_id, worker, status=status, lease_expires_at=None, **values):
+            logger.warning(f"Job {job_id} was taken by another worker before {worker} finished it")
+        self.repository.session.commit()
+        return status
+
+    def work(self, once: bool = False, poll_interval: float = 1, stop: threading.Event = None) -> int:
+        """
+        Runs jobs until `stop` is set or, with `once`, until no job is due. Returns the number of jobs run.
+        """
+        worker = worker_name()
+        stop = stop or threading.Event()
+        count = 0
+        while not stop.is_set():
+            job = self.claim_next(worker)
+            if job is None:
+                if once:
+                    break
+                stop.wait(poll_interval)
+                continue
+            self.run(job, worker)
+            count += 1
+        return count
+
+
+def run_workers(app, concurrency: int = 2, poll_interval: float = 1, once: bool = False,
+                on_stop: Callable = None) -> int:
+    """
+    Runs `concurrency` workers, each in a thread with an app context of its own, until SIGINT or SIGTERM or,
+    with `once`, until no job is due. Running jobs are finished before returning. Returns the number of jobs run.
+    """
+    stop = threading.Event()
+    counts = []
+
+    def work():
+        with app.app_context():
+            counts.append(JobService().work(once=once, poll_interval=poll_interval, stop=stop))
+
+    def shutdown(signum, frame):
+        if on_stop is not None:
+            on_stop()
+        stop.set()
+
+    handlers = {signum: signal.signal(signum, shutdown) for signum in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        threads = [threading.Thread(target=work, name=f'job-worker-{index}') for index in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        # Joined with a timeout, so the main thread keeps handling signals
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(0.5)
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+    return sum(counts)
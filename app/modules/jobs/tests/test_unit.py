@@ -0,0 +1,152 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.modules.auth.models import User
+from app.modules.conftest import login, logout
+from app.modules.jobs import services
+from app.modules.jobs.models import Job
+from app.modules.jobs.services import JobService, job_handler, run_workers
+
+calls = []
+
+
+@job_handler('tests.record')
+def record(payload, progress):
+    calls.append(payload['name'])
+    return {'name': payload['name']}
+
+
+@job_handler('tests.flaky')
+def flaky(payload, progress):
+    calls.append('flaky')
+    if calls.count('flaky') < payload['succeed_on']:
+        raise RuntimeError('Service unavailable')
+    return None
+
+
+@job_handler('tests.progress')
+def report_progress(payload, progress):
+    progress(0.5, 'Halfway')
+    # Long enough for the heartbeat to save the progress
+    time.sleep(0.3)
+    db.session.expire_all()
+    calls.append((Job.query.get(payload['job_id']).progress, Job.query.get(payload['job_id']).progress_message))
+
+
+@pytest.fixture(scope='module')
+def test_client(test_client):
+    """
+    Extends the test_client fixture to add additional specific data for module testing.
+    """
+    with test_client.application.app_context():
+        db.session.add(User(email='jobs@example.com', password='test1234'))
+        db.session.commit()
+
+    yield test_client
+
+
+@pytest.fixture(autouse=True)
+def empty_queue(test_client):
+    calls.clear()
+    with test_client.application.app_context():
+        Job.query.delete()
+        db.session.commit()
+
+
+def test_sample_assertion(test_client):
+    """
+    Sample test to verify that the test framework and environment are working correctly.
+    It does not communicate with the Flask application; it only performs a simple assertion to
+    confirm that the tests in this module can be executed.
+    """
+    greeting = "Hello, World!"
+    assert greeting == "Hello, World!", "The greeting does not coincide with 'Hello, World!'"
+
+
+def test_jobs_run_by_priority_once_per_key(test_client):
+    with test_client.application.app_context():
+        service = JobService()
+        first = service.enqueue('tests.record', {'name': 'low'}, idempotency_key='low')
+        assert service.enqueue('tests.record', {'name': 'again'}, idempotency_key='low').id == first.id
+        service.enqueue('tests.record', {'name': 'high'}, priority=10)
+        service.enqueue('tests.record', {'name': 'later'}, delay=3600)
+        with pytest.raises(ValueError):
+            service.enqueue('tests.unknown')
+
+        assert service.work(once=True) == 2
+        assert calls == ['high', 'low']
+        job = Job.query.get(first.id)
+        assert job.status == 'succeeded' and job.progress == 1 and job.to_dict()['result'] == {'name': 'low'}
+        assert Job.query.filter_by(status='queued').count() == 1
+
+
+def test_workers_run_every_due_job(test_client):
+    with test_client.application.app_context():
+        for name in ('a', 'b', 'c'):
+            JobService().enqueue('tests.record', {'name': name})
+    assert run_workers(test_client.application, concurrency=2, once=True) == 3
+    assert sorted(calls) == ['a', 'b', 'c']
+
+
+def test_failed_jobs_are_retried_with_backoff(test_client):
+    with test_client.application.app_context():
+        service = JobService()
+        job_id = service.enqueue('tests.flaky', {'succeed_on': 2}).id
+        assert service.work(once=True) == 1
+        job = Job.query.get(job_id)
+        assert job.status == 'queued' and job.attempts == 1 and 'Service unavailable' in job.error
+        assert job.run_after > datetime.utcnow() + timedelta(seconds=services.JOB_RETRY_BASE_SECONDS / 2 - 1)
+
+        # Not due yet, then retried once due
+        assert service.work(once=True) == 0
+        job.run_after = datetime.utcnow()
+        db.session.commit()
+        assert service.work(once=True) == 1
+        assert Job.query.get(job_id).status == 'succeeded' and Job.query.get(job_id).attempts == 2
+
+        calls.clear()
+        job_id = service.enqueue('tests.flaky', {'succeed_on': 10}, max_attempts=1).id
+        service.work(once=True)
+        assert Job.query.get(job_id).status == 'failed'
+
+
+def test_jobs_of_dead_workers_are_taken_again(test_client, monkeypatch):
+    with test_client.application.app_context():
+        service = JobService()
+        job_id = service.enqueue('tests.record', {'name': 'orphan'}, max_attempts=2).id
+        assert service.claim_next('dead-worker').id == job_id
+        assert service.work(once=True) == 0, "A job was taken while its lease was valid"
+
+        Job.query.get(job_id).lease_expires_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        assert service.work(once=True) == 1
+        job = Job.query.get(job_id)
+        assert job.status == 'succeeded' and job.attempts == 2 and calls == ['orphan']
+
+        monkeypatch.setattr(services, 'JOB_HEARTBEAT_SECONDS', 0.05)
+        job_id = service.enqueue('tests.progress').id
+        Job.query.get(job_id).payload = f'{{"job_id": {job_id}}}'
+        db.session.commit()
+        service.work(once=True)
+        assert calls[-1] == (0.5, 'Halfway')
+
+
+def test_job_status_endpoint(test_client):
+    with test_client.application.app_context():
+        owner = User.query.filter_by(email='jobs@example.com').first()
+        job_id = JobService().enqueue('tests.record', {'name': 'mine'}, user_id=owner.id).id
+
+    assert test_client.get(f'/jobs/{job_id}').status_code in (302, 401)
+    login(test_client, 'jobs@example.com', 'test1234')
+    response = test_client.get(f'/jobs/{job_id}')
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'queued' and response.headers['Retry-After']
+    assert [job['id'] for job in test_client.get('/jobs').get_json()] == [job_id]
+    logout(test_client)
+
+    login(test_client, 'test@example.com', 'test1234')
+    assert test_client.get(f'/jobs/{job_id}').status_code == 404
+    logout(test_client)
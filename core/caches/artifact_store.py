@@ -0,0 +1,54 @@
+import hashlib
+import os
+import re
+import tempfile
+from typing import Callable, Union
+
+from core.caches.single_flight import SingleFlight
+
+SAFE_PART = re.compile(r'[A-Za-z0-9_.+-]{1,128}')
+
+
+class ArtifactStore:
+    """
+    Directory of generated files, each identified by the parts of its key (e.g. the checksum of the
+    source, the output format and the version of the generator).
+
+    Keys identify the content, so an artifact is generated once and then served as a static file. It is
+    written under a temporary name and renamed into place, so a reader never sees a partial artifact, and
+    concurrent generations of the same key in a process are coalesced.
+    """
+
+    def __init__(self, directory: Union[str, Callable[[], str]]):
+        self.directory = directory
+        self._flight = SingleFlight()
+
+    def path(self, *key, suffix: str = '') -> str:
+        parts = [part if SAFE_PART.fullmatch(part) else hashlib.sha256(part.encode('utf-8')).hexdigest()
+                 for part in map(str, key)]
+        directory = self.directory() if callable(self.directory) else self.directory
+        return os.path.join(directory, parts[0][:2], '.'.join(parts) + suffix)
+
+    def etag(self, *key) -> str:
+        return hashlib.sha256('\0'.join(map(str, key)).encode('utf-8')).hexdigest()[:32]
+
+    def get_or_create(self, key: tuple, generate: Callable[[str], None], suffix: str = '') -> str:
+        """Path of the artifact, calling `generate(path)` to write it to `path` the first time."""
+        path = self.path(*key, suffix=suffix)
+        if os.path.exists(path):
+            return path
+        return self._flight.do(path, lambda: self._create(path, generate, suffix))
+
+    def _create(self, path: str, generate: Callable[[str], None], suffix: str) -> str:
+        if os.path.exists(path):
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=suffix)
+        os.close(descriptor)
+        try:
+            generate(temporary_path)
+            os.replace(temporary_path, path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+        return path
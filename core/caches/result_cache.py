@@ -0,0 +1,131 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """
+    Thread-safe in-process cache with a per-entry TTL and generation-based invalidation.
+
+    Every entry remembers the generation it was computed under. Bumping the generation (on writes)
+    makes all the existing entries stale at once, without walking the cache. When the cache is full,
+    the least recently used entry is evicted.
+
+    With `shared_path`, bumps are also published by replacing that file, and every lookup compares its
+    inode and modification time with the last ones seen, so the writes of other processes sharing the
+    file (gunicorn workers, job workers in another container with the same volume) invalidate the cache
+    too. Without it, or when the file cannot be written, the TTL bounds the staleness of other processes.
+    """
+
+    def __init__(self, ttl: float = 60, max_entries: int = 1024, shared_path: Optional[str] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.shared_path = shared_path
+        self.generation = 0
+        # Wall-clock time of the last bump, so results computed from older data can be told apart elsewhere
+        self.bumped_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._shared_signature = None
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            self._sync_shared()
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, generation, expires_at = entry
+                if generation == self.generation and expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        """
+        Stores a value. `generation` should be the generation read *before* computing the value, so a
+        write that happened during the computation leaves the entry already stale.
+        """
+        with self._lock:
+            self._sync_shared()
+            if generation is None:
+                generation = self.generation
+            if generation != self.generation:
+                return
+            self._entries[key] = (value, generation, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is not None:
+            return value
+        generation = self.generation
+        value = compute()
+        self.set(key, value, generation)
+        return value
+
+    def bump_generation(self) -> int:
+        with self._lock:
+            self.generation += 1
+            self.bumped_at = time.time()
+            self._entries.clear()
+            if self.shared_path:
+                self._publish_shared()
+            return self.generation
+
+    def _publish_shared(self) -> None:
+        # Replaced rather than rewritten, so the inode changes even when two bumps share a timestamp
+        partial_path = f'{self.shared_path}.{os.getpid()}.{threading.get_ident()}'
+        try:
+            os.makedirs(os.path.dirname(self.shared_path) or '.', exist_ok=True)
+            with open(partial_path, 'w') as partial_file:
+                partial_file.write(str(self.generation))
+            os.replace(partial_path, self.shared_path)
+            stat = os.stat(self.shared_path)
+        except OSError as exc:
+            logger.warning(f"Could not publish the cache generation in {self.shared_path}: {exc}")
+            return
+        self._shared_signature = (stat.st_ino, stat.st_mtime_ns)
+
+    def _sync_shared(self) -> None:
+        """Takes the bumps published by other processes since the last lookup, with the lock held."""
+        if not self.shared_path:
+            return
+        try:
+            stat = os.stat(self.shared_path)
+        except OSError:
+            return
+        signature = (stat.st_ino, stat.st_mtime_ns)
+        if signature != self._shared_signature:
+            self._shared_signature = signature
+            self.generation += 1
+            self.bumped_at = max(self.bumped_at, stat.st_mtime)
+            self._entries.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'entries': len(self._entries),
+                'generation': self.generation,
+                'ttl': self.ttl,
+            }
@@ -0,0 +1,138 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Hashable, Optional
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.started_at = time.time()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent computations of the same key.
+
+    While one thread computes a key, the other threads asking for it wait and receive the same result
+    (or exception) instead of computing it again. With `lock_dir`, the computation is also coalesced
+    across processes on the same host (e.g. gunicorn workers): the leaders of every process serialize on
+    a lock file per key, and the first one publishes its result in a JSON file next to it that the others
+    read after acquiring the lock. Shared results must therefore be JSON serializable, and they are only
+    reused for `shared_ttl` seconds, as they are meant for requests in flight, not for caching. Files
+    unused for longer are removed by the leaders every `shared_ttl` seconds, so the directory stays small.
+
+    A caller that knows its data changed at `not_before` (a time.time() timestamp) never receives a result
+    whose computation started earlier: it waits for that computation to finish and then computes again.
+    """
+
+    def __init__(self, lock_dir: Optional[str] = None, shared_ttl: float = 5):
+        self.lock_dir = lock_dir
+        self.shared_ttl = shared_ttl
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._swept_at = 0.0
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+
+    def do(self, key: Hashable, compute: Callable[[], Any], not_before: Optional[float] = None) -> Any:
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                    break
+            call.event.wait()
+            if not_before is not None and call.started_at < not_before:
+                # Computed from data older than the caller's: wait for it and compute again
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = self._compute_shared(key, compute, not_before) if self.lock_dir else compute()
+            return call.value
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def _compute_shared(self, key: Hashable, compute: Callable[[], Any], not_before: Optional[float]) -> Any:
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        lock_path = os.path.join(self.lock_dir, f'{digest}.lock')
+        result_path = os.path.join(self.lock_dir, f'{digest}.json')
+
+        with open(lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # Marks the lock as in use for the sweep
+                os.utime(lock_path)
+                found, value = self._read_shared(result_path, not_before)
+                if found:
+                    return value
+                started_at = time.time()
+                value = compute()
+                self._write_shared(result_path, started_at, value)
+                return value
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                self._sweep()
+
+    def _read_shared(self, result_path: str, not_before: Optional[float]):
+        """(found, value) of the shared result, unless it is too old or started before `not_before`."""
+        try:
+            with open(result_path, 'r') as result_file:
+                shared = json.load(result_file)
+            started_at = shared['started_at']
+        except (OSError, ValueError, KeyError, TypeError):
+            return False, None
+        if time.time() - started_at > self.shared_ttl or (not_before is not None and started_at < not_before):
+            return False, None
+        return True, shared['value']
+
+    def _write_shared(self, result_path: str, started_at: float, value: Any) -> None:
+        temp_path = f'{result_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(temp_path, 'w') as result_file:
+                json.dump({'started_at': started_at, 'value': value}, result_file)
+            os.replace(temp_path, result_path)
+        except (OSError, TypeError, ValueError):
+            # Not shareable: the other processes will compute it themselves
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _sweep(self) -> None:
+        """
+        Removes the result and lock files unused for `shared_ttl` seconds. A process still waiting on a removed
+        lock only stops being coalesced with the processes that come after it.
+        """
+        now = time.time()
+        with self._lock:
+            if now - self._swept_at < self.shared_ttl:
+                return
+            self._swept_at = now
+        try:
+            names = os.listdir(self.lock_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.lock_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.shared_ttl:
+                    os.remove(path)
+            except OSError:
+                pass
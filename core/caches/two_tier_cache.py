@@ -0,0 +1,141 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Union
+
+from core.caches.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+SAFE_KEY = re.compile(r'[A-Za-z0-9_-]{1,128}')
+
+
+class TwoTierCache:
+    """
+    Content-addressed cache of decoded objects: an in-process LRU bounded by the total weight of its entries,
+    in front of a directory of encoded entries shared by every worker on the host.
+
+    Keys identify the content (e.g. a file checksum), so entries never go stale and are never invalidated.
+    A miss in memory reads the entry from disk; a miss on disk loads the value, which is then written to
+    both tiers. Concurrent loads of the same key in a process are coalesced. Values are shared between
+    callers and must be treated as read-only.
+    """
+
+    def __init__(self, encode: Callable[[Any], bytes], decode: Callable[[bytes], Any],
+                 directory: Union[str, Callable[[], str]], max_weight: int = 1024,
+                 weigh: Callable[[Any], int] = lambda value: 1, suffix: str = '.bin'):
+        self.encode = encode
+        self.decode = decode
+        self.directory = directory
+        self.max_weight = max_weight
+        self.weigh = weigh
+        self.suffix = suffix
+        self.weight = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+
+    def get(self, key: str, load: Callable[[], Any], directory: Optional[str] = None) -> Any:
+        """
+        The value of `key`, loaded with `load` when neither tier holds it. `directory` replaces the configured
+        one, e.g. in a pool worker, which does not see the environment of the process submitting its tasks.
+        Entries are kept in memory per directory.
+        """
+        directory = directory or self._directory()
+        with self._lock:
+            entry = self._entries.get((directory, key))
+            if entry is not None:
+                self._entries.move_to_end((directory, key))
+                self.memory_hits += 1
+                return entry[0]
+        return self._flight.do((directory, key), lambda: self._get_slow(key, load, directory))
+
+    def _get_slow(self, key: str, load: Callable[[], Any], directory: str) -> Any:
+        value = self._read(key, directory)
+        if value is not None:
+            with self._lock:
+                self.disk_hits += 1
+        else:
+            value = load()
+            with self._lock:
+                self.misses += 1
+            self._write(key, value, directory)
+        self._remember((directory, key), value)
+        return value
+
+    def _remember(self, memory_key: tuple, value: Any) -> None:
+        weight = self.weigh(value)
+        if weight > self.max_weight:
+            return
+        with self._lock:
+            if memory_key in self._entries:
+                return
+            self._entries[memory_key] = (value, weight)
+            self.weight += weight
+            while self.weight > self.max_weight:
+                _, (_, evicted_weight) = self._entries.popitem(last=False)
+                self.weight -= evicted_weight
+
+    def _directory(self) -> str:
+        return self.directory() if callable(self.directory) else self.directory
+
+    def path(self, key: str, directory: Optional[str] = None) -> str:
+        """Entries are sharded by the first characters of the key; unsafe keys are hashed first."""
+        if not SAFE_KEY.fullmatch(key):
+            key = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(directory or self._directory(), key[:2], key + self.suffix)
+
+    def _read(self, key: str, directory: str) -> Optional[Any]:
+        path = self.path(key, directory)
+        try:
+            with open(path, 'rb') as entry_file:
+                return self.decode(entry_file.read())
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            # A truncated or outdated entry is just a miss, and it is rewritten after loading the value
+            logger.warning(f"Discarding unreadable cache entry {path}: {exc}")
+            return None
+
+    def _write(self, key: str, value: Any, directory: str) -> None:
+        path = self.path(key, directory)
+        temporary_path = None
+        try:
+            data = self.encode(value)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written under a temporary name and renamed, so readers never see a partial entry
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as entry_file:
+                temporary_path = entry_file.name
+                entry_file.write(data)
+            os.replace(temporary_path, path)
+        except Exception as exc:
+            logger.warning(f"Could not write the cache entry {path}: {exc}")
+            if temporary_path and os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    def clear(self) -> None:
+        """Empties the memory tier; the disk tier is kept."""
+        with self._lock:
+            self._entries.clear()
+            self.weight = 0
+            self.memory_hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'weight': self.weight,
+                'max_weight': self.max_weight,
+            }
@@ -0,0 +1,56 @@
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+
+def binary_csr(rows: Iterable[int], columns: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    CSR structure (indptr, indices) of the binary matrix with a one at every (row, column) pair.
+
+    Rows are numbered 0..n-1; duplicated pairs are stored once and the columns of a row keep the order
+    in which they first appear.
+    """
+    rows = np.asarray(list(rows), dtype=np.int64)
+    columns = np.asarray(list(columns), dtype=np.int64)
+    if rows.size == 0:
+        return np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    # First occurrence of every pair, then stable order by row
+    pairs = rows * (columns.max() + 1) + columns
+    _, first = np.unique(pairs, return_index=True)
+    first.sort()
+    order = first[np.argsort(rows[first], kind='stable')]
+
+    indptr = np.zeros(rows.max() + 2, dtype=np.int64)
+    np.add.at(indptr, rows[order] + 1, 1)
+    return np.cumsum(indptr), columns[order]
+
+
+def co_occurrences(indptr: np.ndarray, indices: np.ndarray, max_row_size: int = None) -> Tuple[np.ndarray, ...]:
+    """
+    Non-zero entries (left, right, count) of X^T X without its diagonal, for the binary CSR matrix X: the
+    number of rows containing both columns, for every ordered pair of distinct columns.
+
+    Rows are truncated to their first `max_row_size` columns, so a row growing over time always keeps
+    the same prefix and the counts of a grown matrix minus the counts of the old one stay non-negative.
+    """
+    lefts: List[np.ndarray] = []
+    rights: List[np.ndarray] = []
+    for row in range(len(indptr) - 1):
+        columns = indices[indptr[row]:indptr[row + 1]][:max_row_size]
+        if columns.size < 2:
+            continue
+        left, right = np.meshgrid(columns, columns, indexing='ij')
+        mask = left != right
+        lefts.append(left[mask])
+        rights.append(right[mask])
+
+    if not lefts:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+
+    left = np.concatenate(lefts)
+    right = np.concatenate(rights)
+    width = max(left.max(), right.max()) + 1
+    keys, counts = np.unique(left * width + right, return_counts=True)
+    return keys // width, keys % width, counts
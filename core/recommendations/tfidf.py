@@ -0,0 +1,77 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from unidecode import unidecode
+
+STOP_WORDS = frozenset(
+    'a an and are as at be by for from has in is it its of on or that the this to was were with de del el en '
+    'la las los para por un una y'.split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Accent- and case-folded words of a text, without stop words and one-letter words."""
+    words = re.sub(r'[^a-z0-9]+', ' ', unidecode(text or "").lower()).split()
+    return [word for word in words if len(word) > 1 and word not in STOP_WORDS]
+
+
+def idf(document_frequency: int, num_documents: int) -> float:
+    # Smoothed as if one extra document contained every term, so no term has a zero or negative weight
+    return math.log((1 + num_documents) / (1 + document_frequency)) + 1
+
+
+def tfidf_vector(tokens: Iterable[str], document_frequencies: Dict[str, int], num_documents: int) -> dict:
+    """L2-normalized TF-IDF weights of a document, with sublinear term frequencies."""
+    weights = {
+        term: (1 + math.log(count)) * idf(document_frequencies.get(term, 0), num_documents)
+        for term, count in Counter(tokens).items()
+    }
+    norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+    return {term: weight / norm for term, weight in weights.items()} if norm else {}
+
+
+def similarity_matrix(vectors: List[dict], terms: List[str]) -> np.ndarray:
+    """Dense float32 matrix of the weights of `vectors` over the columns `terms`."""
+    columns = {term: column for column, term in enumerate(terms)}
+    matrix = np.zeros((len(vectors), len(terms)), dtype=np.float32)
+    for row, vector in enumerate(vectors):
+        for term, weight in vector.items():
+            column = columns.get(term)
+            if column is not None:
+                matrix[row, column] = weight
+    return matrix
+
+
+def top_k(scores: np.ndarray, k: int, exclude: int = None) -> List[Tuple[int, float]]:
+    """(index, score) of the `k` highest positive scores, best first."""
+    scores = scores.copy()
+    if exclude is not None:
+        scores[exclude] = 0
+    k = min(k, len(scores))
+    if k == 0:
+        return []
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+    return [(int(index), float(scores[index])) for index in candidates if scores[index] > 0]
+
+
+def nearest_neighbours(vectors: List[dict], k: int, block_size: int = 256) -> List[List[Tuple[int, float]]]:
+    """
+    Top-`k` cosine neighbours of every vector, as (index, similarity) lists.
+
+    Terms present in a single document do not contribute to any dot product, so they are left out of the
+    matrix, which keeps it small. Similarities are computed `block_size` rows at a time.
+    """
+    document_frequencies = Counter(term for vector in vectors for term in vector)
+    shared_terms = sorted(term for term, frequency in document_frequencies.items() if frequency > 1)
+    matrix = similarity_matrix(vectors, shared_terms)
+
+    neighbours = []
+    for start in range(0, len(vectors), block_size):
+        block = matrix[start:start + block_size] @ matrix.T
+        for offset, scores in enumerate(block):
+            neighbours.append(top_k(scores, k, exclude=start + offset))
+    return neighbours
@@ -3,6 +3,7 @@ from flask_restful import Resource
 from datetime import datetime
 
 from app import db
+from core.resources.streaming import STREAM_BATCH_SIZE, ndjson_response, wants_ndjson
 
 
 def convert_value(value):
@@ -12,21 +13,45 @@ def convert_value(value):
 
 
 class GenericResource(Resource):
-    def __init__(self, model, serializer):
+    def __init__(self, model, serializer, query_options=None):
         self.model = model
         self.model_name = model.__name__
         self.serializer = serializer
+        self.query_options = query_options or []
+
+    def query(self):
+        return self.model.query.options(*self.query_options)
 
     def get(self, id=None):
         if id:
-            item = self.model.query.get(id)
+            item = self.query().get(id)
             if not item:
                 return {'message': f'{self.model_name} not found'}, 404
             return self.serializer.serialize(item), 200
+        elif wants_ndjson():
+            # One item per line, read in batches, so memory does not grow with the result
+            return ndjson_response(self.serializer.serialize(item) for item in self.iter_items())
         else:
-            items = self.model.query.all()
+            items = self.query().all()
             return {'items': [self.serializer.serialize(i) for i in items]}, 200
 
+    def iter_items(self, batch_size: int = STREAM_BATCH_SIZE):
+        """
+        Every item in order of id, loaded one batch at a time after the last id of the previous batch. Each
+        batch is a complete query, so its loader options and the lazy loads of the serializer can run more
+        queries: a cursor left open for the stream would not let them share its connection.
+        """
+        last_id = None
+        while True:
+            query = self.query()
+            if last_id is not None:
+                query = query.filter(self.model.id > last_id)
+            items = query.order_by(self.model.id).limit(batch_size).all()
+            yield from items
+            if len(items) < batch_size:
+                return
+            last_id = items[-1].id
+
     def post(self):
         data = request.get_json()
         if not data:
@@ -62,8 +87,12 @@ class GenericResource(Resource):
         return {'message': f'{self.model_name} deleted successfully'}, 204
 
 
-def create_resource(model, serialization_fields=None):
+def create_resource(model, serialization_fields=None, query_options=None):
+    """
+    `query_options` is an optional callable returning the loader options applied to every query. It is
+    evaluated when the resource is instantiated, once all the mappers have been configured.
+    """
     class Resource(GenericResource):
         def __init__(self):
-            super().__init__(model, serialization_fields)
+            super().__init__(model, serialization_fields, query_options() if query_options else None)
     return Resource
@@ -0,0 +1,68 @@
+from zipfile import ZIP_DEFLATED, ZipFile
+
+from flask import Response, current_app, request, stream_with_context
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Rows fetched from the database per round trip while streaming
+STREAM_BATCH_SIZE = 500
+
+
+def wants_ndjson() -> bool:
+    """Whether the client prefers newline-delimited JSON over a single JSON document."""
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def ndjson_response(items) -> Response:
+    """
+    Streams an iterable of JSON-serializable items, one per line, as they are produced. The request
+    context (and so the database session) stays available until the last item is sent.
+    """
+    def generate():
+        for item in items:
+            yield current_app.json.dumps(item) + '\n'
+
+    # Tell nginx not to buffer the response, so the first lines reach the client right away
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE,
+                    headers={'X-Accel-Buffering': 'no'})
+
+
+class _ChunkWriter:
+    """Write-only file object collecting what ZipFile writes, so it can be sent as soon as it is written."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+def zip_response(entries, download_name: str) -> Response:
+    """
+    Streams a ZIP archive of an iterable of (name, source) entries, where a source is the path of a file or
+    its content as bytes. Every entry is sent as soon as it is produced, so the archive is never built in
+    memory or on disk.
+    """
+    def generate():
+        writer = _ChunkWriter()
+        # The writer cannot seek, so ZipFile writes each entry's sizes after its data
+        with ZipFile(writer, 'w', ZIP_DEFLATED) as archive:
+            for name, source in entries:
+                if isinstance(source, bytes):
+                    archive.writestr(name, source)
+                else:
+                    archive.write(source, arcname=name)
+                yield writer.drain()
+        yield writer.drain()
+
+    return Response(stream_with_context(generate()), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename="{download_name}"',
+                             'X-Accel-Buffering': 'no'})
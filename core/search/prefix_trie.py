@@ -0,0 +1,89 @@
+import threading
+from typing import Hashable, List, Tuple
+
+
+class _Node:
+    __slots__ = ('children', 'entries', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.entries = {}
+        self.top = None
+
+
+class PrefixTrie:
+    """
+    Weighted prefix trie answering "best completions of a prefix" without scanning the subtree.
+
+    Each node caches the `top_k` heaviest entries of its subtree. The cache of a node is derived from its
+    own entries and the caches of its children, and it is dropped along the path of every key that is
+    added or removed, so updates are incremental and a lookup walks the prefix plus at most the nodes
+    invalidated since the previous lookup.
+    """
+
+    def __init__(self, top_k: int = 20):
+        self.top_k = top_k
+        self._root = _Node()
+        self._lock = threading.RLock()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, key: str, entry: Hashable, weight: int = 1) -> None:
+        """Adds `weight` to `entry` under `key`. A negative weight removes it once it reaches zero."""
+        with self._lock:
+            path = [self._root]
+            node = self._root
+            for char in key:
+                node = node.children.setdefault(char, _Node())
+                path.append(node)
+
+            previous = node.entries.get(entry, 0)
+            total = previous + weight
+            if total > 0:
+                node.entries[entry] = total
+                self._size += previous == 0
+            elif previous:
+                del node.entries[entry]
+                self._size -= 1
+
+            for path_node in path:
+                path_node.top = None
+            self._prune(path, key)
+
+    def remove(self, key: str, entry: Hashable, weight: int = 1) -> None:
+        self.add(key, entry, -weight)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._root = _Node()
+            self._size = 0
+
+    def complete(self, prefix: str, limit: int = 10) -> List[Tuple[Hashable, int]]:
+        """Returns up to `limit` (entry, weight) pairs under `prefix`, heaviest first."""
+        with self._lock:
+            node = self._root
+            for char in prefix:
+                node = node.children.get(char)
+                if node is None:
+                    return []
+            return self._top(node)[:limit]
+
+    def _top(self, node: _Node) -> list:
+        if node.top is None:
+            best = dict(node.entries)
+            for child in node.children.values():
+                for entry, weight in self._top(child):
+                    # The same entry may be reachable through several keys: keep its best weight
+                    if weight > best.get(entry, 0):
+                        best[entry] = weight
+            node.top = sorted(best.items(), key=lambda item: (-item[1], str(item[0])))[:self.top_k]
+        return node.top
+
+    def _prune(self, path: list, key: str) -> None:
+        for depth in range(len(key), 0, -1):
+            node = path[depth]
+            if node.entries or node.children:
+                return
+            del path[depth - 1].children[key[depth - 1]]
@@ -0,0 +1,87 @@
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Hashable, Set
+
+
+def trigrams(word: str) -> Set[str]:
+    """Trigrams of a word padded like PostgreSQL's pg_trgm: "cat" -> {"  c", " ca", "cat", "at "}."""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """
+    Typo-tolerant word index. Each distinct word is stored once with its trigrams, and a posting list
+    per trigram points to the words containing it, so a lookup only visits the words sharing at least one
+    trigram with the query and scores them by trigram similarity (shared / union).
+
+    Documents reference words with a count, so the same word added by several fields of a document is
+    only removed once all of them are.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._word_trigrams = {}
+        self._postings = defaultdict(set)
+        self._documents = defaultdict(Counter)
+
+    def __len__(self):
+        return len(self._word_trigrams)
+
+    def add(self, word: str, document: Hashable) -> None:
+        with self._lock:
+            if word not in self._word_trigrams:
+                grams = trigrams(word)
+                self._word_trigrams[word] = len(grams)
+                for gram in grams:
+                    self._postings[gram].add(word)
+            self._documents[word][document] += 1
+
+    def remove(self, word: str, document: Hashable) -> None:
+        with self._lock:
+            documents = self._documents.get(word)
+            if not documents or not documents[document]:
+                return
+            documents[document] -= 1
+            if documents[document] <= 0:
+                del documents[document]
+            if documents:
+                return
+
+            del self._documents[word]
+            del self._word_trigrams[word]
+            for gram in trigrams(word):
+                self._postings[gram].discard(word)
+                if not self._postings[gram]:
+                    del self._postings[gram]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._word_trigrams = {}
+            self._postings = defaultdict(set)
+            self._documents = defaultdict(Counter)
+
+    def similar_words(self, word: str, threshold: float = 0.3) -> Dict[str, float]:
+        """Indexed words whose similarity with `word` is at least `threshold`."""
+        grams = trigrams(word)
+        with self._lock:
+            shared = Counter()
+            for gram in grams:
+                shared.update(self._postings.get(gram, ()))
+
+            similar = {}
+            for candidate, count in shared.items():
+                similarity = count / (len(grams) + self._word_trigrams[candidate] - count)
+                if similarity >= threshold:
+                    similar[candidate] = similarity
+            return similar
+
+    def search(self, word: str, threshold: float = 0.3) -> Dict[Hashable, float]:
+        """Documents containing a word similar to `word`, with the similarity of their closest word."""
+        with self._lock:
+            scores = {}
+            for candidate, similarity in self.similar_words(word, threshold).items():
+                for document in self._documents[candidate]:
+                    if similarity > scores.get(document, 0):
+                        scores[document] = similarity
+            return scores
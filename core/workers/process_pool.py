@@ -0,0 +1,288 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Optional
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+class PoolError(Exception):
+    """Base class of the errors raised instead of a task result."""
+
+
+class PoolSaturated(PoolError):
+    """Every worker is busy and the queue is full, or the task waited too long for a worker."""
+
+
+class TaskCancelled(PoolError):
+    pass
+
+
+class TaskTimeout(PoolError):
+    pass
+
+
+class TaskMemoryExceeded(PoolError):
+    pass
+
+
+class TaskFailed(PoolError):
+    """The task raised an exception that could not be sent back as is."""
+
+
+class Task:
+    def __init__(self, fn: Callable, args: tuple, kwargs: dict, time_limit: float):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.time_limit = time_limit
+        self.submitted_at = time.monotonic()
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._state = 'pending'
+        self._value = None
+        self._error = None
+        self._worker = None
+
+    def _start(self, worker) -> bool:
+        with self._lock:
+            if self._state != 'pending':
+                return False
+            self._state = 'running'
+            self._worker = worker
+            return True
+
+    def _finish(self, value: Any = None, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            if self._state in ('done', 'cancelled'):
+                return
+            self._state = 'done'
+            self._value, self._error = value, error
+            self._worker = None
+        self._done.set()
+
+    def cancel(self) -> bool:
+        """Cancels the task, killing its worker if it is already running. False if it already finished."""
+        with self._lock:
+            if self._state in ('done', 'cancelled'):
+                return False
+            worker, self._state, self._worker = self._worker, 'cancelled', None
+            self._error = TaskCancelled('The task was cancelled')
+        if worker is not None:
+            worker.kill()
+        self._done.set()
+        return True
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        if not self._done.wait(timeout):
+            raise TimeoutError('The task is still running')
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+def _worker_main(connection, memory_limit: Optional[int]) -> None:
+    if memory_limit and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    while True:
+        try:
+            message = connection.recv()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+        fn, args, kwargs = message
+        try:
+            connection.send((True, fn(*args, **kwargs)))
+        except MemoryError:
+            # The heap may be left fragmented or inconsistent: report and let the pool start a new worker
+            connection.send((False, TaskMemoryExceeded('The task exceeded its memory limit')))
+            return
+        except Exception as exc:
+            try:
+                connection.send((False, exc))
+            except Exception:
+                connection.send((False, TaskFailed(f'{type(exc).__name__}: {exc}')))
+
+
+class _Worker:
+    def __init__(self, context, memory_limit: Optional[int]):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_connection, memory_limit), daemon=True)
+        self.process.start()
+        child_connection.close()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+
+    def close(self) -> None:
+        try:
+            self.connection.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(1)
+        self.kill()
+        self.connection.close()
+
+
+class ProcessPool:
+    """
+    Runs CPU-bound tasks in separate worker processes, so a slow task never blocks the thread serving a
+    request for longer than its limits.
+
+    At most `max_workers` tasks run at once and at most `max_queue` wait for a worker: past that, submit()
+    raises PoolSaturated right away. Every task has a wall-clock limit, after which its worker is killed and
+    replaced, and every worker an address-space limit of `memory_limit` bytes. Tasks and their arguments
+    are pickled, so functions must be importable at module level. Workers start on first use.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 8, time_limit: float = 120,
+                 memory_limit: Optional[int] = None, start_method: str = 'forkserver', preload: tuple = ()):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.time_limit = time_limit
+        self.memory_limit = memory_limit
+        self.start_method = start_method
+        # Modules imported once by the fork server, so new workers start with them loaded
+        self.preload = preload
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.rejected = 0
+        self._queue = deque()
+        self._running = 0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._threads = []
+        self._pid = None
+
+    def submit(self, fn: Callable, *args, time_limit: Optional[float] = None, **kwargs) -> Task:
+        self._ensure_started()
+        task = Task(fn, args, kwargs, time_limit or self.time_limit)
+        with self._available:
+            # Idle workers take tasks as soon as they are queued, so only tasks no worker could take, and
+            # that were not cancelled meanwhile, count against the queue
+            self._queue = deque(queued for queued in self._queue if queued._state == 'pending')
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                raise PoolSaturated('Every worker is busy and the queue is full')
+            self._queue.append(task)
+            self._available.notify()
+        return task
+
+    def run(self, fn: Callable, *args, time_limit: Optional[float] = None, queue_timeout: Optional[float] = None,
+            **kwargs) -> Any:
+        """
+        Runs the task and returns its result, raising its exception or a PoolError. A task still waiting
+        for a worker after `queue_timeout` seconds is cancelled and reported as PoolSaturated.
+        """
+        task = self.submit(fn, *args, time_limit=time_limit, **kwargs)
+        if queue_timeout is not None:
+            deadline = time.monotonic() + queue_timeout
+            while not task._done.wait(0.05):
+                if task._state == 'pending' and time.monotonic() > deadline and task.cancel():
+                    raise PoolSaturated('No worker became free in time')
+                if task._state != 'pending':
+                    break
+        return task.result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'running': self._running,
+                'queued': len(self._queue),
+                'completed': self.completed,
+                'failed': self.failed,
+                'timed_out': self.timed_out,
+                'rejected': self.rejected,
+            }
+
+    def _ensure_started(self) -> None:
+        # Workers belong to the process that started them: a forked web worker starts its own
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = deque()
+            self._running = 0
+            context = multiprocessing.get_context(self.start_method)
+            if self.start_method == 'forkserver' and self.preload:
+                context.set_forkserver_preload(list(self.preload))
+            self._threads = [threading.Thread(target=self._dispatch, args=(context,), daemon=True)
+                             for _ in range(self.max_workers)]
+            for thread in self._threads:
+                thread.start()
+
+    def _dispatch(self, context) -> None:
+        """Feeds the queued tasks, one at a time, to a worker process owned by this thread."""
+        worker = None
+        while True:
+            with self._available:
+                while not self._queue:
+                    self._available.wait()
+                task = self._queue.popleft()
+                if task._state != 'pending':
+                    continue
+                self._running += 1
+            if worker is None:
+                worker = _Worker(context, self.memory_limit)
+            if not task._start(worker):
+                with self._lock:
+                    self._running -= 1
+                continue
+
+            try:
+                error, value = self._execute(worker, task)
+            except Exception as exc:
+                logger.exception(f"Could not run the task {task.fn!r}: {exc}")
+                error, value = TaskFailed(f'{type(exc).__name__}: {exc}'), None
+            finally:
+                with self._lock:
+                    self._running -= 1
+            task._finish(value, error)
+
+            # A worker that was killed, ran out of memory or lost track of the protocol is replaced
+            if isinstance(error, PoolError) or not worker.process.is_alive():
+                worker.close()
+                worker = None
+
+    def _execute(self, worker: _Worker, task: Task) -> tuple:
+        """Runs the task on the worker and returns (error, value)."""
+        worker.connection.send((task.fn, task.args, task.kwargs))
+        try:
+            if not worker.connection.poll(task.time_limit):
+                worker.kill()
+                with self._lock:
+                    self.timed_out += 1
+                return TaskTimeout(f'The task did not finish in {task.time_limit:g} seconds'), None
+            ok, value = worker.connection.recv()
+        except (EOFError, OSError):
+            worker.kill()
+            worker.process.join()
+            if task._state == 'cancelled':
+                return TaskCancelled('The task was cancelled'), None
+            with self._lock:
+                self.failed += 1
+            # Most likely killed by the kernel for running out of memory
+            return TaskFailed(f'The worker exited with code {worker.process.exitcode} while running the task'), None
+
+        with self._lock:
+            if ok:
+                self.completed += 1
+                return None, value
+            self.failed += 1
+            return value, None
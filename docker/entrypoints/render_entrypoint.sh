@@ -51,6 +51,9 @@ else
     flask db upgrade
 fi
 
+# Start the job worker in the background, as Render runs a single container
+flask jobs work --concurrency "${JOB_WORKER_CONCURRENCY:-2}" &
+
 # Start the application using Gunicorn, binding it to port 80
 # Set the logging level to info and the timeout to 3600 seconds
 exec gunicorn --bind 0.0.0.0:80 app:app --log-level info --timeout 3600
@@ -0,0 +1,30 @@
+#!/bin/bash
+
+# ---------------------------------------------------------------------------
+# Creative Commons CC BY 4.0 - David Romero - Diverso Lab
+# ---------------------------------------------------------------------------
+# This script is licensed under the Creative Commons Attribution 4.0 
+# International License. You are free to share and adapt the material 
+# as long as appropriate credit is given, a link to the license is provided, 
+# and you indicate if changes were made.
+#
+# For more details, visit:
+# https://creativecommons.org/licenses/by/4.0/
+# ---------------------------------------------------------------------------
+
+# Runs the background jobs (e.g. the analysis of uploaded feature models) queued by the web container
+
+# Exit immediately if a command exits with a non-zero status
+set -e
+
+# Wait for the database to be ready by running a script
+sh ./scripts/wait-for-db.sh
+
+# The web container applies the migrations: wait until the job table is at the latest revision
+until flask db current 2>/dev/null | grep -q "(head)"; do
+    echo "Waiting for the database migrations..."
+    sleep 2
+done
+
+# Start the job workers, which finish their running jobs on SIGTERM
+exec flask jobs work --concurrency "${JOB_WORKER_CONCURRENCY:-2}"
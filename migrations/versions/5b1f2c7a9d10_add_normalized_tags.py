@@ -0,0 +1,88 @@
+"""Add normalized tags
+
+Revision ID: 5b1f2c7a9d10
+Revises: 0e548bd31bb8, 4d29c3fa78bd
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1f2c7a9d10'
+down_revision = ('0e548bd31bb8', '4d29c3fa78bd')
+branch_labels = None
+depends_on = None
+
+
+def split_tags(tags):
+    names = []
+    for tag in (tags or "").split(','):
+        name = tag.strip().lower()[:120]
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def upgrade():
+    op.create_table(
+        'tag',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=120), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_tag_name'), 'tag', ['name'], unique=True)
+    op.create_table(
+        'ds_meta_data_tag',
+        sa.Column('ds_meta_data_id', sa.Integer(), nullable=False),
+        sa.Column('tag_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['ds_meta_data_id'], ['ds_meta_data.id'], ),
+        sa.ForeignKeyConstraint(['tag_id'], ['tag.id'], ),
+        sa.PrimaryKeyConstraint('ds_meta_data_id', 'tag_id')
+    )
+    op.create_index(op.f('ix_ds_meta_data_tag_tag_id'), 'ds_meta_data_tag', ['tag_id'], unique=False)
+    op.create_table(
+        'fm_meta_data_tag',
+        sa.Column('fm_meta_data_id', sa.Integer(), nullable=False),
+        sa.Column('tag_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['fm_meta_data_id'], ['fm_meta_data.id'], ),
+        sa.ForeignKeyConstraint(['tag_id'], ['tag.id'], ),
+        sa.PrimaryKeyConstraint('fm_meta_data_id', 'tag_id')
+    )
+    op.create_index(op.f('ix_fm_meta_data_tag_tag_id'), 'fm_meta_data_tag', ['tag_id'], unique=False)
+
+    # Split the existing comma-separated tags into the new tables
+    connection = op.get_bind()
+    tag_table = sa.Table(
+        'tag', sa.MetaData(),
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String(length=120))
+    )
+    tag_ids = {}
+
+    def tag_id(name):
+        if name not in tag_ids:
+            result = connection.execute(tag_table.insert().values(name=name))
+            tag_ids[name] = result.inserted_primary_key[0]
+        return tag_ids[name]
+
+    for metadata_table, association_table, foreign_key in (
+        ('ds_meta_data', 'ds_meta_data_tag', 'ds_meta_data_id'),
+        ('fm_meta_data', 'fm_meta_data_tag', 'fm_meta_data_id'),
+    ):
+        association = sa.table(association_table, sa.column(foreign_key, sa.Integer), sa.column('tag_id', sa.Integer))
+        rows = connection.execute(sa.text(f'SELECT id, tags FROM {metadata_table} WHERE tags IS NOT NULL')).fetchall()
+        for metadata_id, tags in rows:
+            values = [{foreign_key: metadata_id, 'tag_id': tag_id(name)} for name in split_tags(tags)]
+            if values:
+                connection.execute(association.insert(), values)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_fm_meta_data_tag_tag_id'), table_name='fm_meta_data_tag')
+    op.drop_table('fm_meta_data_tag')
+    op.drop_index(op.f('ix_ds_meta_data_tag_tag_id'), table_name='ds_meta_data_tag')
+    op.drop_table('ds_meta_data_tag')
+    op.drop_index(op.f('ix_tag_name'), table_name='tag')
+    op.drop_table('tag')
@@ -0,0 +1,100 @@
+"""Add author identities
+
+Revision ID: 6c2a3d8e1f47
+Revises: 5b1f2c7a9d10
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+from unidecode import unidecode
+
+
+# revision identifiers, used by Alembic.
+revision = '6c2a3d8e1f47'
+down_revision = '5b1f2c7a9d10'
+branch_labels = None
+depends_on = None
+
+
+def name_tokens(name):
+    return re.sub(r'[^a-z0-9]+', ' ', unidecode(name or "").lower()).split()
+
+
+def normalize_orcid(orcid):
+    orcid = re.sub(r'^https?://orcid\.org/', '', (orcid or "").strip(), flags=re.IGNORECASE)
+    return orcid.upper()[:120] or None
+
+
+def upgrade():
+    op.create_table(
+        'author_identity',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=120), nullable=False),
+        sa.Column('folded_name', sa.String(length=255), nullable=False),
+        sa.Column('orcid', sa.String(length=120), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_author_identity_folded_name'), 'author_identity', ['folded_name'], unique=False)
+    op.create_index(op.f('ix_author_identity_orcid'), 'author_identity', ['orcid'], unique=True)
+    op.create_table(
+        'author_token',
+        sa.Column('identity_id', sa.Integer(), nullable=False),
+        sa.Column('token', sa.String(length=120), nullable=False),
+        sa.ForeignKeyConstraint(['identity_id'], ['author_identity.id'], ),
+        sa.PrimaryKeyConstraint('identity_id', 'token')
+    )
+    op.create_index(op.f('ix_author_token_token'), 'author_token', ['token'], unique=False)
+    with op.batch_alter_table('author', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('identity_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_author_identity_id'), ['identity_id'], unique=False)
+        batch_op.create_foreign_key('fk_author_identity_id', 'author_identity', ['identity_id'], ['id'])
+
+    # Link the existing authors: same ORCID, or same folded name when there is no ORCID
+    connection = op.get_bind()
+    identity_table = sa.Table(
+        'author_identity', sa.MetaData(),
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String(length=120)),
+        sa.Column('folded_name', sa.String(length=255)),
+        sa.Column('orcid', sa.String(length=120))
+    )
+    token_table = sa.table('author_token', sa.column('identity_id', sa.Integer), sa.column('token', sa.String))
+    author_table = sa.table('author', sa.column('id', sa.Integer), sa.column('identity_id', sa.Integer))
+
+    identities = {}
+    identity_tokens = {}
+    for author_id, name, orcid in connection.execute(sa.text('SELECT id, name, orcid FROM author ORDER BY id')):
+        tokens = name_tokens(name)
+        orcid = normalize_orcid(orcid)
+        folded_name = ' '.join(sorted(tokens))[:255]
+        key = ('orcid', orcid) if orcid else ('name', folded_name)
+        if key not in identities:
+            result = connection.execute(
+                identity_table.insert().values(name=name[:120], folded_name=folded_name, orcid=orcid)
+            )
+            identities[key] = result.inserted_primary_key[0]
+            identity_tokens[key] = set()
+        new_tokens = {token[:120] for token in tokens} - identity_tokens[key]
+        if new_tokens:
+            connection.execute(token_table.insert(), [
+                {'identity_id': identities[key], 'token': token} for token in sorted(new_tokens)
+            ])
+            identity_tokens[key] |= new_tokens
+        connection.execute(
+            author_table.update().where(author_table.c.id == author_id).values(identity_id=identities[key])
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('author', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_author_identity_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_author_identity_id'))
+        batch_op.drop_column('identity_id')
+    op.drop_index(op.f('ix_author_token_token'), table_name='author_token')
+    op.drop_table('author_token')
+    op.drop_index(op.f('ix_author_identity_orcid'), table_name='author_identity')
+    op.drop_index(op.f('ix_author_identity_folded_name'), table_name='author_identity')
+    op.drop_table('author_identity')
@@ -0,0 +1,60 @@
+"""Add feature name index
+
+Revision ID: 7d3b4e9f2a58
+Revises: 6c2a3d8e1f47
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3b4e9f2a58'
+down_revision = '6c2a3d8e1f47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The existing files are indexed by `rosemary features:index`, which needs to parse them
+    op.create_table(
+        'feature_name',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_feature_name_name'), 'feature_name', ['name'], unique=True)
+    op.create_table(
+        'hubfile_feature_name',
+        sa.Column('hubfile_id', sa.Integer(), nullable=False),
+        sa.Column('feature_name_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['feature_name_id'], ['feature_name.id'], ),
+        sa.ForeignKeyConstraint(['hubfile_id'], ['file.id'], ),
+        sa.PrimaryKeyConstraint('hubfile_id', 'feature_name_id')
+    )
+    op.create_index(op.f('ix_hubfile_feature_name_feature_name_id'), 'hubfile_feature_name', ['feature_name_id'],
+                    unique=False)
+    op.create_table(
+        'hubfile_constraint_name',
+        sa.Column('hubfile_id', sa.Integer(), nullable=False),
+        sa.Column('feature_name_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['feature_name_id'], ['feature_name.id'], ),
+        sa.ForeignKeyConstraint(['hubfile_id'], ['file.id'], ),
+        sa.PrimaryKeyConstraint('hubfile_id', 'feature_name_id')
+    )
+    op.create_index(op.f('ix_hubfile_constraint_name_feature_name_id'), 'hubfile_constraint_name',
+                    ['feature_name_id'], unique=False)
+    with op.batch_alter_table('file', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('indexed_checksum', sa.String(length=120), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('file', schema=None) as batch_op:
+        batch_op.drop_column('indexed_checksum')
+    op.drop_index(op.f('ix_hubfile_constraint_name_feature_name_id'), table_name='hubfile_constraint_name')
+    op.drop_table('hubfile_constraint_name')
+    op.drop_index(op.f('ix_hubfile_feature_name_feature_name_id'), table_name='hubfile_feature_name')
+    op.drop_table('hubfile_feature_name')
+    op.drop_index(op.f('ix_feature_name_name'), table_name='feature_name')
+    op.drop_table('feature_name')
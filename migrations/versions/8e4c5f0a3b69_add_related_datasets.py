@@ -0,0 +1,49 @@
+"""Add related datasets
+
+Revision ID: 8e4c5f0a3b69
+Revises: 7d3b4e9f2a58
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4c5f0a3b69'
+down_revision = '7d3b4e9f2a58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled by `rosemary related:rebuild`
+    op.create_table(
+        'data_set_vector',
+        sa.Column('data_set_id', sa.Integer(), nullable=False),
+        sa.Column('vector', sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(['data_set_id'], ['data_set.id'], ),
+        sa.PrimaryKeyConstraint('data_set_id')
+    )
+    op.create_table(
+        'tfidf_term',
+        sa.Column('term', sa.String(length=120), nullable=False),
+        sa.Column('document_frequency', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('term')
+    )
+    op.create_table(
+        'data_set_neighbour',
+        sa.Column('data_set_id', sa.Integer(), nullable=False),
+        sa.Column('rank', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('neighbour_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['data_set_id'], ['data_set.id'], ),
+        sa.ForeignKeyConstraint(['neighbour_id'], ['data_set.id'], ),
+        sa.PrimaryKeyConstraint('data_set_id', 'rank')
+    )
+
+
+def downgrade():
+    op.drop_table('data_set_neighbour')
+    op.drop_table('tfidf_term')
+    op.drop_table('data_set_vector')
@@ -0,0 +1,42 @@
+"""Add co-downloads
+
+Revision ID: 9f5d6a1b4c7e
+Revises: 8e4c5f0a3b69
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f5d6a1b4c7e'
+down_revision = '8e4c5f0a3b69'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled by `rosemary codownloads:refresh`
+    op.create_table(
+        'co_download',
+        sa.Column('data_set_id', sa.Integer(), nullable=False),
+        sa.Column('other_id', sa.Integer(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['data_set_id'], ['data_set.id'], ),
+        sa.ForeignKeyConstraint(['other_id'], ['data_set.id'], ),
+        sa.PrimaryKeyConstraint('data_set_id', 'other_id')
+    )
+    op.create_index('ix_co_download_data_set_id_count', 'co_download', ['data_set_id', 'count'], unique=False)
+    op.create_table(
+        'record_cursor',
+        sa.Column('name', sa.String(length=64), nullable=False),
+        sa.Column('last_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('record_cursor')
+    op.drop_index('ix_co_download_data_set_id_count', table_name='co_download')
+    op.drop_table('co_download')
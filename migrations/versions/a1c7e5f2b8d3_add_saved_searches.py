@@ -0,0 +1,63 @@
+"""Add saved searches
+
+Revision ID: a1c7e5f2b8d3
+Revises: 9f5d6a1b4c7e
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c7e5f2b8d3'
+down_revision = '9f5d6a1b4c7e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'saved_search',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=120), nullable=False),
+        sa.Column('query_string', sa.String(length=512), nullable=False),
+        sa.Column('publication_type', sa.String(length=64), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('last_match_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_saved_search_user_id'), 'saved_search', ['user_id'], unique=False)
+    op.create_table(
+        'saved_search_term',
+        sa.Column('saved_search_id', sa.Integer(), nullable=False),
+        sa.Column('field', sa.String(length=32), nullable=False),
+        sa.Column('value', sa.String(length=255), nullable=False),
+        sa.ForeignKeyConstraint(['saved_search_id'], ['saved_search.id'], ),
+        sa.PrimaryKeyConstraint('saved_search_id', 'field', 'value')
+    )
+    op.create_index('ix_saved_search_term_field_value', 'saved_search_term', ['field', 'value'], unique=False)
+    op.create_table(
+        'saved_search_match',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('saved_search_id', sa.Integer(), nullable=False),
+        sa.Column('data_set_id', sa.Integer(), nullable=False),
+        sa.Column('matched_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['data_set_id'], ['data_set.id'], ),
+        sa.ForeignKeyConstraint(['saved_search_id'], ['saved_search.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('saved_search_id', 'data_set_id', name='uq_saved_search_match')
+    )
+    op.create_index('ix_saved_search_match_saved_search_id_id', 'saved_search_match', ['saved_search_id', 'id'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_saved_search_match_saved_search_id_id', table_name='saved_search_match')
+    op.drop_table('saved_search_match')
+    op.drop_index('ix_saved_search_term_field_value', table_name='saved_search_term')
+    op.drop_table('saved_search_term')
+    op.drop_index(op.f('ix_saved_search_user_id'), table_name='saved_search')
+    op.drop_table('saved_search')
@@ -0,0 +1,87 @@
+"""Add feature model metrics
+
+Revision ID: b3d8f1a6c9e4
+Revises: a1c7e5f2b8d3
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d8f1a6c9e4'
+down_revision = 'a1c7e5f2b8d3'
+branch_labels = None
+depends_on = None
+
+FM_METRICS_COLUMNS = ('features', 'leaf_features', 'cross_tree_constraints', 'depth', 'configurations')
+DS_METRICS_COLUMNS = ('number_of_models', 'number_of_features', 'cross_tree_constraints', 'max_depth',
+                      'configurations')
+
+
+def integer_or_none(value):
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        return None
+
+
+def upgrade():
+    # The stored counts are kept as integers. The few that are not numbers become NULL, as the cast would fail,
+    # and the analysis computes them again
+    ds_metrics = sa.table('ds_metrics', sa.column('id', sa.Integer), sa.column('number_of_models', sa.String),
+                          sa.column('number_of_features', sa.String))
+    connection = op.get_bind()
+    rows = connection.execute(sa.select(ds_metrics.c.id, ds_metrics.c.number_of_models,
+                                        ds_metrics.c.number_of_features)).fetchall()
+    for row in rows:
+        values = {column: integer_or_none(getattr(row, column))
+                  for column in ('number_of_models', 'number_of_features') if getattr(row, column) is not None}
+        if any(value is None or str(value) != getattr(row, column) for column, value in values.items()):
+            connection.execute(ds_metrics.update().where(ds_metrics.c.id == row.id).values(**values))
+    with op.batch_alter_table('ds_metrics', schema=None) as batch_op:
+        batch_op.alter_column('number_of_models', existing_type=sa.String(length=120), type_=sa.Integer(),
+                              existing_nullable=True)
+        batch_op.alter_column('number_of_features', existing_type=sa.String(length=120), type_=sa.Integer(),
+                              existing_nullable=True)
+        batch_op.add_column(sa.Column('cross_tree_constraints', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('max_depth', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('configurations', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('analysed_at', sa.DateTime(), nullable=True))
+        for column in DS_METRICS_COLUMNS:
+            batch_op.create_index(batch_op.f(f'ix_ds_metrics_{column}'), [column], unique=False)
+
+    with op.batch_alter_table('fm_metrics', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('checksum', sa.String(length=120), nullable=True))
+        batch_op.add_column(sa.Column('analyzer_version', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('features', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('leaf_features', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('cross_tree_constraints', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('depth', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('configurations', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('analysis_error', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('analysed_at', sa.DateTime(), nullable=True))
+        for column in FM_METRICS_COLUMNS:
+            batch_op.create_index(batch_op.f(f'ix_fm_metrics_{column}'), [column], unique=False)
+        batch_op.create_index('ix_fm_metrics_checksum_analyzer_version', ['checksum', 'analyzer_version'],
+                              unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('fm_metrics', schema=None) as batch_op:
+        batch_op.drop_index('ix_fm_metrics_checksum_analyzer_version')
+        for column in FM_METRICS_COLUMNS:
+            batch_op.drop_index(batch_op.f(f'ix_fm_metrics_{column}'))
+        for column in ('analysed_at', 'analysis_error') + FM_METRICS_COLUMNS + ('analyzer_version', 'checksum'):
+            batch_op.drop_column(column)
+
+    with op.batch_alter_table('ds_metrics', schema=None) as batch_op:
+        for column in DS_METRICS_COLUMNS:
+            batch_op.drop_index(batch_op.f(f'ix_ds_metrics_{column}'))
+        for column in ('analysed_at', 'configurations', 'max_depth', 'cross_tree_constraints'):
+            batch_op.drop_column(column)
+        batch_op.alter_column('number_of_features', existing_type=sa.Integer(), type_=sa.String(length=120),
+                              existing_nullable=True)
+        batch_op.alter_column('number_of_models', existing_type=sa.Integer(), type_=sa.String(length=120),
+                              existing_nullable=True)
@@ -0,0 +1,33 @@
+"""Add data set vector terms
+
+Revision ID: e7a3c6b9d2f5
+Revises: c5e2a9d4f7b1
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a3c6b9d2f5'
+down_revision = 'c5e2a9d4f7b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled by `rosemary related:rebuild`; until then new datasets are only compared with each other
+    op.create_table(
+        'data_set_vector_term',
+        sa.Column('term', sa.String(length=120), nullable=False),
+        sa.Column('data_set_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['data_set_id'], ['data_set.id'], ),
+        sa.PrimaryKeyConstraint('term', 'data_set_id')
+    )
+    op.create_index(op.f('ix_data_set_neighbour_neighbour_id'), 'data_set_neighbour', ['neighbour_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_data_set_neighbour_neighbour_id'), table_name='data_set_neighbour')
+    op.drop_table('data_set_vector_term')
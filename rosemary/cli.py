@@ -19,6 +19,11 @@ from rosemary.commands.info import info, info2
 from rosemary.commands.make_module import make_module
 from rosemary.commands.env import env
 from rosemary.commands.test import test
+from rosemary.commands.features_index import features_index
+from rosemary.commands.related_rebuild import related_rebuild
+from rosemary.commands.codownloads_refresh import codownloads_refresh
+from rosemary.commands.worker import worker
+from rosemary.commands.fm_analyze import fm_analyze
 
 
 class RosemaryCLI(click.Group):
@@ -58,6 +63,11 @@ cli.add_command(locust)
 cli.add_command(stop)
 cli.add_command(selenium)
 cli.add_command(module_list)
+cli.add_command(features_index)
+cli.add_command(related_rebuild)
+cli.add_command(codownloads_refresh)
+cli.add_command(worker)
+cli.add_command(fm_analyze)
 
 
 if __name__ == '__main__':
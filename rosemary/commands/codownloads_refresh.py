@@ -0,0 +1,13 @@
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('codownloads:refresh', help="Updates the co-download recommendations with the new download records.")
+@click.option('--full', is_flag=True, help="Recompute from every download record.")
+@with_appcontext
+def codownloads_refresh(full):
+    from app.modules.dataset.services import CoDownloadService
+
+    click.echo(click.style("Processing download records...", fg='yellow'))
+    count = CoDownloadService().refresh(full=full)
+    click.echo(click.style(f"Processed {count} download records.", fg='green'))
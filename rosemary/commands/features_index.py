@@ -0,0 +1,18 @@
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('features:index', help="Indexes the feature names of the UVL files uploaded before the feature index.")
+@click.option('--reindex', is_flag=True, help="Index every file again, not only the unindexed ones.")
+@click.option('--batch-size', default=100, show_default=True, help="Files indexed per transaction.")
+@with_appcontext
+def features_index(reindex, batch_size):
+    from app.modules.featuremodel.services import FeatureIndexService
+
+    click.echo(click.style("Indexing feature names...", fg='yellow'))
+
+    def on_indexed(hubfile):
+        click.echo(f"  {hubfile.name}: {len(hubfile.feature_names)} features")
+
+    count = FeatureIndexService().backfill(reindex=reindex, batch_size=batch_size, on_indexed=on_indexed)
+    click.echo(click.style(f"Indexed {count} files.", fg='green'))
@@ -0,0 +1,30 @@
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('fm:analyze', help="Computes the metrics of the feature models not analysed by the current analyzer.")
+@click.option('--batch-size', default=100, show_default=True, help="Files analysed per transaction.")
+@click.option('--workers', type=int, help="Analysis processes. Defaults to the flamapy pool size.")
+@with_appcontext
+def fm_analyze(batch_size, workers):
+    from app.modules.featuremodel.services import FeatureModelMetricsService
+    from app.modules.flamapy.analysis import ANALYZER_VERSION
+    from app.modules.flamapy.services import flamapy_pool
+    from core.workers.process_pool import ProcessPool
+
+    pool = flamapy_pool
+    if workers:
+        pool = ProcessPool(max_workers=workers, max_queue=workers, time_limit=flamapy_pool.time_limit,
+                           memory_limit=flamapy_pool.memory_limit, preload=flamapy_pool.preload)
+    service = FeatureModelMetricsService(pool=pool)
+
+    pending = service.count_pending()
+    if not pending:
+        click.echo(click.style(f"Every feature model is analysed by analyzer version {ANALYZER_VERSION}.",
+                               fg='green'))
+        return
+
+    click.echo(click.style(f"Analysing {pending} feature models with {pool.max_workers} workers...", fg='yellow'))
+    with click.progressbar(length=pending, label="Analysing", show_pos=True) as progress:
+        count = service.backfill(batch_size=batch_size, on_batch=progress.update)
+    click.echo(click.style(f"Analysed {count} feature models.", fg='green'))
@@ -0,0 +1,12 @@
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('related:rebuild', help="Recomputes the TF-IDF vectors and the similar datasets of every dataset.")
+@with_appcontext
+def related_rebuild():
+    from app.modules.dataset.services import RelatedDataSetService
+
+    click.echo(click.style("Computing similar datasets...", fg='yellow'))
+    count = RelatedDataSetService().rebuild()
+    click.echo(click.style(f"Similar datasets computed for {count} datasets.", fg='green'))
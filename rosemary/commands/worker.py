@@ -0,0 +1,17 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+@click.command('worker', help="Runs the queued background jobs until interrupted.")
+@click.option('--concurrency', default=2, show_default=True, help="Jobs run at the same time.")
+@click.option('--poll-interval', default=1.0, show_default=True, help="Seconds between checks for new jobs.")
+@click.option('--once', is_flag=True, help="Exit once no job is due instead of waiting for new ones.")
+@with_appcontext
+def worker(concurrency, poll_interval, once):
+    from app.modules.jobs.services import JOB_HANDLERS, run_workers
+
+    click.echo(click.style(f"Running jobs of kinds: {', '.join(sorted(JOB_HANDLERS))}", fg='yellow'))
+    count = run_workers(current_app._get_current_object(), concurrency, poll_interval, once,
+                        on_stop=lambda: click.echo(click.style("Stopping after the running jobs...", fg='yellow')))
+    click.echo(click.style(f"Ran {count} jobs.", fg='green'))